@@ -5,9 +5,35 @@ from nonebot import get_driver
 
 from .config import Config
 
-global_config = get_driver().config
+driver = get_driver()
+global_config = driver.config
 config: Config = Config.parse_obj(global_config)
 
-sub_plugins = nonebot.load_plugins(
-    str(Path(__file__).parent.joinpath("plugins").resolve())
+# 数据在 driver 启动后于后台加载，见 startup.py
+from .startup import startup
+
+# 按模块名加载子插件，不依赖当前工作目录
+sub_plugins = nonebot.load_all_plugins(
+    [
+        f'{__name__}.plugins.{p.name}'
+        for p in sorted(Path(__file__).parent.joinpath('plugins').iterdir())
+        if p.is_dir() and p.joinpath('__init__.py').exists() and not p.name.startswith('_')
+    ],
+    []
 )
+
+
+@driver.on_shutdown
+async def _():
+    from .anise.assets import asset_store
+    from .anise.cache import disk_cache
+    from .anise.files import file_io
+    from .anise.http import http_clients
+    from .utils import playw
+    from .utils.workers import image_pool
+    await playw.del_browser()
+    await http_clients.close()
+    image_pool.shutdown()
+    disk_cache.save()
+    asset_store.save()
+    file_io.shutdown()
@@ -0,0 +1,179 @@
+import asyncio
+import contextlib
+import dataclasses
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+from .config import DATA_PATH, RES_PATH, config
+from .files import file_io
+from .storage import atomic_write_bytes
+
+
+@dataclasses.dataclass
+class AssetMeta:
+    sha256: str
+    size: int
+    fetched_at: float
+    etag: str = ''
+    last_modified: str = ''
+
+
+class AssetStore:
+    """
+    按内容寻址的资源存储，供 ResourceGroupNetworkCacheable 使用
+    内容保存在 RES_PATH/.assets/<sha256 前两位>/<sha256>，资源原来的路径是指向它的硬链接，
+    内容相同的资源只占一份空间；不支持硬链接的文件系统上退回为复制
+    每个资源的哈希、获取时间与 ETag 记录在 DATA_PATH/assets_index.json，
+    修改后只标记，由 autosave 定期写入；不再被任何资源引用的内容由 sweep 清理
+    """
+
+    def __init__(self, root: Path = RES_PATH, index_path: Path = DATA_PATH / 'assets_index.json'):
+        self.root: Path = root
+        self.blob_root: Path = root / '.assets'
+        self.index_path: Path = index_path
+        self.meta: dict[str, AssetMeta] = {}
+        self.deduplicated: int = 0
+        self._lock = threading.Lock()
+        self._loaded: bool = False
+        self._dirty: bool = False
+        self._flights: dict[str, asyncio.Future] = {}
+        self._autosave_task: Optional[asyncio.Task] = None
+
+    def key_of(self, path: Path) -> str:
+        return Path(os.path.relpath(os.path.abspath(path), os.path.abspath(self.root))).as_posix()
+
+    def load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                data = json.loads(self.index_path.read_text('utf-8'))
+                self.meta = {k: AssetMeta(**v) for k, v in data.items()}
+            except (OSError, ValueError, TypeError):
+                self.meta = {}
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {k: dataclasses.asdict(v) for k, v in self.meta.items()}
+            self._dirty = False
+        with contextlib.suppress(OSError):
+            atomic_write_bytes(self.index_path, json.dumps(data, separators=(',', ':')).encode('utf-8'))
+
+    async def autosave(self):
+        while True:
+            await asyncio.sleep(config.cache.index_save_interval)
+            if self._dirty:
+                await file_io.run(self.save)
+
+    def start_autosave(self):
+        if self._autosave_task is None:
+            self._autosave_task = asyncio.create_task(self.autosave())
+
+    def sweep(self, min_age: float = 60 * 60) -> int:
+        """
+        删除资源路径已经不存在的记录，以及没有记录引用的内容，返回删除的内容数
+        刚写入的内容可能还没有登记，不满 min_age 秒的不删除
+        """
+        self.load()
+        with self._lock:
+            for key in [k for k in self.meta if not (self.root / k).exists()]:
+                del self.meta[key]
+                self._dirty = True
+            referenced = {m.sha256 for m in self.meta.values()}
+        removed = 0
+        now = time.time()
+        for blob in self.blob_root.glob('*/*'):
+            if blob.name in referenced:
+                continue
+            with contextlib.suppress(OSError):
+                if now - blob.stat().st_mtime >= min_age:
+                    blob.unlink()
+                    removed += 1
+        self.save()
+        return removed
+
+    def get_meta(self, path: Path) -> Optional[AssetMeta]:
+        self.load()
+        return self.meta.get(self.key_of(path))
+
+    def set_meta(self, path: Path, meta: AssetMeta):
+        self.load()
+        with self._lock:
+            self.meta[self.key_of(path)] = meta
+            self._dirty = True
+
+    def blob_path(self, sha256: str) -> Path:
+        return self.blob_root / sha256[:2] / sha256
+
+    def put(self, path: Path, data: bytes, etag: str = '', last_modified: str = '') -> AssetMeta:
+        """
+        写入内容并把 path 指向它，已有相同内容时只建立链接
+        链接先建在临时文件名上再 os.replace，并发写入同一路径时读取方总能看到完整的文件
+        """
+        sha256 = hashlib.sha256(data).hexdigest()
+        blob = self.blob_path(sha256)
+        if blob.exists():
+            self.deduplicated += 1
+        else:
+            atomic_write_bytes(blob, data)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.parent / f'.{path.name}.{os.urandom(6).hex()}.tmp'
+        try:
+            try:
+                os.link(blob, tmp)
+            except OSError:
+                shutil.copyfile(blob, tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(tmp)
+            raise
+        meta = AssetMeta(sha256, len(data), time.time(), etag, last_modified)
+        self.set_meta(path, meta)
+        return meta
+
+    def adopt(self, path: Path, data: bytes) -> AssetMeta:
+        """登记一个不经过 AssetStore 放入的文件，视为刚刚获取"""
+        meta = AssetMeta(hashlib.sha256(data).hexdigest(), len(data), time.time())
+        self.set_meta(path, meta)
+        return meta
+
+    def touch(self, path: Path):
+        """服务器返回 304 时只更新获取时间"""
+        meta = self.get_meta(path)
+        if meta:
+            with self._lock:
+                meta.fetched_at = time.time()
+                self._dirty = True
+
+    async def single(self, key: str, fn: Callable[[], Awaitable]):
+        """同一资源的并发获取只执行一次"""
+        future = self._flights.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._flights[key] = future
+            future.add_done_callback(lambda _: self._flights.pop(key, None))
+        return await asyncio.shield(future)
+
+    def stats(self) -> dict[str, int]:
+        self.load()
+        blobs = {m.sha256: m.size for m in self.meta.values()}
+        return {
+            'assets': len(self.meta),
+            'blobs': len(blobs),
+            'bytes': sum(blobs.values()),
+            'logical_bytes': sum(m.size for m in self.meta.values()),
+            'deduplicated': self.deduplicated,
+        }
+
+
+asset_store = AssetStore()
@@ -0,0 +1,246 @@
+import asyncio
+import collections
+import contextlib
+import dataclasses
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from .config import CacheConfig, DATA_PATH, RES_PATH, config
+from .files import file_io
+from .storage import atomic_write_bytes
+
+# 对象资源的缓存目录，位于 RES_PATH/<type_id()>/ 下，例如 worldflipper/character/full_shot_0
+CACHE_DIRS = ('full_shot_0', 'full_shot_1', 'pixelart')
+# 没有索引时（首次启动）会扫描这些目录，把已有的缓存文件登记进来
+CACHE_ROOTS = ('query/cache', *(f'**/{x}' for x in CACHE_DIRS))
+# CACHE_ROOTS 或命名空间的规则改变时增加，读取到旧版本的索引时重新扫描并合并
+INDEX_VERSION = 2
+
+
+@dataclasses.dataclass
+class CacheEntry:
+    namespace: str
+    size: int
+    mtime: float  # 写入时间，用于判断是否过期
+    atime: float  # 最后访问时间，用于 LRU 淘汰
+
+
+@dataclasses.dataclass
+class NamespaceUsage:
+    entries: int = 0
+    size: int = 0
+    quota: int = 0
+
+
+class DiskCache:
+    """
+    RES_PATH 下缓存文件的索引，记录每个文件的大小、写入时间与最后访问时间
+    是否存在、是否过期都只查询内存中的索引，不访问文件系统
+    总大小或某个命名空间的大小超出限制时，按最后访问时间淘汰最旧的文件
+    索引定期写入 DATA_PATH，启动时读取并去掉已经不存在的文件
+    load 只在启动阶段调用，之前的查询都视为未命中；事件循环上的方法只操作内存中的索引
+    """
+
+    def __init__(self, cache_config: CacheConfig, root: Path = RES_PATH, index_path: Path = DATA_PATH / 'cache_index.json'):
+        self.config: CacheConfig = cache_config
+        self.root: Path = root
+        self._root: str = os.path.abspath(root)
+        self.index_path: Path = index_path
+        # 按最后访问时间排序，最旧的在前
+        self.entries: collections.OrderedDict[str, CacheEntry] = collections.OrderedDict()
+        self.usage: dict[str, NamespaceUsage] = {}
+        self.evicted: int = 0
+        self._lock = threading.RLock()
+        self._loaded: bool = False
+        self._dirty: bool = False
+        self._autosave_task: Optional[asyncio.Task] = None
+
+    @property
+    def max_size(self) -> int:
+        return self.config.max_size_mb * 1024 * 1024
+
+    def quota_of(self, namespace: str) -> int:
+        return self.config.quotas_mb.get(namespace, 0) * 1024 * 1024
+
+    def key_of(self, path: Path) -> Optional[str]:
+        """RES_PATH 之外的文件不受管理，返回 None"""
+        # abspath 只做字符串处理，不访问文件系统
+        key = Path(os.path.relpath(os.path.abspath(path), self._root)).as_posix()
+        return None if key == '..' or key.startswith('../') else key
+
+    @staticmethod
+    def namespace_of(key: str) -> str:
+        """
+        query/cache/wikicard/... 为 wikicard，
+        worldflipper/character/full_shot_0/... 为 character/full_shot_0
+        """
+        parts = key.split('/')
+        if parts[:2] == ['query', 'cache']:
+            return parts[2] if len(parts) > 3 else 'query'
+        for i, part in enumerate(parts[1:-1], 1):
+            if part in CACHE_DIRS:
+                return f'{parts[i - 1]}/{part}'
+        return '/'.join(parts[:2])
+
+    def load(self):
+        """会扫描目录，只能在线程中调用"""
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                data = json.loads(self.index_path.read_text('utf-8'))
+                rows = [(k, CacheEntry(*v)) for k, v in data['entries']]
+                if data.get('version') != INDEX_VERSION:
+                    indexed = {k for k, _ in rows}
+                    rows += [x for x in self._scan() if x[0] not in indexed]
+                    self._dirty = True
+            except (OSError, ValueError, KeyError, TypeError):
+                rows = self._scan()
+                self._dirty = True
+            for key, entry in rows:
+                if (self.root / key).exists():
+                    entry.namespace = self.namespace_of(key)
+                    self._add(key, entry)
+                else:
+                    self._dirty = True
+            victims = self._evict()
+        self._unlink(victims)
+        self.save()
+
+    def _scan(self) -> list[tuple[str, CacheEntry]]:
+        rows = {}
+        for pattern in CACHE_ROOTS:
+            for directory in self.root.glob(pattern):
+                for path in directory.rglob('*'):
+                    if path.is_file() and not path.name.startswith('.'):
+                        st = path.stat()
+                        key = path.relative_to(self.root).as_posix()
+                        rows[key] = CacheEntry(self.namespace_of(key), st.st_size, st.st_mtime, st.st_atime)
+        return sorted(rows.items(), key=lambda x: x[1].atime)
+
+    def _add(self, key: str, entry: CacheEntry):
+        self._remove(key)
+        self.entries[key] = entry
+        usage = self.usage.setdefault(entry.namespace, NamespaceUsage())
+        usage.entries += 1
+        usage.size += entry.size
+
+    def _remove(self, key: str) -> Optional[CacheEntry]:
+        entry = self.entries.pop(key, None)
+        if entry:
+            usage = self.usage[entry.namespace]
+            usage.entries -= 1
+            usage.size -= entry.size
+        return entry
+
+    @property
+    def size(self) -> int:
+        return sum(x.size for x in self.usage.values())
+
+    def _evict(self, keep: Optional[str] = None) -> list[Path]:
+        """从索引中移除需要淘汰的条目，返回对应的文件，由调用方在释放锁之后删除"""
+        victims = []
+        over = {ns for ns, u in self.usage.items() if 0 < self.quota_of(ns) < u.size}
+        total = self.size
+        if not over and total <= self.max_size:
+            return victims
+        for key in list(self.entries):
+            entry = self.entries[key]
+            if key == keep:
+                continue
+            if total > self.max_size or entry.namespace in over:
+                self._remove(key)
+                total -= entry.size
+                self.evicted += 1
+                self._dirty = True
+                victims.append(self.root / key)
+                if self.usage[entry.namespace].size <= self.quota_of(entry.namespace):
+                    over.discard(entry.namespace)
+            if not over and total <= self.max_size:
+                break
+        return victims
+
+    @staticmethod
+    def _unlink(victims: list[Path]):
+        for path in victims:
+            with contextlib.suppress(FileNotFoundError):
+                path.unlink()
+
+    def lookup(self, path: Path) -> Optional[CacheEntry]:
+        """不更新访问时间，预渲染等后台任务用这个判断"""
+        key = self.key_of(path)
+        return self.entries.get(key) if key else None
+
+    def touch(self, path: Path) -> Optional[CacheEntry]:
+        """读取缓存时调用，更新最后访问时间，索引由 autosave 在文件线程中写入"""
+        key = self.key_of(path)
+        with self._lock:
+            entry = self.entries.get(key) if key else None
+            if entry:
+                entry.atime = time.time()
+                self.entries.move_to_end(key)
+                self._dirty = True
+        return entry
+
+    def is_fresh(self, path: Path, timeout: float) -> bool:
+        """timeout 小于 0 时永不过期"""
+        entry = self.lookup(path)
+        return entry is not None and (timeout < 0 or entry.mtime + timeout >= time.time())
+
+    def put(self, path: Path, data: bytes):
+        """写入缓存文件并登记，随后按需淘汰"""
+        atomic_write_bytes(path, data)
+        self.record(path, len(data))
+
+    def record(self, path: Path, size: int):
+        """登记一个已经写好的文件，淘汰时会删除文件，需要在文件线程中调用"""
+        key = self.key_of(path)
+        if key is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._add(key, CacheEntry(self.namespace_of(key), size, now, now))
+            self._dirty = True
+            victims = self._evict(keep=key)
+        self._unlink(victims)
+
+    def forget(self, path: Path):
+        """文件在索引之外被删除时调用"""
+        key = self.key_of(path)
+        with self._lock:
+            if key and self._remove(key):
+                self._dirty = True
+
+    def stats(self) -> dict[str, NamespaceUsage]:
+        with self._lock:
+            return {
+                ns: NamespaceUsage(u.entries, u.size, self.quota_of(ns))
+                for ns, u in sorted(self.usage.items()) if u.entries
+            }
+
+    async def autosave(self):
+        while True:
+            await asyncio.sleep(self.config.index_save_interval)
+            if self._dirty:
+                await file_io.run(self.save)
+
+    def start_autosave(self):
+        if self._autosave_task is None:
+            self._autosave_task = asyncio.create_task(self.autosave())
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {'version': INDEX_VERSION, 'entries': [[k, dataclasses.astuple(v)] for k, v in self.entries.items()]}
+            self._dirty = False
+        with contextlib.suppress(OSError):
+            atomic_write_bytes(self.index_path, json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+disk_cache = DiskCache(config.cache)
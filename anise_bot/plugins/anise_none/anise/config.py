@@ -13,8 +13,9 @@ DATA_PATH = ROOT_PATH.parent / 'data'
 os.makedirs(DATA_PATH, exist_ok=True)
 CONFIG_PATH = ROOT_PATH.parent / 'config'
 os.makedirs(CONFIG_PATH, exist_ok=True)
-METEORHOUSE_URL = 'https://meteorhouse.wiki'
-CALENDAR_URL = 'https://wf-calendar.miaowm5.com'
+# 可以通过环境变量指向本地的替身服务器，见 benchmark/meteorhouse.py
+METEORHOUSE_URL = os.environ.get('ANISE_METEORHOUSE_URL', 'https://meteorhouse.wiki')
+CALENDAR_URL = os.environ.get('ANISE_CALENDAR_URL', 'https://wf-calendar.miaowm5.com')
 
 MAIN_URL = METEORHOUSE_URL
 
@@ -30,11 +31,91 @@ class QueryConfig(BaseModel):
     update_on_startup = False
     query_prefixes: list = ['qr', '/qr', '查询', '/']
     worldflipper_party_query_prefixes: list = ['pqr', '/pqr', '查盘', '茶盘', '#']
+    warmup_after_update: bool = True
+    warmup_concurrency: int = 1
+    font_path: str = ''  # Pillow 绘制卡片用的字体，需要包含中文，留空则使用 Pillow 自带的字体
+
+
+class PlaywrightConfig(BaseModel):
+    pool_size: int = 2
+    proxy: str = ''
+    launch_options: dict = {}  # 传给 chromium.launch 的其他参数，例如 {"headless": true}
+    page_max_uses: int = 100
+    health_check_timeout: float = 5.0
+
+
+class HttpConfig(BaseModel):
+    timeout: float = 30.0
+    host_timeouts: dict[str, float] = {}
+    max_connections: int = 50
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+    max_concurrent_requests: int = 16  # 所有 Host 合计同时进行的请求数
+
+
+class ImagePoolConfig(BaseModel):
+    kind: str = 'thread'  # thread 或 process，process 的 worker 以 spawn 启动，首次使用时需要重新导入插件
+    workers: int = 2
+    max_queue: int = 32
+
+
+class FileIOConfig(BaseModel):
+    workers: int = 4
+    mmap_threshold_kb: int = 256  # 不小于该大小的文件通过 mmap 读取
+
+
+class CacheConfig(BaseModel):
+    max_size_mb: int = 2048
+    quotas_mb: dict[str, int] = {}  # 例如 {"wikicard": 512, "party_page": 128}，未列出的命名空间只受总大小限制
+    index_save_interval: float = 60.0
+
+
+class AdmissionConfig(BaseModel):
+    enabled: bool = False  # 默认不限流，需要时在配置中开启
+    max_concurrent: int = 8  # 同时处理的查询数
+    max_queue: int = 32  # 超过后直接拒绝
+    queue_timeout: float = 30.0
+    # 每秒恢复的令牌数与令牌上限，rate 为 0 时不限制
+    group_rate: float = 0.5
+    group_burst: float = 6
+    user_rate: float = 0.2
+    user_burst: float = 3
+    max_buckets: int = 4096
+
+
+class ImageTransportConfig(BaseModel):
+    # bytes: 图片以 base64 随消息发送；file: 发送 file:// 路径，需要协议端与 Bot 在同一台机器上；
+    # http: 发送由 Bot 提供的图片链接，需要 fastapi 等支持 HTTP 服务端的驱动
+    # 仅对 OneBot V11 生效，只存在于内存中的图片总是以 base64 发送
+    mode: str = 'bytes'
+    base_url: str = ''  # 协议端访问 Bot 的地址，例如 http://127.0.0.1:8080
+    path: str = '/anise/images'
+    secret: str = ''  # 图片链接的签名密钥，留空时每次启动随机生成
+    spool_ttl: float = 600.0  # 发送出去的图片在 RES_PATH/.transport 中保留的秒数
+
+
+class AnimationConfig(BaseModel):
+    # 像素图等动图默认原样发送，超过 max_size_kb 时转码，0 为不限制
+    max_size_kb: int = 0
+    format: str = 'gif'  # 转码后的格式，gif 或 webp
+    min_scale: float = 0.5
+    max_frame_step: int = 2  # 最多每几帧保留一帧
 
 
 class Config(BaseModel):
     query: QueryConfig = QueryConfig.parse_obj({})
+    playwright: PlaywrightConfig = PlaywrightConfig.parse_obj({})
+    http: HttpConfig = HttpConfig.parse_obj({})
+    image_pool: ImagePoolConfig = ImagePoolConfig.parse_obj({})
+    cache: CacheConfig = CacheConfig.parse_obj({})
+    file_io: FileIOConfig = FileIOConfig.parse_obj({})
+    admission: AdmissionConfig = AdmissionConfig.parse_obj({})
+    image_transport: ImageTransportConfig = ImageTransportConfig.parse_obj({})
+    animation: AnimationConfig = AnimationConfig.parse_obj({})
     sync_uri: str = ''
+    sync_timeout: float = 3.0
+    metrics_path: str = ''  # 例如 /metrics，留空则不提供
 
 
 _config_path = CONFIG_PATH / 'config.toml'
@@ -0,0 +1,76 @@
+import asyncio
+import concurrent.futures
+import mmap
+import os
+from pathlib import Path
+from typing import Any, Callable, Optional, TypeVar
+
+from .config import FileIOConfig, config
+from .storage import atomic_write_bytes
+
+T = TypeVar('T')
+
+
+def read_file(path: Path, mmap_threshold: int) -> bytes:
+    """较大的文件（立绘、多帧 GIF）通过 mmap 一次性拷贝出来，避免分块读取与缓冲区的反复扩容"""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < mmap_threshold or size == 0:
+            return f.read()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return mm[:]
+
+
+class AsyncFileIO:
+    """
+    资源与缓存文件的读写都交给固定数量的线程执行，磁盘慢时只占用这些线程，不会卡住事件循环
+    """
+
+    def __init__(self, file_io_config: FileIOConfig):
+        self.workers: int = max(1, file_io_config.workers)
+        self.mmap_threshold: int = file_io_config.mmap_threshold_kb * 1024
+        self.running: int = 0
+        self.waiting: int = 0
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+    def _get_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix='anise-file')
+        return self._executor
+
+    def _track(self, fn: Callable[..., T], *args: Any) -> T:
+        self.waiting -= 1
+        self.running += 1
+        try:
+            return fn(*args)
+        finally:
+            self.running -= 1
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """在文件线程中执行任意的阻塞调用"""
+        self.waiting += 1
+        return await asyncio.get_running_loop().run_in_executor(self._get_executor(), self._track, fn, *args)
+
+    async def read_bytes(self, path: Path) -> bytes:
+        return await self.run(read_file, path, self.mmap_threshold)
+
+    async def read_bytes_or_none(self, path: Path) -> Optional[bytes]:
+        """文件不存在时返回 None，不需要先 exists() 再读取"""
+        try:
+            return await self.read_bytes(path)
+        except FileNotFoundError:
+            return None
+
+    async def write_bytes(self, path: Path, data: bytes):
+        await self.run(atomic_write_bytes, path, data)
+
+    def stats(self) -> dict[str, int]:
+        return {'workers': self.workers, 'running': self.running, 'waiting': self.waiting}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+file_io = AsyncFileIO(config.file_io)
@@ -0,0 +1,75 @@
+import asyncio
+import urllib.parse
+import warnings
+from typing import Optional
+
+import httpx
+
+from .config import HttpConfig, config
+
+
+class HttpClientRegistry:
+    """
+    进程内共享的 httpx.AsyncClient
+    按 scheme + host 各保持一个带连接池的 Client，避免每次请求都重新握手
+    """
+
+    def __init__(self, http_config: HttpConfig):
+        self.config: HttpConfig = http_config
+        self.clients: dict[str, httpx.AsyncClient] = {}
+        self.in_flight: int = 0
+        self.waiting: int = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _http2_enabled(self) -> bool:
+        if not self.config.http2:
+            return False
+        try:
+            import h2  # noqa: F401
+        except ModuleNotFoundError:
+            warnings.warn('http2 is enabled but package "h2" is not installed, fallback to HTTP/1.1')
+            self.config.http2 = False
+            return False
+        return True
+
+    def get(self, url: str) -> httpx.AsyncClient:
+        parsed = urllib.parse.urlsplit(url)
+        key = f'{parsed.scheme}://{parsed.netloc}'
+        client = self.clients.get(key)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=self.config.host_timeouts.get(parsed.hostname or '', self.config.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.config.max_connections,
+                    max_keepalive_connections=self.config.max_keepalive_connections,
+                    keepalive_expiry=self.config.keepalive_expiry,
+                ),
+                http2=self._http2_enabled(),
+            )
+            self.clients[key] = client
+        return client
+
+    async def request(self, method: str, url: str, timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(max(1, self.config.max_concurrent_requests))
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            return await self.get(url).request(method, url, **kwargs)
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def close(self):
+        clients, self.clients = self.clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+http_clients = HttpClientRegistry(config.http)
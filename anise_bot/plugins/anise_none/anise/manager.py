@@ -35,5 +35,9 @@ class ManagerBase:
         assert issubclass(type_, GameObject)
         return self.objects.get(type_.type_id())
 
+    def swap(self, other: "ManagerBase"):
+        """用另一个已经加载完成的 Manager 的数据整体替换当前数据"""
+        self.objects = other.objects
+
 
 manager = ManagerBase()
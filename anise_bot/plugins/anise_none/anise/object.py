@@ -1,11 +1,18 @@
 import abc
-from typing import Any, Optional
+import enum
+import json
+from typing import Any, ClassVar, Optional
 
 from PIL import Image
 from pydantic import BaseModel
 
 
 class GameObject(BaseModel):
+    # 由快照加载的对象在 _cold 中保存冷数据的位置，第一次访问冷字段时才解码
+    __slots__ = ('_cold',)
+    # 快照中直接保存的字段，其余字段视为冷字段
+    hot_fields: ClassVar[tuple[str, ...]] = ('resource_id',)
+
     resource_id: str = ''
 
     def __init__(self, resource_id: str = None, **data: Any):
@@ -13,6 +20,60 @@ class GameObject(BaseModel):
             data['resource_id'] = resource_id
         super().__init__(**data)
 
+    @classmethod
+    def from_snapshot(cls, hot: dict, buf, offset: int, length: int):
+        values = {}
+        for name, raw in hot.items():
+            field = cls.__fields__[name]
+            # 快照由已经校验过的对象生成，简单类型直接使用
+            if field.outer_type_ in (str, int, float, bool) and type(raw) is field.outer_type_:
+                values[name] = raw
+            elif isinstance(field.outer_type_, type) and issubclass(field.outer_type_, enum.Enum):
+                values[name] = field.outer_type_(raw)
+            else:
+                value, errors = field.validate(raw, values, loc=name, cls=cls)
+                if errors:
+                    raise ValueError(f'快照中 {cls.__name__}.{name} 的值无效: {raw!r}')
+                values[name] = value
+        obj = cls.construct(**values)
+        # construct 会为冷字段填入默认值，去掉后第一次访问才会经过 __getattr__ 读取快照
+        for name in cls.__fields__:
+            if name not in values:
+                obj.__dict__.pop(name, None)
+        object.__setattr__(obj, '_cold', (buf, offset, length))
+        return obj
+
+    def load_cold(self):
+        try:
+            cold = object.__getattribute__(self, '_cold')
+        except AttributeError:
+            return
+        if cold is None:
+            return
+        buf, offset, length = cold
+        values = json.loads(buf[offset:offset + length])
+        for name, raw in values.items():
+            value, errors = self.__fields__[name].validate(raw, self.__dict__, loc=name, cls=type(self))
+            if errors:
+                raise ValueError(f'快照中 {type(self).__name__}.{name} 的值无效: {raw!r}')
+            self.__dict__[name] = value
+            self.__fields_set__.add(name)
+        # 保持与直接解析时相同的字段顺序
+        object.__setattr__(self, '__dict__', {k: self.__dict__[k] for k in self.__fields__ if k in self.__dict__})
+        object.__setattr__(self, '_cold', None)
+
+    def __getattr__(self, name: str):
+        if name in type(self).__fields__ and name not in self.__dict__:
+            self.load_cold()
+            if name in self.__dict__:
+                return self.__dict__[name]
+        raise AttributeError(f'{type(self).__name__!r} object has no attribute {name!r}')
+
+    def _iter(self, *args, **kwargs):
+        # dict() / json() / copy() 之前先补全冷字段
+        self.load_cold()
+        return super()._iter(*args, **kwargs)
+
     @classmethod
     @abc.abstractmethod
     def type_id(cls) -> str:
@@ -5,8 +5,8 @@ from typing import Optional, Callable
 import toml
 from pygtrie import CharTrie, Trie
 from pypinyin import lazy_pinyin
-from fuzzywuzzy import process
 
+from .fuzzy import FuzzyIndex
 from ..manager import manager
 from ...models.worldflipper import Character, Equipment
 from ..config import RES_PATH
@@ -16,6 +16,7 @@ from ..object import GameObject
 class AliasManager:
     def __init__(self):
         self.alias2obj: CharTrie[str, GameObject] = CharTrie()
+        self._fuzzy: Optional[FuzzyIndex] = None
         # self.pyalias2obj: Trie[str, GameObject] = Trie(separator='-')
 
     def init_from_json(self, path: Path, obj_getter: Callable[[str], GameObject]):
@@ -34,6 +35,15 @@ class AliasManager:
                 self.add(n, obj_getter(id_))
 
     def init(self):
+        loaded = AliasManager()
+        loaded.load()
+        self.swap(loaded)
+
+    def swap(self, other: "AliasManager"):
+        """用另一个已经加载完成的 AliasManager 整体替换当前的别名表与索引"""
+        self.alias2obj, self._fuzzy = other.alias2obj, other.fuzzy_index()
+
+    def load(self):
         self.init_from_json(RES_PATH / 'worldflipper/alias' / 'character.json', lambda x: manager.get(Character, x))
         self.init_from_json(RES_PATH / 'worldflipper/alias' / 'equipment.json', lambda x: manager.get(Equipment, x))
         for t in [Character, Equipment]:
@@ -44,34 +54,48 @@ class AliasManager:
                     if not name:
                         continue
                     self.add(name, obj)
+        self.fuzzy_index()
+
+    def fuzzy_index(self) -> FuzzyIndex:
+        if self._fuzzy is None:
+            self._fuzzy = FuzzyIndex(self.alias2obj.keys())
+        return self._fuzzy
 
     def get_obj(self, s: str) -> Optional[GameObject]:
         return self.alias2obj.get(s)
 
     def add(self, alias: str, obj: GameObject):
         self.alias2obj[alias] = obj
+        self._fuzzy = None
         # self.pyalias2obj['-'.join(lazy_pinyin(alias))] = obj
 
     def clear(self):
         self.alias2obj.clear()
+        self._fuzzy = None
         # self.pyalias2obj.clear()
 
     def guess(self, s: str) -> Optional[GameObject]:
-        name, score = process.extractOne(s, self.alias2obj.keys())
-        print(name, score)
+        name, score = self.fuzzy_index().extract_one(s)
         if score >= 60:
             return self.alias2obj[name]
         return None
-        # if s in self.alias2obj:
-        #     return self.get_obj(s)
-        # else:
-        #     for i in reversed(range(len(s))):
-        #         self.alias2obj.items(prefix='')
 
+    def guess_top(self, s: str, limit: int = 3, score_cutoff: int = 60) -> list[tuple[str, GameObject, int]]:
+        """按相似度返回至多 limit 个不同对象，以及命中的别名与分数"""
+        result = []
+        seen = set()
+        for name, score in self.fuzzy_index().extract(s, limit=limit * 4):
+            if score < score_cutoff or len(result) >= limit:
+                break
+            obj = self.alias2obj[name]
+            if obj is None or id(obj) in seen:
+                continue
+            seen.add(id(obj))
+            result.append((name, obj, score))
+        return result
 
-alias_manager = AliasManager()
 
-alias_manager.init()
+alias_manager = AliasManager()
 
 if __name__ == '__main__':
     print('aa')
@@ -0,0 +1,116 @@
+import re
+from typing import Any, Callable, Iterator, Optional
+
+# 含有这些结构的正则依赖分组编号或组名，合并后会改变含义，保持单独匹配
+_UNCOMBINABLE = re.compile(r'\\[1-9]|\(\?P[<=]|\(\?\(|\(\?[aiLmsux-]+\)')
+_LITERAL_ALTERNATION = re.compile(r'\^\((?:\?:)?([^()]*)\)\$')
+
+
+def _exact_keys(pattern: str) -> Optional[list[str]]:
+    """形如 ^abc$ 或 ^(abc|def)$ 的正则，返回其可以精确匹配的全部文本"""
+    if m := _LITERAL_ALTERNATION.fullmatch(pattern):
+        parts = m.group(1).split('|')
+    elif pattern.startswith('^') and pattern.endswith('$') and not pattern.endswith('\\$'):
+        parts = [pattern[1:-1]]
+    else:
+        return None
+    if all(re.escape(p) == p for p in parts):
+        return parts
+    return None
+
+
+class QueryDispatchIndex:
+    """
+    QueryManager 的分派索引
+    纯正则的 Handler 被编译为精确匹配表与一个合并正则，一次匹配即可得到最先声明的命中项，
+    其余 Handler 仍然按声明顺序调用 check()，整体保持先声明者优先的语义
+    """
+
+    def __init__(self, handlers: list, regex_of: Callable[[Any], Optional[str]]):
+        """
+        :param handlers: 按优先级排列的 Handler
+        :param regex_of: 返回 Handler 的正则，返回 None 表示该 Handler 需要调用 check()
+        """
+        self.handlers: list = handlers
+        self.patterns: list[Optional[re.Pattern]] = []
+        self.dynamic: set[int] = set()
+        self.always: Optional[int] = None
+        self.exact: dict[str, int] = {}
+        self.separate: list[int] = []
+        self.combined: Optional[re.Pattern] = None
+        self._group_index: dict[str, int] = {}
+
+        branches = []
+        for i, handler in enumerate(handlers):
+            regex = regex_of(handler)
+            if regex is None:
+                self.dynamic.add(i)
+                self.patterns.append(None)
+                continue
+            try:
+                self.patterns.append(re.compile(regex) if regex else None)
+            except re.error:
+                # 与原本逐个 re.search 的行为保持一致，在匹配时再抛出
+                self.patterns.append(None)
+                self.dynamic.add(i)
+                continue
+            if not regex:
+                if self.always is None:
+                    self.always = i
+            elif (keys := _exact_keys(regex)) is not None:
+                for k in keys:
+                    self.exact.setdefault(k, i)
+            elif _UNCOMBINABLE.search(regex):
+                self.separate.append(i)
+            else:
+                group = f'_q{i}'
+                # 每个分支都是从开头扫描的 lookahead，match() 只在位置 0 尝试，
+                # 因此第一个成功的分支就是声明顺序最靠前的命中项
+                branches.append(f'(?=[\\s\\S]*?(?:{regex})(?P<{group}>))')
+                self._group_index[group] = i
+        if branches:
+            try:
+                self.combined = re.compile('|'.join(branches))
+            except re.error:
+                self.separate.extend(self._group_index.values())
+                self.separate.sort()
+                self._group_index.clear()
+        self._dynamic_order: list[int] = sorted(self.dynamic)
+
+    def first_static(self, text: str) -> Optional[int]:
+        """声明顺序最靠前的、可以仅凭正则确定命中的 Handler 下标"""
+        candidates = []
+        if self.always is not None:
+            candidates.append(self.always)
+        if (i := self.exact.get(text)) is not None:
+            candidates.append(i)
+        if self.combined and (m := self.combined.match(text)):
+            candidates.append(self._group_index[m.lastgroup])
+        best = min(candidates, default=None)
+        for i in self.separate:
+            if best is not None and i > best:
+                break
+            if self.patterns[i].search(text):
+                best = i
+                break
+        return best
+
+    def candidates(self, text: str) -> Iterator[tuple[Any, bool]]:
+        """
+        按声明顺序产出可能命中的 Handler
+        第二项为 True 表示正则已经命中，为 False 表示仍需调用 check()
+        命中的 Handler 没有生成消息时，继续逐个检查之后的 Handler
+        """
+        first = self.first_static(text)
+        for i in self._dynamic_order:
+            if first is not None and i > first:
+                break
+            yield self.handlers[i], False
+        if first is None:
+            return
+        yield self.handlers[first], True
+        for i in range(first + 1, len(self.handlers)):
+            if i in self.dynamic:
+                yield self.handlers[i], False
+            elif self.patterns[i] is None or self.patterns[i].search(text):
+                yield self.handlers[i], True
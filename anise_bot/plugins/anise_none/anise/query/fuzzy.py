@@ -0,0 +1,53 @@
+import heapq
+from collections import defaultdict
+from typing import Iterable
+
+from fuzzywuzzy import process, utils
+
+
+def _grams(s: str) -> set[str]:
+    """单字与双字 gram，中文别名大多很短，单字也需要参与召回"""
+    grams = set(s)
+    grams.update(s[i:i + 2] for i in range(len(s) - 1))
+    grams.discard(' ')
+    return grams
+
+
+class FuzzyIndex:
+    """
+    别名的模糊匹配索引
+    以 n-gram 倒排表召回与查询共享 gram 最多的少量候选，只对候选用 fuzzywuzzy 打分，
+    打分方式与 process.extractOne 对全部别名打分时一致
+    """
+
+    def __init__(self, keys: Iterable[str], max_candidates: int = 48):
+        self.keys: list[str] = list(keys)
+        self.max_candidates: int = max_candidates
+        self.postings: dict[str, list[int]] = defaultdict(list)
+        for i, key in enumerate(self.keys):
+            for gram in _grams(utils.full_process(key)):
+                self.postings[gram].append(i)
+
+    def candidates(self, s: str) -> list[str]:
+        query = utils.full_process(s)
+        overlap: dict[int, int] = defaultdict(int)
+        for gram in _grams(query):
+            # 双字 gram 的区分度更高
+            weight = len(gram)
+            for i in self.postings.get(gram, ()):
+                overlap[i] += weight
+        best = heapq.nlargest(self.max_candidates, overlap.items(), key=lambda x: x[1])
+        # 保持原本的顺序，使同分时的结果与全量扫描一致
+        return [self.keys[i] for i in sorted(i for i, _ in best)]
+
+    def extract(self, s: str, limit: int = 5) -> list[tuple[str, int]]:
+        candidates = self.candidates(s)
+        if not candidates:
+            return []
+        return process.extract(s, candidates, limit=limit)
+
+    def extract_one(self, s: str) -> tuple[str, int]:
+        candidates = self.candidates(s)
+        if not candidates:
+            return '', 0
+        return process.extractOne(s, candidates)
@@ -2,13 +2,17 @@ import abc
 import asyncio
 import io
 import json
+import time
 from pathlib import Path
-from typing import Any, Callable, IO
+from typing import Any, Callable, IO, Optional
 
 import httpx
 from PIL import Image
 
+from .assets import asset_store
 from .config import RES_PATH, MAIN_URL
+from .files import file_io
+from .http import http_clients
 from .object import GameObject
 
 
@@ -61,11 +65,8 @@ class ResourceGroupLocal(ResourceGroup):
 
     async def get(self, obj: GameObject) -> Any:
         path = RES_PATH / obj.type_id() / self.id / f'{obj.resource_id}.{self.suffix}'
-        # os.makedirs(path.parent, exist_ok=True)
-        if path.exists():
-            return await self.type.read(path.read_bytes())
-        else:
-            return None
+        data = await file_io.read_bytes_or_none(path)
+        return await self.type.read(data) if data is not None else None
 
 
 class ResourceGroupNetwork(ResourceGroup):
@@ -73,25 +74,78 @@ class ResourceGroupNetwork(ResourceGroup):
         super().__init__(id_, type_)
         self.url_getter = url_getter
 
-    async def get(self, obj: GameObject, timeout: float = 30.0) -> Any:
+    async def fetch(self, obj: GameObject, timeout: Optional[float] = None, headers: Optional[dict] = None) -> Optional[httpx.Response]:
         url = self.url_getter(self.id, obj)
         if not url:
             return None
-        async with httpx.AsyncClient() as client:
-            r = await client.get(url, timeout=timeout)
+        return await http_clients.request('GET', url, timeout=timeout, headers=headers)
+
+    async def get(self, obj: GameObject, timeout: Optional[float] = None) -> Any:
+        r = await self.fetch(obj, timeout)
+        if r is None:
+            return None
         return await self.type.read(r.content)
 
 
 class ResourceGroupNetworkCacheable(ResourceGroupNetwork):
-    def __init__(self, id_: str, type_: type[ResourceType], suffix: str, url_getter: Callable[[str, GameObject], str]):
+    """
+    先读本地，本地没有或超过 max_age 时经由网络获取，写入 asset_store
+    过期后带 ETag / Last-Modified 重新验证，服务器返回 304 时只更新获取时间；
+    网络失败时仍返回本地已有的旧文件
+    """
+
+    def __init__(
+            self, id_: str, type_: type[ResourceType], suffix: str, url_getter: Callable[[str, GameObject], str],
+            max_age: float = 60 * 60 * 24 * 7
+    ):
         super().__init__(id_, type_, url_getter)
         self.suffix = suffix
-
-    async def get(self, obj: GameObject, timeout: float = 30.0) -> Any:
-        path = RES_PATH / obj.type_id() / self.id / f'{obj.resource_id}.{self.suffix}'
-        # if not path.exists():
-        #     a = await super().get(obj)
-        #     io.BytesIO(bytes(a))
+        self.max_age: float = max_age
+
+    def path_of(self, obj: GameObject) -> Path:
+        return RES_PATH / obj.type_id() / self.id / f'{obj.resource_id}.{self.suffix}'
+
+    async def get(self, obj: GameObject, timeout: Optional[float] = None) -> Any:
+        data = await self.get_bytes(obj, timeout)
+        return await self.type.read(data) if data is not None else None
+
+    async def get_bytes(self, obj: GameObject, timeout: Optional[float] = None) -> Optional[bytes]:
+        path = self.path_of(obj)
+        meta = asset_store.get_meta(path)
+        if meta and time.time() - meta.fetched_at < self.max_age:
+            data = await file_io.read_bytes_or_none(path)
+            if data is not None:
+                return data
+        return await asset_store.single(asset_store.key_of(path), lambda: self._refresh(obj, path, timeout))
+
+    async def _refresh(self, obj: GameObject, path: Path, timeout: Optional[float]) -> Optional[bytes]:
+        local = await file_io.read_bytes_or_none(path)
+        meta = asset_store.get_meta(path)
+        if local is not None and meta is None:
+            # 手动放入的文件直接登记，不再下载
+            asset_store.adopt(path, local)
+            return local
+        headers = {}
+        if local is not None and meta:
+            if meta.etag:
+                headers['If-None-Match'] = meta.etag
+            if meta.last_modified:
+                headers['If-Modified-Since'] = meta.last_modified
+        try:
+            r = await self.fetch(obj, timeout, headers)
+        except (httpx.HTTPError, TimeoutError):
+            return local
+        if r is None:
+            return local
+        if r.status_code == 304 and local is not None:
+            asset_store.touch(path)
+            return local
+        if r.status_code // 100 != 2:
+            return local
+        await file_io.run(
+            asset_store.put, path, r.content, r.headers.get('etag', ''), r.headers.get('last-modified', '')
+        )
+        return r.content
 
 
 if __name__ == '__main__':
@@ -0,0 +1,83 @@
+import json
+import mmap
+import struct
+from pathlib import Path
+from typing import Optional
+
+from .object import GameObject
+from .storage import atomic_write_bytes
+
+MAGIC = b'ANISNAP1'
+_HEADER_LEN = struct.Struct('<I')
+
+
+def source_stats(sources: dict[type[GameObject], Path]) -> dict[str, list[int]]:
+    """快照是否过期只看来源文件的大小与修改时间，不需要读取文件内容"""
+    stats = {}
+    for type_, path in sources.items():
+        st = path.stat()
+        stats[type_.type_id()] = [st.st_size, st.st_mtime_ns]
+    return stats
+
+
+def write_snapshot(
+        path: Path,
+        objects: dict[type[GameObject], dict[str, GameObject]],
+        stats: dict[str, list[int]]
+):
+    """
+    文件结构: MAGIC | header 长度 (u32) | header (JSON) | 冷数据
+    header 中每个对象一行: [热字段的值..., 冷数据偏移, 冷数据长度]
+    """
+    header = {'sources': stats, 'types': {}}
+    blob = bytearray()
+    for type_, objs in objects.items():
+        hot = list(type_.hot_fields)
+        cold = set(type_.__fields__) - set(hot)
+        rows = []
+        for obj in objs.values():
+            row = json.loads(obj.json(include=set(hot)))
+            data = obj.json(include=cold, ensure_ascii=False).encode('utf-8')
+            rows.append([row.get(k) for k in hot] + [len(blob), len(data)])
+            blob += data
+        header['types'][type_.type_id()] = {'fields': hot, 'rows': rows}
+    header_data = json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    atomic_write_bytes(path, MAGIC + _HEADER_LEN.pack(len(header_data)) + header_data + bytes(blob))
+
+
+def load_snapshot(
+        path: Path,
+        types: list[type[GameObject]],
+        stats: dict[str, list[int]]
+) -> Optional[dict[type[GameObject], dict[str, GameObject]]]:
+    """快照不存在、损坏或与来源文件不一致时返回 None"""
+    if not path.exists():
+        return None
+    with path.open('rb') as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None
+    try:
+        if buf[:len(MAGIC)] != MAGIC:
+            return None
+        start = len(MAGIC) + _HEADER_LEN.size
+        (header_len,) = _HEADER_LEN.unpack_from(buf, len(MAGIC))
+        header: dict = json.loads(buf[start:start + header_len])
+        if header.get('sources') != stats:
+            return None
+        base = start + header_len
+        result = {}
+        for type_ in types:
+            table = header['types'][type_.type_id()]
+            if table['fields'] != list(type_.hot_fields):
+                return None
+            fields = table['fields']
+            objs = {}
+            for row in table['rows']:
+                obj = type_.from_snapshot(dict(zip(fields, row)), buf, base + row[-2], row[-1])
+                objs[obj.id] = obj
+            result[type_] = objs
+        return result
+    except (KeyError, ValueError, IndexError, struct.error):
+        return None
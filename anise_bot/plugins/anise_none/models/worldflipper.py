@@ -2,23 +2,33 @@ import json
 import urllib.parse
 from enum import Enum
 from pathlib import Path
-from typing import Optional
+from typing import ClassVar, Optional
 
+from nonebot import logger
 from pydantic import BaseModel
 
 from ..anise.config import MAIN_URL, DATA_PATH
-from ..anise.manager import manager
+from ..anise.manager import ManagerBase, manager
 from ..anise.object import GameObject
-from ..anise.resource import ResourceTypeImage, ResourceGroupNetwork, ResourceGroupLocal
+from ..anise.resource import ResourceTypeImage, ResourceGroupNetwork, ResourceGroupLocal, ResourceGroupNetworkCacheable
+from ..anise.snapshot import load_snapshot, source_stats, write_snapshot
 
 
 def _url_getter_worldflipper(suffix: str):
     def temp(id_: str, obj: GameObject):
-        url = urllib.parse.urljoin(
+        return urllib.parse.urljoin(
             MAIN_URL, f"/static/{obj.type_id()}/{id_}/{obj.resource_id}.{suffix}"
         )
-        print(url)
-        return url
+
+    return temp
+
+
+def _url_getter_worldflipper_unit(suffix: str):
+    """角色的立绘与头像在服务器上位于 /static/worldflipper/unit/ 下，与 query 中的立绘查询一致"""
+    def temp(id_: str, obj: GameObject):
+        return urllib.parse.urljoin(
+            MAIN_URL, f"/static/worldflipper/unit/{id_}/{obj.resource_id}.{suffix}"
+        )
 
     return temp
 
@@ -74,17 +84,20 @@ class Character(GameObject):
         square212x_0__ = ResourceGroupNetwork(
             "square212x/base", ResourceTypeImage, _url_getter_worldflipper("png")
         )
-        square212x_0 = ResourceGroupLocal("square212x/base", ResourceTypeImage, "png")
-        square212x_1 = ResourceGroupLocal(
-            "square212x/awakened", ResourceTypeImage, "png"
+        # 以下四组先读本地，缺少或过期时从服务器获取，见 ResourceGroupNetworkCacheable
+        square212x_0 = ResourceGroupNetworkCacheable(
+            "square212x/base", ResourceTypeImage, "png", _url_getter_worldflipper_unit("png")
+        )
+        square212x_1 = ResourceGroupNetworkCacheable(
+            "square212x/awakened", ResourceTypeImage, "png", _url_getter_worldflipper_unit("png")
         )
         full_0 = ResourceGroupLocal("full/base", ResourceTypeImage, "png")
         full_1 = ResourceGroupLocal("full/awakened", ResourceTypeImage, "png")
-        full_resized_0 = ResourceGroupLocal(
-            "full_resized/base", ResourceTypeImage, "png"
+        full_resized_0 = ResourceGroupNetworkCacheable(
+            "full_resized/base", ResourceTypeImage, "png", _url_getter_worldflipper_unit("png")
         )
-        full_resized_1 = ResourceGroupLocal(
-            "full_resized/awakened", ResourceTypeImage, "png"
+        full_resized_1 = ResourceGroupNetworkCacheable(
+            "full_resized/awakened", ResourceTypeImage, "png", _url_getter_worldflipper_unit("png")
         )
         party_main = ResourceGroupLocal("party_main", ResourceTypeImage, "png")
         party_unison = ResourceGroupLocal("party_unison", ResourceTypeImage, "png")
@@ -95,6 +108,8 @@ class Character(GameObject):
             "pixelart/walk_front", ResourceTypeImage, "gif"
         )
 
+    hot_fields: ClassVar[tuple[str, ...]] = ('id', 'resource_id', 'names', 'rarity', 'element', 'type')
+
     id: str
     names: list[str]
     rarity: int
@@ -127,6 +142,8 @@ class Equipment(GameObject):
     class Res:
         pass
 
+    hot_fields: ClassVar[tuple[str, ...]] = ('id', 'resource_id', 'names', 'rarity', 'element')
+
     id: str
     names: list[str]
     rarity: int
@@ -142,21 +159,36 @@ class Equipment(GameObject):
     server: Optional[str] = None
 
 
-def load_from_json(path: Path, type_: type[GameObject]):
-    manager.register_type(type_)
+def load_from_json(path: Path, type_: type[GameObject], target: ManagerBase = manager):
+    target.register_type(type_)
     data: dict = json.loads(path.read_text('utf-8'))
     for id_, item_data in data.items():
         # print(item_data)
         obj = type_.parse_obj({'id': id_, **item_data})
-        manager.register(id_, obj)
-
-
-def load_all():
-    character_path = DATA_PATH / 'worldflipper/object' / 'character.json'
-    equipment_path = DATA_PATH / 'worldflipper/object' / 'equipment.json'
-
-    load_from_json(character_path, Character)
-    load_from_json(equipment_path, Equipment)
-
-
-load_all()
+        target.register(id_, obj)
+
+
+def load_all(target: ManagerBase = manager):
+    """优先读取快照，快照不存在或与 JSON 不一致时解析 JSON 并重新生成快照"""
+    sources = {
+        Character: DATA_PATH / 'worldflipper/object' / 'character.json',
+        Equipment: DATA_PATH / 'worldflipper/object' / 'equipment.json',
+    }
+    snapshot_path = DATA_PATH / 'worldflipper/object' / 'snapshot.bin'
+    stats = source_stats(sources)
+
+    loaded = load_snapshot(snapshot_path, list(sources), stats)
+    if loaded is not None:
+        for type_, objs in loaded.items():
+            target.register_type(type_)
+            for id_, obj in objs.items():
+                target.register(id_, obj)
+        return
+
+    for type_, path in sources.items():
+        load_from_json(path, type_, target)
+    try:
+        write_snapshot(snapshot_path, {t: target.dict_of(t) for t in sources}, stats)
+    except OSError as e:
+        # Windows 上旧快照仍被映射时无法替换，下次启动再生成
+        logger.warning(f'写入快照失败: {e!r}')
@@ -0,0 +1,80 @@
+from nonebot import get_driver, logger
+from nonebot.drivers import HTTPServerSetup, ReverseDriver, Request, Response, URL
+
+from ...anise.cache import disk_cache
+from ...anise.config import config
+from ...anise.files import file_io
+from ...anise.http import http_clients
+from ...utils.admission import admission
+from ...startup import startup
+from ...utils.flight import image_flight
+from ...utils.metrics import registry
+from ...utils.playw import page_pool
+from ...utils.workers import image_pool
+
+registry.gauge(
+    'anise_image_flight', 'image_flight 的请求数、被合并的请求数与进行中的请求数',
+    lambda: {(k,): v for k, v in image_flight.stats().items()}, ('stat',)
+)
+registry.gauge(
+    'anise_page_pool', 'Playwright Page 池的大小、使用中、空闲与等待数',
+    lambda: {
+        ('size',): page_pool.size,
+        ('in_use',): page_pool.in_use,
+        ('idle',): page_pool.idle,
+        ('waiting',): page_pool.waiting,
+    },
+    ('state',)
+)
+
+registry.gauge(
+    'anise_image_pool', '图片 worker 的数量、排队上限、执行中与等待中的任务数',
+    lambda: {(k,): v for k, v in image_pool.stats().items()}, ('state',)
+)
+
+registry.gauge(
+    'anise_admission', '准入控制的执行槽位、执行中与排队中的查询、排队中的群数',
+    lambda: {(k,): v for k, v in admission.stats().items()}, ('state',)
+)
+
+registry.gauge(
+    'anise_http_requests', '进行中与等待并发名额的网络请求',
+    lambda: {('in_flight',): http_clients.in_flight, ('waiting',): http_clients.waiting}, ('state',)
+)
+
+registry.gauge(
+    'anise_file_io', '文件线程的数量、执行中与等待中的读写',
+    lambda: {(k,): v for k, v in file_io.stats().items()}, ('state',)
+)
+
+registry.gauge(
+    'anise_disk_cache_bytes', '各命名空间缓存文件的总大小',
+    lambda: {(k,): v.size for k, v in disk_cache.stats().items()}, ('namespace',)
+)
+registry.gauge(
+    'anise_disk_cache_entries', '各命名空间缓存文件的数量',
+    lambda: {(k,): v.entries for k, v in disk_cache.stats().items()}, ('namespace',)
+)
+
+registry.gauge('anise_ready', '初始化是否已经完成', lambda: int(startup.ready))
+registry.gauge(
+    'anise_startup_phase_seconds', '各初始化阶段的耗时',
+    lambda: {(k,): v for k, v in startup.timings.items()}, ('phase',)
+)
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    return Response(
+        200,
+        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'},
+        content=registry.render()
+    )
+
+
+driver = get_driver()
+if config.metrics_path:
+    if isinstance(driver, ReverseDriver):
+        driver.setup_http_server(HTTPServerSetup(URL(config.metrics_path), 'GET', 'anise_metrics', metrics_endpoint))
+        logger.info(f'指标已挂载于 {config.metrics_path}')
+    else:
+        logger.warning(f'当前驱动 {driver.type} 不支持 HTTP 服务端，无法提供 {config.metrics_path}')
@@ -1 +1,4 @@
 from .handler import *
+from . import warmer
+from . import cache_usage
+from . import image_server
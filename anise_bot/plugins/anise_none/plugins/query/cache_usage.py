@@ -0,0 +1,34 @@
+from typing import Union
+
+from nonebot import on_fullmatch, Bot
+from nonebot.adapters.onebot.v11 import MessageEvent as Onebot11MessageEvent
+from nonebot.adapters.red import MessageEvent as RedMessageEvent
+from nonebot.internal.rule import Rule
+from nonebot.permission import SUPERUSER
+
+from ...anise.cache import disk_cache
+from ...update import to_me
+
+
+def format_size(size: int) -> str:
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f'{size:.0f}{unit}' if unit == 'B' else f'{size:.1f}{unit}'
+        size /= 1024
+    return f'{size:.2f}GB'
+
+
+on_cache_usage = on_fullmatch(('缓存占用', '缓存统计'), rule=Rule(to_me), permission=SUPERUSER)
+
+
+@on_cache_usage.handle()
+async def _(bot: Bot, event: Union[Onebot11MessageEvent, RedMessageEvent]):
+    stats = disk_cache.stats()
+    lines = [
+        f'缓存共 {sum(x.entries for x in stats.values())} 个文件，'
+        f'{format_size(disk_cache.size)} / {format_size(disk_cache.max_size)}，已淘汰 {disk_cache.evicted} 个'
+    ]
+    for ns, usage in sorted(stats.items(), key=lambda x: -x[1].size):
+        quota = f' / {format_size(usage.quota)}' if usage.quota else ''
+        lines.append(f'{ns}: {usage.entries} 个，{format_size(usage.size)}{quota}')
+    await bot.send(event, '\n'.join(lines))
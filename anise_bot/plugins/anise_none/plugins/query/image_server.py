@@ -0,0 +1,20 @@
+from nonebot import get_driver, logger
+from nonebot.drivers import HTTPServerSetup, ReverseDriver, URL
+
+from ...anise.config import config
+from ...utils.transport import image_transport
+
+driver = get_driver()
+if config.image_transport.mode != 'http':
+    pass
+elif not config.image_transport.base_url:
+    logger.warning('image_transport.mode 为 http 但没有设置 base_url，图片仍以 base64 发送')
+elif isinstance(driver, ReverseDriver):
+    driver.setup_http_server(
+        HTTPServerSetup(URL(config.image_transport.path), 'GET', 'anise_images', image_transport.endpoint)
+    )
+    logger.info(f'缓存图片已挂载于 {config.image_transport.path}')
+else:
+    # 没有路由时不能发送链接，退回为 base64
+    config.image_transport.mode = 'bytes'
+    logger.warning(f'当前驱动 {driver.type} 不支持 HTTP 服务端，图片仍以 base64 发送')
@@ -2,36 +2,61 @@ import abc
 import asyncio
 import dataclasses
 import enum
-import io
 import json
 import os
 import re
 import time
 import urllib.parse
+from pathlib import Path
 from typing import Any, Optional, Type, Union
 
-import httpx
 from PIL import Image
 from nonebot import logger
 from pydantic import BaseModel
 
 from ... import update
+from ...startup import startup
 from ...utils import (
-    MessageCard, ImageHandlerLocalFile, ImageHandlerNetwork, ImageHandlerPageScreenshot,
-    ImageHandlerPostProcessor, PlaywrightContext
+    MessageCard, ImageHandler, ImageHandlerLocalFile, ImageHandlerNetwork, ImageHandlerPageScreenshot,
+    ImageHandlerPostProcessor, ImageHandlerAnimation, ImageData, BasicTimerCache, page_pool, image_flight
 )
+from ...utils.flight import SingleFlight
+from ...utils.metrics import cache_requests, span
+from ...utils.render import (
+    CHARACTER_LAYOUT, EQUIPMENT_LAYOUT, PartyRow, WikiCard, render_party_page, render_wikicard
+)
+from ...utils.workers import image_pool
 from ...anise.config import METEORHOUSE_URL, RES_PATH, CALENDAR_URL, config
-from ...anise.query.alias import alias_manager
-from ...models.worldflipper import Equipment, Character
+from ...anise.http import http_clients
+from ...anise.cache import disk_cache
+from ...anise.files import file_io
+from ...anise.query.dispatch import QueryDispatchIndex
+from ...anise.manager import ManagerBase, manager
+from ...anise.query.alias import AliasManager, alias_manager
+from ...models.worldflipper import Equipment, Character, Element, SpecialityType, load_all
 
 
 class QueryHandler(BaseModel, abc.ABC):
     """用来代替 QuerySet"""
     type: str
+    # 以下三项只对带缓存的图片生效，cache_timeout 为 None 时使用图片的默认值
+    cache_timeout: Optional[int] = None
+    stale_while_revalidate: bool = False
+    max_stale: int = 60 * 60 * 24 * 7
 
     def __init__(self, **data: Any):
         super().__init__(**data)
 
+    def with_cache_policy(self, ih: Optional[ImageHandler]) -> Optional[ImageHandler]:
+        """把 query/config.json 中的缓存设置应用到 get_message 创建的图片上"""
+        target = ih.ih if isinstance(ih, (ImageHandlerPostProcessor, ImageHandlerAnimation)) else ih
+        if isinstance(target, BasicTimerCache):
+            if self.cache_timeout is not None:
+                target.cache_timeout = self.cache_timeout
+            target.stale_while_revalidate = self.stale_while_revalidate
+            target.max_stale = self.max_stale
+        return ih
+
     async def check(self, text: str) -> Any:
         return None
 
@@ -88,7 +113,7 @@ class QueryHandlerServerTable(QueryHandlerRegex):
         )
         return MessageCard(
             text=urllib.parse.urljoin(METEORHOUSE_URL, f'/table/{urllib.parse.quote(self.table_id)}'),
-            image_handler=ih
+            image_handler=self.with_cache_policy(ih)
         )
 
 
@@ -101,8 +126,89 @@ class EnumObjectResType(enum.Enum):
     PIXEL_ART_KACHI = 5
 
 
+def full_shot_post_process(image: Image.Image) -> Image.Image:
+    """立绘铺上浅灰底色，在 image_pool 中执行，因此放在模块顶层"""
+    image = image.convert('RGBA')
+    bg = Image.new('RGB', size=image.size, color=(240, 240, 240))
+    bg.paste(image, mask=image)
+    return bg.convert('RGBA')
+
+
+ELEMENT_NAMES = {
+    Element.ALL: '全属性', Element.FIRE: '火', Element.WATER: '水', Element.THUNDER: '雷',
+    Element.WIND: '风', Element.LIGHT: '光', Element.DARK: '暗',
+}
+SPECIALITY_NAMES = {
+    SpecialityType.KNIGHT: '剑士', SpecialityType.FIGHTER: '格斗', SpecialityType.RANGED: '射击',
+    SpecialityType.SUPPORTER: '辅助', SpecialityType.SPECIAL: '特殊',
+}
+
+
+class ImageHandlerWikicard(ImageHandler, BasicTimerCache):
+    """不经过浏览器，用 Character、Equipment 的数据与本地立绘由 Pillow 绘制 wikicard"""
+
+    def __init__(self, obj: Union[Character, Equipment], cache_timeout: int = 60 * 60 * 24):
+        super().__init__(
+            lambda x: RES_PATH / 'query' / 'cache' / 'wikicard_native' / obj.type_id() / f'{obj.resource_id}.png',
+            cache_timeout
+        )
+        self.obj: Union[Character, Equipment] = obj
+
+    def key(self) -> str:
+        return f'Wikicard({self.obj.type_id()}, {self.obj.id})'
+
+    def card(self) -> WikiCard:
+        obj = self.obj
+        tags = [f'{"★" * obj.rarity}  {ELEMENT_NAMES.get(obj.element, "")}属性']
+        if isinstance(obj, Character):
+            art_dir = RES_PATH / obj.type_id()
+            art_paths = [
+                str(art_dir / group.id / f'{obj.resource_id}.png')
+                for group in (Character.Res.full_resized_0, Character.Res.square212x_0)
+            ]
+            tags.append(f'{SPECIALITY_NAMES.get(obj.type, "")}  {obj.race}')
+            if obj.cv:
+                tags.append(f'CV: {obj.cv}')
+            sections = [
+                (f'队长特性  {obj.leader_ability.name}', obj.leader_ability.description),
+                (f'技能  {obj.skill.name}  (消耗 {obj.skill.weight})', obj.skill.description),
+                *[(f'能力{i + 1}', x) for i, x in enumerate(obj.abilities) if x],
+                ('获取方式', obj.obtain),
+            ]
+        else:
+            # 装备没有定义本地的资源组，使用属性色块
+            art_paths = []
+            sections = [
+                *[(f'能力{i + 1}' if len(obj.abilities) > 1 else '能力', x) for i, x in enumerate(obj.abilities)],
+                ('', obj.description),
+                ('获取方式', obj.obtain),
+            ]
+        return WikiCard(obj.names[0] if obj.names else obj.id, tags, obj.element.value, art_paths, sections)
+
+    async def get(self) -> Optional[Image.Image]:
+        data = await self.get_data()
+        return data.open() if data else None
+
+    async def get_data(self) -> Optional[ImageData]:
+        data = await self.read_usable_cache(self.fetch)
+        if data is None:
+            return await self.fetch()
+        return ImageData(data, 'image/png', self.cache_file())
+
+    async def fetch(self) -> Optional[ImageData]:
+        layout = CHARACTER_LAYOUT if isinstance(self.obj, Character) else EQUIPMENT_LAYOUT
+        if isinstance(self.obj, Character):
+            # 立绘不在本地时经由 asset_store 下载，失败时退回头像或色块
+            await Character.Res.full_resized_0.get_bytes(self.obj, timeout=10.0)
+        with span('render', self.__class__.__name__):
+            content = await image_pool.run(render_wikicard, self.card(), layout)
+        return ImageData(content, 'image/png', await self.cache(content))
+
+
 class QueryHandlerWorldflipperObject(QueryHandler):
     strict: bool = True
+    # screenshot 为网页截图，pillow 由 ImageHandlerWikicard 直接绘制
+    renderer: str = 'screenshot'
 
     @dataclasses.dataclass
     class CheckResult:
@@ -138,16 +244,21 @@ class QueryHandlerWorldflipperObject(QueryHandler):
             )
         return None
 
+    @staticmethod
+    def wikicard_handler(obj: Union[Character, Equipment], renderer: str = 'screenshot') -> ImageHandler:
+        if renderer == 'pillow':
+            return ImageHandlerWikicard(obj)
+        card_type = 'character' if isinstance(obj, Character) else 'equipment'
+        return ImageHandlerPageScreenshot(
+            urllib.parse.urljoin(METEORHOUSE_URL, f'/card/{card_type}/?wf_id={obj.id}'),
+            selector='#main-card',
+            cache_path_getter=lambda x: RES_PATH / 'query' / 'cache' / 'wikicard' / obj.type_id() / f'{obj.resource_id}.png'
+        )
+
     async def get_message(self, check_result: CheckResult) -> Optional[MessageCard]:
-        id_ = check_result.obj.id
         res_id = check_result.obj.resource_id
         ih = None
         if isinstance(check_result.obj, Character):
-            def full_shot_post_process(image: Image.Image):
-                bg = Image.new('RGB', size=image.size, color=(240, 240, 240))
-                bg.paste(image, mask=image)
-                return bg.convert('RGBA')
-
             if check_result.type == EnumObjectResType.FULL_SHOT_0:
                 ih = ImageHandlerPostProcessor(
                     ImageHandlerNetwork(
@@ -173,46 +284,38 @@ class QueryHandlerWorldflipperObject(QueryHandler):
                     post_process=full_shot_post_process
                 )
             elif check_result.type == EnumObjectResType.PIXEL_ART_SPECIAL:
-                ih = ImageHandlerNetwork(
+                ih = ImageHandlerAnimation(ImageHandlerNetwork(
                     urllib.parse.urljoin(
                         METEORHOUSE_URL,
                         f'/static/worldflipper/unit/pixelart/special/{check_result.obj.resource_id}.gif'
                     ),
                     cache_path_getter=lambda
                         x: RES_PATH / check_result.obj.type_id() / 'pixelart/special' / f'{res_id}.gif'
-                )
+                ))
             elif check_result.type == EnumObjectResType.PIXEL_ART_WALK_FRONT:
-                ih = ImageHandlerNetwork(
+                ih = ImageHandlerAnimation(ImageHandlerNetwork(
                     urllib.parse.urljoin(
                         METEORHOUSE_URL,
                         f'/static/worldflipper/unit/pixelart/walk_front/{check_result.obj.resource_id}.gif'
                     ),
                     cache_path_getter=lambda
                         x: RES_PATH / check_result.obj.type_id() / 'pixelart/walk_front' / f'{res_id}.gif'
-                )
+                ))
             elif check_result.type == EnumObjectResType.PIXEL_ART_KACHI:
-                ih = ImageHandlerNetwork(
+                ih = ImageHandlerAnimation(ImageHandlerNetwork(
                     urllib.parse.urljoin(
                         METEORHOUSE_URL,
                         f'/static/worldflipper/unit/pixelart/kachidoki/{check_result.obj.resource_id}.gif'
                     ),
                     cache_path_getter=lambda
                         x: RES_PATH / check_result.obj.type_id() / 'pixelart/kachidoki' / f'{res_id}.gif'
-                )
+                ))
             else:
-                ih = ImageHandlerPageScreenshot(
-                    urllib.parse.urljoin(METEORHOUSE_URL, f'/card/character/?wf_id={id_}'),
-                    selector='#main-card',
-                    cache_path_getter=lambda x: RES_PATH / 'query' / 'cache' / 'wikicard' / check_result.obj.type_id() / f'{res_id}.png'
-                )
+                ih = self.wikicard_handler(check_result.obj, self.renderer)
         elif isinstance(check_result.obj, Equipment):
-            ih = ImageHandlerPageScreenshot(
-                    urllib.parse.urljoin(METEORHOUSE_URL, f'/card/equipment/?wf_id={id_}'),
-                    selector='#main-card',
-                    cache_path_getter=lambda x: RES_PATH / 'query' / 'cache' / 'wikicard' / check_result.obj.type_id() / f'{res_id}.png'
-                )
+            ih = self.wikicard_handler(check_result.obj, self.renderer)
         mc = MessageCard(
-            image_handler=ih
+            image_handler=self.with_cache_policy(ih)
         )
         # self.obj = None
         return mc
@@ -224,39 +327,83 @@ class QueryHandlerWorldflipperScheduler(QueryHandlerRegex):
         def key(self) -> str:
             return f'Scheduler({self.url}, {self.selector})'
 
-        async def get(self) -> Optional[Image.Image]:
-            try:
-                if await self.need_recache() or not self.is_cached():
-                    async with PlaywrightContext(**self.kwargs) as context:
-                        page = await context.new_page()
-                        await page.goto(self.url, wait_until='load')
-                        await page.click('body', position={'x': 440, 'y': 195})
-                        await page.wait_for_load_state(state='networkidle', timeout=600000)
-                        loc = page.locator(self.selector)
-                        img = await loc.screenshot(type='png', omit_background=True)
-                    img = Image.open(io.BytesIO(img)).convert('RGBA')
-                    self.cache(await self.to_io(img))
-                    return img
-                else:
-                    img = Image.open(self.cache_path_getter(self))
-                    return img
-            except Exception as e:
-                raise e
+        async def fetch(self) -> Optional[ImageData]:
+            with span('render', self.__class__.__name__):
+                async with page_pool.page(self.low_priority, **self.kwargs) as page:
+                    await page.goto(self.url, wait_until='load')
+                    await page.click('body', position={'x': 440, 'y': 195})
+                    await page.wait_for_load_state(state='networkidle', timeout=600000)
+                    loc = page.locator(self.selector)
+                    img = await loc.screenshot(type='png', omit_background=True)
+            return ImageData(img, 'image/png', await self.cache(img))
 
     async def get_message(self, check_result: Any) -> Optional[MessageCard]:
         return MessageCard(
-            image_handler=QueryHandlerWorldflipperScheduler.ImageHandlerScheduler(
+            image_handler=self.with_cache_policy(QueryHandlerWorldflipperScheduler.ImageHandlerScheduler(
                 CALENDAR_URL,
                 cache_path_getter=lambda x: RES_PATH / 'query' / 'cache' / 'calendar.png'
-            )
+            ))
         )
 
 
+# (text, page_index) -> (获取时间, parties)，空结果同样缓存
+_party_pages: dict[tuple[str, int], tuple[float, list[dict]]] = {}
+_party_flight = SingleFlight()
+PARTY_PAGES_MAX = 1024
+
+
 class QueryHandlerWorldflipperPurePartySearcher(QueryHandler):
+    # pillow 直接按 API 的结果绘制，screenshot 为原先的网页截图；
+    # 留空时只有设置了 config.query.font_path 才使用 pillow，Pillow 自带的字体无法显示中文
+    renderer: str = ''
+    api_ttl: int = 60 * 10
+
     @dataclasses.dataclass
     class CheckResult:
         text: str
         page_index: int
+        parties: list[dict] = dataclasses.field(default_factory=list)
+
+    class ImageHandlerPartyPage(ImageHandler):
+        """
+        用 check 时拿到的 parties 绘制结果页，图标使用本地的 square212x 资源
+        只读取每个盘子的 id、title 与 characters（角色 id 的列表）
+        """
+
+        def __init__(self, text: str, page_index: int, parties: list[dict]):
+            self.text: str = text
+            self.page_index: int = page_index
+            self.parties: list[dict] = parties
+
+        def key(self) -> str:
+            return f'PartyPage({self.text}, {self.page_index})'
+
+        @staticmethod
+        def icon_of(character_id: Any) -> tuple[Optional[str], int]:
+            obj = manager.get(Character, str(character_id)) if character_id is not None else None
+            if obj is None:
+                return None, -1
+            path = RES_PATH / obj.type_id() / Character.Res.square212x_0.id / f'{obj.resource_id}.png'
+            return str(path), obj.element.value
+
+        async def get(self) -> Optional[Image.Image]:
+            data = await self.get_data()
+            return data.open() if data else None
+
+        async def get_data(self) -> Optional[ImageData]:
+            rows = [
+                PartyRow(
+                    str(pt.get('id', '')), str(pt.get('title', '')),
+                    [self.icon_of(x) for x in (pt.get('characters') or [])[:6]]
+                )
+                for pt in self.parties
+            ]
+            with span('render', self.__class__.__name__):
+                content = await image_pool.run(
+                    render_party_page, f'{self.text} 第{self.page_index}页', rows,
+                    f'发送“{self.text}{self.page_index + 1}”查看下一页'
+                )
+            return ImageData(content, 'image/png')
 
     @staticmethod
     def get_text_and_page(text: str) -> tuple[str, int]:
@@ -269,45 +416,68 @@ class QueryHandlerWorldflipperPurePartySearcher(QueryHandler):
         text = text.strip()
         return text, page_index
 
-    async def check(self, text: str) -> Optional[CheckResult]:
-        if not text:
-            return None
-        text, page_index = self.get_text_and_page(text)
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
+    async def search(self, text: str, page_index: int) -> Optional[list[dict]]:
+        """同一页在 api_ttl 秒内只请求一次，请求失败时返回 None 且不缓存"""
+        key = (text, page_index)
+        cached = _party_pages.get(key)
+        if cached and cached[0] + self.api_ttl > time.time():
+            cache_requests.inc(cache='PartySearch', result='hit')
+            return cached[1]
+        cache_requests.inc(cache='PartySearch', result='miss')
+        return await _party_flight.do(f'{text}/{page_index}', lambda: self._request(text, page_index))
+
+    async def _request(self, text: str, page_index: int) -> Optional[list[dict]]:
+        with span('network', self.type):
+            response = await http_clients.request(
+                'POST',
                 urllib.parse.urljoin(
                     METEORHOUSE_URL,
-                    f'/api/v1/party/page/?search_text={text}&page_index={page_index}'
+                    f'/api/v1/party/page/?search_text={urllib.parse.quote(text)}&page_index={page_index}'
                 ),
                 timeout=20.0
             )
-            if response.status_code == 200:
-                d: dict = response.json()
-                pts = d.get('parties', {})
-                if pts:
-                    return QueryHandlerWorldflipperPurePartySearcher.CheckResult(
-                        text,
-                        page_index
-                    )
+        if response.status_code != 200:
+            return None
+        parties = response.json().get('parties') or []
+        _party_pages.pop((text, page_index), None)
+        _party_pages[(text, page_index)] = (time.time(), parties)
+        while len(_party_pages) > PARTY_PAGES_MAX:
+            del _party_pages[next(iter(_party_pages))]
+        return parties
+
+    async def check(self, text: str) -> Optional[CheckResult]:
+        if not text:
+            return None
+        text, page_index = self.get_text_and_page(text)
+        parties = await self.search(text, page_index)
+        if parties:
+            return QueryHandlerWorldflipperPurePartySearcher.CheckResult(text, page_index, parties)
         return None
 
     async def get_message(self, check_result: CheckResult) -> Optional[MessageCard]:
+        renderer = self.renderer or ('pillow' if config.query.font_path else 'screenshot')
+        if renderer == 'pillow':
+            return MessageCard(
+                image_handler=QueryHandlerWorldflipperPurePartySearcher.ImageHandlerPartyPage(
+                    check_result.text, check_result.page_index, check_result.parties
+                )
+            )
         hash_key = f'{check_result.text}_page{check_result.page_index}'
         return MessageCard(
-            image_handler=ImageHandlerPageScreenshot(
+            image_handler=self.with_cache_policy(ImageHandlerPageScreenshot(
                 urllib.parse.urljoin(
                     METEORHOUSE_URL,
                     f'/pure/partySearcher/?q={urllib.parse.quote(check_result.text)}&page={check_result.page_index}',
                 ),
                 cache_path_getter=lambda x: RES_PATH / 'query' / 'cache' / 'party_page' / f'{hash_key}.png'
-            )
+            ))
         )
 
 
 class QueryHandlerWorldflipperPartyRefer(QueryHandler):
     @dataclasses.dataclass
     class CheckResult:
-        pic: Image.Image
+        pic: bytes
         party_code: str
 
     async def check(self, text: str) -> Optional[CheckResult]:
@@ -318,41 +488,58 @@ class QueryHandlerWorldflipperPartyRefer(QueryHandler):
                 return QueryHandlerWorldflipperPartyRefer.CheckResult(pic, text)
         return None
 
-    async def get_image(self, party_code: str) -> Optional[Image.Image]:
+    @staticmethod
+    def cache_path_of(party_code: str) -> Path:
+        return RES_PATH / 'query' / 'cache' / 'party_refer' / f'{party_code}.png'
+
+    async def get_image(self, party_code: str) -> Optional[bytes]:
+        return await image_flight.do(f'PartyRefer({party_code})', lambda: self._render_image(party_code))
 
-        cache_path = RES_PATH / 'query' / 'cache' / 'party_refer' / f'{party_code}.png'
+    @staticmethod
+    async def _render_image(party_code: str) -> Optional[bytes]:
+        """返回截图得到的 PNG，不经过 PIL 解码"""
+        cache_path = QueryHandlerWorldflipperPartyRefer.cache_path_of(party_code)
         try:
-            if not cache_path.exists():
-                async with PlaywrightContext() as context:
-                    page = await context.new_page()
-                    url = urllib.parse.urljoin(METEORHOUSE_URL, f'/card/party_refer/?id={party_code}')
-                    await page.goto(url)
-                    await page.wait_for_selector('#card-complete')
-                    if await page.query_selector('#main-card'):
-                        print('wait networkidle')
-                        await page.wait_for_load_state('networkidle')
-                        locator = page.locator('#main-card')
-                        img = await locator.screenshot()
-                        img = Image.open(io.BytesIO(img))
-                    else:
-                        img = None
-                    return img
-            return Image.open(cache_path)
-        except:
+            if not disk_cache.lookup(cache_path):
+                with span('render', 'PartyRefer'):
+                    async with page_pool.page() as page:
+                        url = urllib.parse.urljoin(METEORHOUSE_URL, f'/card/party_refer/?id={party_code}')
+                        await page.goto(url)
+                        await page.wait_for_selector('#card-complete')
+                        if await page.query_selector('#main-card'):
+                            logger.debug(f'等待配队 {party_code} 的页面加载完成')
+                            await page.wait_for_load_state('networkidle')
+                            locator = page.locator('#main-card')
+                            return await locator.screenshot()
+                        else:
+                            return None
+            data = await file_io.read_bytes(cache_path)
+            disk_cache.touch(cache_path)
+            return data
+        except Exception as e:
+            logger.warning(f'获取配队 {party_code} 的截图失败: {e!r}')
             return None
 
     async def get_message(self, check_result: CheckResult) -> Optional[MessageCard]:
-        cache_path = RES_PATH / 'query' / 'cache' / 'party_refer' / f'{check_result.party_code}.png'
-        cache_path.parent.mkdir(parents=True, exist_ok=True)
-        check_result.pic.save(cache_path)
+        cache_path = self.cache_path_of(check_result.party_code)
+        if not disk_cache.lookup(cache_path):
+            await file_io.run(disk_cache.put, cache_path, check_result.pic)
         return MessageCard(image_handler=ImageHandlerLocalFile(cache_path))
 
 
+def _static_regex_of(handler: QueryHandler) -> Optional[str]:
+    """仅靠正则就能判断是否命中的 Handler 返回其正则，其余返回 None"""
+    if isinstance(handler, QueryHandlerRegex) and type(handler).check is QueryHandlerRegex.check:
+        return handler.regex
+    return None
+
+
 class QueryManager:
 
     def __init__(self):
         self.registered_handler_type: dict[str, Type[QueryHandler]] = {}
         self.query_handlers: list[QueryHandler] = []
+        self._index: Optional[QueryDispatchIndex] = None
 
     def register(self, handler_type: Type[QueryHandler], name: str):
         self.registered_handler_type[name] = handler_type
@@ -370,15 +557,30 @@ class QueryManager:
     async def init(self, path=RES_PATH):
         if config.query.update_on_startup:
             await update.manager.update()
-        self.query_handlers.clear()
+        return self.load(path)
+
+    def load(self, path=RES_PATH) -> int:
+        """读取 query/config.json，新的 Handler 与索引构建完成后才替换旧的"""
         config_path = path / 'query' / 'config.json'
-        if not path.exists():
-            os.makedirs(path.parent, exist_ok=True)
+        if not config_path.exists():
+            os.makedirs(config_path.parent, exist_ok=True)
             config_path.write_text(json.dumps({'query_map': []}))
         query_config: list = json.loads(config_path.read_text('utf-8')).get('query_map', '')
-        self.query_handlers: list = list(filter(None, [self.read_query_handler(x) for x in query_config]))
+        query_handlers: list = list(filter(None, [self.read_query_handler(x) for x in query_config]))
+        self._index = QueryDispatchIndex(query_handlers, _static_regex_of)
+        self.query_handlers = query_handlers
         return len(self.query_handlers)
 
+    def build_index(self) -> QueryDispatchIndex:
+        self._index = QueryDispatchIndex(self.query_handlers, _static_regex_of)
+        return self._index
+
+    def get_index(self) -> QueryDispatchIndex:
+        # query_handlers 可能在 init 之外被直接替换
+        if self._index is None or self._index.handlers is not self.query_handlers:
+            return self.build_index()
+        return self._index
+
     def load_default_type(self):
         self.register(QueryHandlerText, 'text')
         self.register(QueryHandlerText, 'Text')
@@ -416,39 +618,66 @@ class QueryManager:
         self.register(QueryHandlerWorldflipperPurePartySearcher, 'PartySearcher')
         self.register(QueryHandlerWorldflipperPurePartySearcher, 'party_searcher')
 
+    def suggest(self, text: str, limit: int = 3) -> list[str]:
+        """查询失败时给出的候选别名，只对包含对象查询的 QueryManager 生效"""
+        if not any(isinstance(h, QueryHandlerWorldflipperObject) for h in self.query_handlers):
+            return []
+        return [name for name, obj, score in alias_manager.guess_top(text.strip(), limit)]
+
     async def query(self, text: str) -> Optional[MessageCard]:
-        try:
-            text = text.strip()
-            for handler in self.query_handlers:
-                if check_result := await handler.check(text):
-                    mc = await handler.get_message(check_result)
-                    if mc:
-                        return mc
+        text = text.strip()
+        for handler, matched in self.get_index().candidates(text):
+            if matched:
+                check_result = True
             else:
-                return None
-        except Exception as e:
-            raise e
+                with span('check', handler.type):
+                    check_result = await handler.check(text)
+            if check_result:
+                with span('get_message', handler.type):
+                    mc = await handler.get_message(check_result)
+                if mc:
+                    return mc
+        return None
 
 
-_QM = None
+query_manager = QueryManager()
+query_manager.load_default_type()
+query_manager.load_worldflipper_type()
 
 
-async def get_query() -> QueryManager:
-    global _QM
-    if _QM is None:
-        _QM = QueryManager()
-        _QM.load_default_type()
-        _QM.load_worldflipper_type()
-        await _QM.init()
-    return _QM
+@startup.phase('query')
+async def _():
+    await query_manager.init()
 
-asyncio.get_event_loop().run_until_complete(get_query())
+
+async def get_query() -> QueryManager:
+    """初始化完成前调用会一直等待，需要立即返回的场合先检查 startup.ready"""
+    await startup.wait_ready()
+    return query_manager
+
+
+@update.manager.on_updated
+async def reload_data(changed: set[str]):
+    """更新后在后台重新加载数据，加载完成后整体替换，期间的查询继续使用旧数据"""
+    t = time.time()
+    if changed & {'character_data', 'equipment_data'}:
+        loaded = ManagerBase()
+        await asyncio.to_thread(load_all, loaded)
+        manager.swap(loaded)
+    if changed & {'character_data', 'equipment_data', 'character_alias', 'equipment_alias'}:
+        loaded_alias = AliasManager()
+        await asyncio.to_thread(loaded_alias.load)
+        alias_manager.swap(loaded_alias)
+    if 'query_config' in changed:
+        query_manager.load()
+    logger.info(f'已重新加载 {", ".join(sorted(changed))} (耗时{"%.2f" % (time.time() - t)}s)')
 
 
 if __name__ == '__main__':
     async def main():
         t = time.time()
         # print(f'(耗时{"%.2f" % (time.time() - t)}s)')
+        await startup.run()
         qm = await get_query()
         mc = await qm.query('雷废')
         print(mc)
@@ -0,0 +1,85 @@
+import dataclasses
+from typing import Awaitable, Callable, Optional, Union
+
+from nonebot import Bot, logger
+from nonebot.adapters.onebot.v11 import MessageEvent as Onebot11MessageEvent
+from nonebot.adapters.red import MessageEvent as RedMessageEvent
+from nonebot.typing import T_State
+from pygtrie import CharTrie
+
+from ...utils.metrics import span
+
+MessageEvent = Union[Onebot11MessageEvent, RedMessageEvent]
+Checker = Callable[[MessageEvent], Awaitable[bool]]
+
+ROUTE_KEY = '_anise_route'
+
+
+@dataclasses.dataclass
+class Route:
+    name: str
+    prefix: str
+    text: str  # 去掉前缀后的查询文本
+    handler: Callable
+    checked: bool = True
+
+
+class PrefixRouter:
+    """
+    所有前缀放在同一棵 Trie 里，第一个文本段只做一次最长前缀查找
+    命中后基础检查（白名单、静音、soft to_me）每个事件只运行一次，
+    去掉前缀后的文本放在 state 中交给对应的处理函数，不修改消息本身
+    """
+
+    def __init__(self, *checkers: Checker):
+        self.checkers: tuple[Checker, ...] = checkers
+        self.trie: CharTrie = CharTrie()
+
+    def route(self, name: str, prefixes: Union[str, list[str], tuple[str, ...]], checked: bool = True):
+        """
+        注册一组前缀，被装饰的函数以 (bot, event, route) 调用
+        同一前缀被多次注册时保留先注册的路由
+        :param checked: 为 False 时跳过基础检查（例如解除静音本身）
+        """
+        if isinstance(prefixes, str):
+            prefixes = (prefixes,)
+
+        def deco(func: Callable[[Bot, MessageEvent, Route], Awaitable]):
+            for p in prefixes:
+                p = p.lower().strip()
+                if p in self.trie:
+                    logger.warning(f'前缀 {p!r} 已被 {self.trie[p][0]} 使用，{name} 不再响应该前缀')
+                    continue
+                self.trie[p] = (name, func, checked)
+            return func
+
+        return deco
+
+    def match(self, event: MessageEvent) -> Optional[Route]:
+        segments = [m for m in event.get_message() if m.type == 'text']
+        if not segments:
+            return None
+        start = segments[0].data['text'].lstrip()
+        step = self.trie.longest_prefix(start.lower())
+        if not step:
+            return None
+        name, func, checked = step.value
+        text = start[len(step.key):] + ''.join(m.data['text'] for m in segments[1:])
+        return Route(name, step.key, text, func, checked)
+
+    async def __call__(self, event: MessageEvent, state: T_State) -> bool:
+        with span('route'):
+            route = self.match(event)
+            if route is None:
+                return False
+            if route.checked:
+                for checker in self.checkers:
+                    if not await checker(event):
+                        return False
+            state[ROUTE_KEY] = route
+            return True
+
+    @staticmethod
+    async def dispatch(bot: Bot, event: MessageEvent, state: T_State):
+        route: Route = state[ROUTE_KEY]
+        await route.handler(bot, event, route)
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Optional, Union
+
+from nonebot import logger, Bot, get_driver
+from nonebot.adapters.onebot.v11 import (
+    MessageEvent as Onebot11MessageEvent,
+    GroupMessageEvent as Onebot11GroupMessageEvent,
+)
+from nonebot.adapters.red import (
+    MessageEvent as RedMessageEvent,
+    GroupMessageEvent as RedGroupMessageEvent,
+)
+
+from ...anise import config as anise_config
+from ...utils import MessageCard
+
+MessageEvent = Union[Onebot11MessageEvent, RedMessageEvent]
+
+
+class MessageSync:
+    """
+    同步分布式Bot的消息，去掉不必要的重复回复
+    ** 这是一个“Post Check but before generate”
+    在 Bot 自身的事件循环上保持一条 websocket 连接，每个请求带有 request_id，
+    由读取协程把服务端的回复分发给对应的 Future，因此可以同时进行多个检查
+    连接不可用或超时时一律放行，不影响正常回复
+    """
+
+    def __init__(self, uri: str, timeout: float = 3.0, backoff_max: float = 60.0):
+        self.uri: str = uri
+        self.timeout: float = timeout
+        self.backoff_max: float = backoff_max
+        self.ws: Any = None
+        self.pending: dict[str, tuple[asyncio.Future, str, str]] = {}
+        self._reader: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._backoff: float = 0.0
+        self._retry_time: float = 0.0
+
+    @property
+    def connected(self) -> bool:
+        return self._reader is not None and not self._reader.done()
+
+    async def connect(self) -> bool:
+        if self.connected:
+            return True
+        if time.time() < self._retry_time:
+            return False
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.connected:
+                return True
+            import websockets
+            try:
+                self.ws = await websockets.connect(self.uri)
+            except Exception as e:
+                self._backoff = min(self.backoff_max, self._backoff * 2 or 1.0)
+                self._retry_time = time.time() + self._backoff
+                logger.warning(f'连接至同步服务器失败，{"%.0f" % self._backoff}s 后重试: {e!r}')
+                return False
+            self._backoff = 0.0
+            self._reader = asyncio.create_task(self._read_loop(self.ws))
+            logger.info(f'已连接至同步服务器 {self.uri}')
+            return True
+
+    def _resolve(self, package: dict, send: bool):
+        request_id = package.get('request_id')
+        if request_id not in self.pending:
+            # 兼容不回传 request_id 的服务端
+            request_id = next(
+                (
+                    k for k, (_, message_id, bot_id) in self.pending.items()
+                    if message_id == package.get('message_id') and bot_id == package.get('bot_id')
+                ),
+                None
+            )
+        if request_id is None:
+            return
+        future, _, _ = self.pending.pop(request_id)
+        if not future.done():
+            future.set_result(send)
+
+    async def _read_loop(self, ws):
+        try:
+            async for raw in ws:
+                try:
+                    msg: dict = json.loads(raw)
+                    self._resolve(msg.get('package') or {}, bool(msg.get('send', False)))
+                except (ValueError, AttributeError):
+                    logger.warning(f'无法解析同步服务器的消息: {raw!r}')
+        except Exception as e:
+            logger.warning(f'与同步服务器的连接已断开: {e!r}')
+        finally:
+            pending, self.pending = self.pending, {}
+            for future, _, _ in pending.values():
+                if not future.done():
+                    future.set_result(True)
+
+    @staticmethod
+    def build_package(bot: Bot, event: MessageEvent, card: MessageCard) -> dict:
+        message_id = str(event.message_id) if isinstance(event, Onebot11MessageEvent) else event.msgRandom
+        data = {'user_id': event.get_user_id(), 'bot_id': bot.self_id, 'message_id': message_id}
+        if isinstance(event, RedGroupMessageEvent):
+            data['group_id'] = int(event.peerUid)
+        elif isinstance(event, Onebot11GroupMessageEvent):
+            data['group_id'] = event.group_id
+        data['card_hash'] = card.hash()
+        data['request_id'] = uuid.uuid4().hex
+        return data
+
+    async def check(self, bot: Bot, event: MessageEvent, card: MessageCard) -> bool:
+        if not self.uri or not await self.connect():
+            return True
+        data = self.build_package(bot, event, card)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[data['request_id']] = (future, data['message_id'], data['bot_id'])
+        try:
+            await self.ws.send(json.dumps(data))
+            return await asyncio.wait_for(future, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f'同步服务器响应超时，已自动通过消息处理过滤: {data}')
+            return True
+        except Exception as e:
+            logger.opt(exception=e).error('同步服务器请求失败，已自动通过消息处理过滤')
+            return True
+        finally:
+            self.pending.pop(data['request_id'], None)
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+
+message_sync = MessageSync(anise_config.config.sync_uri, anise_config.config.sync_timeout)
+
+
+@get_driver().on_shutdown
+async def _():
+    await message_sync.close()
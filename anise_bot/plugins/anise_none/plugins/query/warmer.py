@@ -0,0 +1,131 @@
+import asyncio
+import dataclasses
+import time
+from typing import Optional, Union
+
+from nonebot import logger, on_fullmatch, Bot
+from nonebot.adapters.onebot.v11 import MessageEvent as Onebot11MessageEvent
+from nonebot.adapters.red import MessageEvent as RedMessageEvent
+from nonebot.internal.rule import Rule
+from nonebot.permission import SUPERUSER
+
+from .query import QueryHandlerWorldflipperObject, query_manager
+from ... import update
+from ...anise.config import config
+from ...anise.manager import manager
+from ...models.worldflipper import Character, Equipment
+from ...update import to_me
+from ...utils import BasicTimerCache, ImageHandler, ImageHandlerPageScreenshot
+
+
+@dataclasses.dataclass
+class WarmupProgress:
+    total: int = 0
+    rendered: int = 0
+    skipped: int = 0
+    failed: int = 0
+    started_at: float = 0.0
+    finished_at: float = 0.0
+
+    @property
+    def processed(self) -> int:
+        return self.rendered + self.skipped + self.failed
+
+    def __str__(self):
+        cost = (self.finished_at or time.time()) - self.started_at
+        return (
+            f'{self.processed}/{self.total} '
+            f'(渲染 {self.rendered}, 跳过 {self.skipped}, 失败 {self.failed}, 耗时 {"%.1f" % cost}s)'
+        )
+
+
+class WikicardWarmer:
+    """
+    预渲染全部角色与装备的 Wikicard
+    已有未过期缓存的卡片会被跳过，因此中断后重新开始即可从上次的进度继续；
+    渲染时以低优先级借用 Page，实时查询总是优先
+    """
+
+    def __init__(self, concurrency: int = 1):
+        self.concurrency: int = max(1, concurrency)
+        self.progress: Optional[WarmupProgress] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @staticmethod
+    def targets() -> list[ImageHandler]:
+        """按 query/config.json 中 wfo 条目的 renderer 与缓存设置生成，与实时查询使用同一份缓存"""
+        query_handlers: dict[str, QueryHandlerWorldflipperObject] = {}
+        for qh in query_manager.query_handlers:
+            if isinstance(qh, QueryHandlerWorldflipperObject):
+                query_handlers.setdefault(qh.renderer, qh)
+        handlers = []
+        for t in (Character, Equipment):
+            for obj in (manager.dict_of(t) or {}).values():
+                for renderer, qh in query_handlers.items():
+                    ih = qh.with_cache_policy(qh.wikicard_handler(obj, renderer))
+                    if isinstance(ih, ImageHandlerPageScreenshot):
+                        ih.low_priority = True
+                    handlers.append(ih)
+        return handlers
+
+    def start(self) -> bool:
+        if self.running:
+            return False
+        self._task = asyncio.create_task(self.run())
+        return True
+
+    async def _warm_one(self, ih: ImageHandler, progress: WarmupProgress):
+        try:
+            if isinstance(ih, BasicTimerCache) and ih.is_cached() and not await ih.need_recache():
+                progress.skipped += 1
+                return
+            # 不经过 image_flight，避免实时查询合并到低优先级的渲染上
+            await ih.get_data()
+            progress.rendered += 1
+        except Exception as e:
+            progress.failed += 1
+            logger.warning(f'预渲染 {ih.key()} 失败: {e!r}')
+        if progress.processed % 50 == 0:
+            logger.info(f'Wikicard 预渲染进度 {progress}')
+
+    async def run(self):
+        targets = self.targets()
+        progress = self.progress = WarmupProgress(total=len(targets), started_at=time.time())
+        logger.info(f'开始预渲染 {progress.total} 张 Wikicard')
+        queue: asyncio.Queue[ImageHandler] = asyncio.Queue()
+        for ih in targets:
+            queue.put_nowait(ih)
+
+        async def worker():
+            while not queue.empty():
+                await self._warm_one(queue.get_nowait(), progress)
+
+        await asyncio.gather(*[worker() for _ in range(self.concurrency)])
+        progress.finished_at = time.time()
+        logger.info(f'Wikicard 预渲染完成 {progress}')
+
+
+wikicard_warmer = WikicardWarmer(config.query.warmup_concurrency)
+
+
+@update.manager.on_updated
+async def _(changed: set[str]):
+    if config.query.warmup_after_update:
+        wikicard_warmer.start()
+
+
+on_warmup = on_fullmatch(('预渲染', '预渲染进度'), rule=Rule(to_me), permission=SUPERUSER)
+
+
+@on_warmup.handle()
+async def _(bot: Bot, event: Union[Onebot11MessageEvent, RedMessageEvent]):
+    if event.get_plaintext().strip() == '预渲染' and wikicard_warmer.start():
+        await bot.send(event, '已开始预渲染 Wikicard')
+    elif wikicard_warmer.progress:
+        await bot.send(event, f'{"预渲染中" if wikicard_warmer.running else "预渲染已结束"}: {wikicard_warmer.progress}')
+    else:
+        await bot.send(event, '尚未进行预渲染')
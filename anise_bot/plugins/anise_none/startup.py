@@ -0,0 +1,96 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional
+
+from nonebot import logger, get_driver
+
+from .anise.assets import asset_store
+from .anise.cache import disk_cache
+from .anise.manager import manager
+from .anise.query.alias import alias_manager
+from .models.worldflipper import load_all
+
+
+class Startup:
+    """
+    插件的初始化分阶段在后台进行，不阻塞 Bot 连接到协议端
+    各阶段按注册顺序执行，单个阶段失败只记录日志，不影响后续阶段；
+    全部完成前收到的查询由 ready 判断，直接回复“正在启动”
+    """
+
+    def __init__(self):
+        self.phases: list[tuple[str, Callable[[], Awaitable]]] = []
+        self.timings: dict[str, float] = {}
+        self.failed: list[str] = []
+        self.ready: bool = False
+        self._task: Optional[asyncio.Task] = None
+        self._event: Optional[asyncio.Event] = None
+
+    def phase(self, name: str):
+        """注册一个初始化阶段"""
+
+        def deco(func: Callable[[], Awaitable]):
+            self.phases.append((name, func))
+            return func
+
+        return deco
+
+    def _get_event(self) -> asyncio.Event:
+        if self._event is None:
+            self._event = asyncio.Event()
+        return self._event
+
+    async def run(self):
+        t = time.time()
+        for name, func in self.phases:
+            pt = time.time()
+            try:
+                await func()
+            except Exception as e:
+                self.failed.append(name)
+                logger.opt(exception=e).error(f'初始化阶段 {name} 失败')
+            self.timings[name] = time.time() - pt
+            logger.info(f'初始化阶段 {name} 完成 (耗时{"%.2f" % self.timings[name]}s)')
+        self.ready = True
+        self._get_event().set()
+        logger.success(
+            f'初始化完成 (耗时{"%.2f" % (time.time() - t)}s)' +
+            (f'，失败的阶段: {", ".join(self.failed)}' if self.failed else '')
+        )
+
+    def start(self) -> asyncio.Task:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def wait_ready(self):
+        await self._get_event().wait()
+
+
+startup = Startup()
+
+
+@startup.phase('load_objects')
+async def _():
+    await asyncio.to_thread(load_all, manager)
+
+
+@startup.phase('load_alias')
+async def _():
+    await asyncio.to_thread(alias_manager.init)
+
+
+@startup.phase('disk_cache')
+async def _():
+    await asyncio.to_thread(disk_cache.load)
+    disk_cache.start_autosave()
+    await asyncio.to_thread(asset_store.load)
+    asset_store.start_autosave()
+    removed = await asyncio.to_thread(asset_store.sweep)
+    if removed:
+        logger.info(f'已清理 {removed} 个不再被引用的资源文件')
+
+
+@get_driver().on_startup
+async def _():
+    startup.start()
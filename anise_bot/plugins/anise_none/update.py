@@ -1,11 +1,13 @@
 import abc
+import asyncio
 import dataclasses
+import hashlib
+import json
 import traceback
 import urllib.parse
 from pathlib import Path
-from typing import Union
+from typing import Awaitable, Callable, Optional, Union
 
-import httpx
 from nonebot import logger, on_fullmatch, Bot
 from nonebot.adapters.onebot.v11 import (
 Bot as Onebot11Bot,
@@ -20,6 +22,19 @@ from pydantic import BaseModel
 
 from .anise import config
 from .anise.config import RES_PATH, DATA_PATH
+from .anise.files import file_io
+from .anise.http import http_clients
+
+
+def sha256_of(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def sha256_of_file(path: Path) -> Optional[str]:
+    try:
+        return sha256_of(path.read_bytes())
+    except FileNotFoundError:
+        return None
 
 
 class UpdateEntry(BaseModel, abc.ABC):
@@ -36,47 +51,103 @@ class UpdateManager:
     def __init__(self, url: str = config.METEORHOUSE_URL, query_config_url: str = config.config.query.config_url):
         self.url = url
         self.query_config_url = query_config_url
+        self.state_path: Path = DATA_PATH / 'update_state.json'
+        self.listeners: list[Callable[[set[str]], Awaitable]] = []
+        self._listener_task: Optional[asyncio.Task] = None
+        # 连续两次更新的回调不能交错执行，否则后一次的数据可能被前一次的重新加载覆盖
+        self._listener_lock: asyncio.Lock = asyncio.Lock()
+
+    def on_updated(self, func: Callable[[set[str]], Awaitable]):
+        """注册更新后在后台按注册顺序执行的回调，参数为内容发生变化的 UpdateEntry.key"""
+        self.listeners.append(func)
+        return func
+
+    async def _run_listeners(self, changed: set[str]):
+        async with self._listener_lock:
+            for listener in self.listeners:
+                try:
+                    await listener(changed)
+                except Exception as e:
+                    logger.opt(exception=e).error(f'更新回调 {listener.__qualname__} 执行失败')
+
+    async def _load_state(self) -> dict[str, dict]:
+        data = await file_io.read_bytes_or_none(self.state_path)
+        if data is not None:
+            try:
+                return json.loads(data)
+            except ValueError:
+                pass
+        return {}
 
     @staticmethod
-    async def get_single_file(client: httpx.AsyncClient, url: str, path: Path) -> bool:
+    async def get_single_file(url: str, path: Path, state: dict) -> Optional[bool]:
+        """
+        下载单个文件，state 保存上次的 ETag / Last-Modified / sha256
+        :return: 内容有变化返回 True，没有变化返回 False，失败返回 None
+        """
+        headers = {}
+        exists = await file_io.run(path.exists)
+        if exists:
+            if state.get('etag'):
+                headers['If-None-Match'] = state['etag']
+            if state.get('last_modified'):
+                headers['If-Modified-Since'] = state['last_modified']
         try:
-            response = await client.post(url)
-            print(response)
-            if response.status_code == 200:
-                content = response.content
-                path.parent.mkdir(parents=True, exist_ok=True)
-                path.write_bytes(content)
-                return True
-        except:
+            response = await http_clients.request('POST', url, headers=headers)
+        except Exception:
             traceback.print_exc()
+            return None
+        if response.status_code == 304:
+            return False
+        if response.status_code != 200:
+            return None
+        content = response.content
+        digest = await file_io.run(sha256_of, content)
+        if not state.get('sha256') and exists:
+            state['sha256'] = await file_io.run(sha256_of_file, path)
+        state['etag'] = response.headers.get('etag', '')
+        state['last_modified'] = response.headers.get('last-modified', '')
+        if state.get('sha256') == digest and exists:
             return False
-        return False
+        await file_io.write_bytes(path, content)
+        state['sha256'] = digest
+        return True
 
     @dataclasses.dataclass
     class UpdateEntry:
+        key: str
         url: str
         path: Path
         log_name: str
 
     async def update(self):
-        updated_list = {}
-        async with httpx.AsyncClient() as client:
-            updates: list[UpdateManager.UpdateEntry] = [
-                UpdateManager.UpdateEntry(self.query_config_url, RES_PATH / 'query' / 'config.json', 'Query Config'),
-                UpdateManager.UpdateEntry(urllib.parse.urljoin(self.url, '/bot/update/worldflipper/data/character'), DATA_PATH / 'worldflipper/object' / 'character.json', 'Character Data'),
-                UpdateManager.UpdateEntry(urllib.parse.urljoin(self.url, '/bot/update/worldflipper/data/equipment'), DATA_PATH / 'worldflipper/object' / 'equipment.json', 'Equipment Data'),
-                UpdateManager.UpdateEntry(urllib.parse.urljoin(self.url, '/bot/update/worldflipper/alias/character'), RES_PATH / 'worldflipper/alias' / 'character.json', 'Character Alias'),
-                UpdateManager.UpdateEntry(urllib.parse.urljoin(self.url, '/bot/update/worldflipper/alias/equipment'), RES_PATH / 'worldflipper/alias' / 'equipment.json', 'Equipment Alias'),
-            ]
-            for update_ in updates:
-                logger.info(f'从{update_.url}获取{update_.log_name}...')
-                success = await self.get_single_file(client, update_.url, update_.path)
-                if not success:
-                    updated_list[update_.log_name] = False
-                    logger.warning(f'更新{update_.log_name}失败')
-                else:
-                    updated_list[update_.log_name] = True
-                    logger.info(f'已更新{update_.log_name}!')
+        updates: list[UpdateManager.UpdateEntry] = [
+            UpdateManager.UpdateEntry('query_config', self.query_config_url, RES_PATH / 'query' / 'config.json', 'Query Config'),
+            UpdateManager.UpdateEntry('character_data', urllib.parse.urljoin(self.url, '/bot/update/worldflipper/data/character'), DATA_PATH / 'worldflipper/object' / 'character.json', 'Character Data'),
+            UpdateManager.UpdateEntry('equipment_data', urllib.parse.urljoin(self.url, '/bot/update/worldflipper/data/equipment'), DATA_PATH / 'worldflipper/object' / 'equipment.json', 'Equipment Data'),
+            UpdateManager.UpdateEntry('character_alias', urllib.parse.urljoin(self.url, '/bot/update/worldflipper/alias/character'), RES_PATH / 'worldflipper/alias' / 'character.json', 'Character Alias'),
+            UpdateManager.UpdateEntry('equipment_alias', urllib.parse.urljoin(self.url, '/bot/update/worldflipper/alias/equipment'), RES_PATH / 'worldflipper/alias' / 'equipment.json', 'Equipment Alias'),
+        ]
+        state = await self._load_state()
+
+        async def update_one(update_: UpdateManager.UpdateEntry) -> Optional[bool]:
+            logger.info(f'从{update_.url}获取{update_.log_name}...')
+            result = await self.get_single_file(update_.url, update_.path, state.setdefault(update_.url, {}))
+            if result is None:
+                logger.warning(f'更新{update_.log_name}失败')
+            elif result:
+                logger.info(f'已更新{update_.log_name}!')
+            else:
+                logger.info(f'{update_.log_name}没有变化')
+            return result
+
+        results = await asyncio.gather(*[update_one(x) for x in updates])
+        await file_io.write_bytes(self.state_path, json.dumps(state, ensure_ascii=False, indent=2).encode('utf-8'))
+
+        updated_list = {u.log_name: r is not None for u, r in zip(updates, results)}
+        changed = {u.key for u, r in zip(updates, results) if r}
+        if changed:
+            self._listener_task = asyncio.create_task(self._run_listeners(changed))
         return updated_list
 
 async def to_me(event: Union[Onebot11MessageEvent, RedMessageEvent]):
@@ -1,4 +1,6 @@
 import abc
+import asyncio
+import dataclasses
 import hashlib
 import io
 import random
@@ -6,15 +8,23 @@ import time
 import urllib.parse
 from io import BytesIO
 from pathlib import Path
-from typing import Optional, Callable, Any
+from typing import Optional, Callable, Any, Awaitable, Union
 
 import httpx
 from PIL import Image
+from nonebot import logger
 
 from anise_bot.plugins.anise_none.anise import config
+from anise_bot.plugins.anise_none.anise.cache import disk_cache
 from anise_bot.plugins.anise_none.anise.config import METEORHOUSE_URL
+from anise_bot.plugins.anise_none.anise.files import file_io
+from anise_bot.plugins.anise_none.anise.http import http_clients
 from . import playw
-from .playw import PlaywrightContext
+from .flight import SingleFlight, image_flight
+from .metrics import cache_requests, span
+from .playw import page_pool
+from .transport import image_transport
+from .workers import encode_png, image_pool, is_process_safe, post_process_png, transcode_animation
 
 
 
@@ -31,6 +41,36 @@ except ModuleNotFoundError:
     pass
 
 
+# 进行中的后台刷新，按缓存路径去重，同时保持对 Task 的引用
+_revalidating: dict[str, asyncio.Task] = {}
+
+
+def guess_content_type(data: bytes, default: str = 'image/png') -> str:
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return default
+
+
+@dataclasses.dataclass
+class ImageData:
+    """
+    已编码的图片数据，可以不经过 PIL 直接发送
+    path 为内容与 content 相同的本地文件，发送时可以只传递路径或 URL
+    """
+    content: bytes
+    content_type: str = 'image/png'
+    path: Optional[Path] = None
+
+    def open(self) -> Image.Image:
+        return Image.open(io.BytesIO(self.content))
+
+
 class ImageHandler(abc.ABC):
     @abc.abstractmethod
     async def get(self) -> Optional[Image.Image]:
@@ -40,19 +80,35 @@ class ImageHandler(abc.ABC):
     def key(self) -> str:
         pass
 
+    def flight_key(self) -> str:
+        """合并并发请求用的 key，同 key 同缓存路径的请求只会执行一次"""
+        if isinstance(self, BasicTimerCache) and self.cache_path_getter:
+            return f'{self.key()}@{self.cache_path_getter(self)}'
+        return self.key()
+
     def __str__(self):
         return f'''{self.__class__.__name__}({", ".join([f"""{k}={f'"{v}"' if isinstance(v, str) else v}""" for k, v in self.__dict__.items()])})'''
 
     async def to_io(self, image: Image.Image) -> Optional[io.BytesIO]:
-        buf = BytesIO()
-        image.convert('RGBA').save(buf, format='PNG')
-        return buf
+        return BytesIO(await image_pool.run(encode_png, image))
 
-    async def get_io(self) -> Optional[io.BytesIO]:
+    async def get_data(self) -> Optional[ImageData]:
+        """返回编码后的图片，默认实现经过 PIL 编码，能直接拿到原始数据的子类应当重写"""
         pic = await self.get()
         if not pic:
             return None
-        return await self.to_io(pic)
+        with span('encode', self.__class__.__name__):
+            buf = await self.to_io(pic)
+        return ImageData(buf.getvalue(), 'image/png') if buf else None
+
+    async def get_image(self) -> Optional[ImageData]:
+        return await image_flight.do(self.flight_key(), self.get_data)
+
+    async def get_io(self) -> Optional[io.BytesIO]:
+        data = await self.get_image()
+        if data is None:
+            return None
+        return io.BytesIO(data.content)
 
 
 class ImageHandlerLocalFile(ImageHandler):
@@ -61,15 +117,20 @@ class ImageHandlerLocalFile(ImageHandler):
         self.path: Path = path
 
     def key(self) -> str:
-        pass
+        return f'LocalFile({self.path})'
 
     async def get(self) -> Optional[Image.Image]:
-        return Image.open(self.path)
+        data = await self.get_data()
+        return data.open() if data else None
+
+    async def get_data(self) -> Optional[ImageData]:
+        data = await file_io.read_bytes_or_none(self.path)
+        return ImageData(data, guess_content_type(data), self.path) if data is not None else None
 
 
 class Cacheable(abc.ABC):
     @abc.abstractmethod
-    def cache(self, obj: Any):
+    async def cache(self, obj: Any):
         pass
 
     @abc.abstractmethod
@@ -82,76 +143,135 @@ class Cacheable(abc.ABC):
 
 
 class BasicTimerCache(Cacheable):
+    """
+    缓存文件由 disk_cache 统一登记与淘汰，是否存在、是否过期都只查询索引
+    开启 stale_while_revalidate 后，过期不超过 max_stale 秒的缓存会直接返回，同时在后台刷新
+    """
 
     def __init__(self, cache_path_getter: Optional[Callable[["BasicTimerCache"], Path]], cache_timeout):
         self.cache_path_getter = cache_path_getter
         self.cache_timeout = cache_timeout
-
-    def cache(self, obj: io.BytesIO):
+        self.stale_while_revalidate: bool = False
+        self.max_stale: int = 60 * 60 * 24 * 7
+
+    def cache_file(self) -> Optional[Path]:
+        return Path(self.cache_path_getter(self)) if self.cache_path_getter else None
+
+    async def cache(self, obj: Union[bytes, io.BytesIO]) -> Optional[Path]:
+        """返回写入的缓存文件，没有缓存路径时返回 None"""
+        cache_path = self.cache_file()
+        if cache_path:
+            data = obj if isinstance(obj, bytes) else obj.getvalue()
+            await file_io.run(disk_cache.put, cache_path, data)
+        return cache_path
+
+    async def read_cache(self) -> Optional[bytes]:
+        """缓存文件在索引之外被删除时返回 None"""
         if self.cache_path_getter:
-            cache_path = self.cache_path_getter(self)
-            cache_path.parent.mkdir(parents=True, exist_ok=True)
-            cache_path.write_bytes(obj.getvalue())
+            cache_path = Path(self.cache_path_getter(self))
+            data = await file_io.read_bytes_or_none(cache_path)
+            if data is None:
+                disk_cache.forget(cache_path)
+                return None
+            disk_cache.touch(cache_path)
+            return data
+        return None
 
     def is_cached(self) -> bool:
         if self.cache_path_getter:
-            return Path(self.cache_path_getter(self)).exists()
+            return disk_cache.lookup(Path(self.cache_path_getter(self))) is not None
         return False
 
+    def record_cache(self, result: str):
+        """result 为 hit、stale 或 miss"""
+        cache_requests.inc(cache=self.__class__.__name__, result=result)
+
+    async def read_usable_cache(self, refresh: Callable[[], Awaitable[Any]]) -> Optional[bytes]:
+        """
+        返回可以直接使用的缓存，没有时返回 None，由调用方同步获取
+        过期但仍在 max_stale 之内的缓存会被返回，同时用 refresh 在后台刷新，相同的刷新只会执行一次
+        """
+        if not self.cache_path_getter:
+            return None
+        entry = disk_cache.lookup(Path(self.cache_path_getter(self)))
+        if entry is None:
+            self.record_cache('miss')
+            return None
+        age = time.time() - entry.mtime
+        if self.cache_timeout < 0 or age <= self.cache_timeout:
+            result = 'hit'
+        elif self.stale_while_revalidate and age <= self.cache_timeout + self.max_stale:
+            result = 'stale'
+        else:
+            self.record_cache('miss')
+            return None
+        data = await self.read_cache()
+        self.record_cache(result if data is not None else 'miss')
+        if data is not None and result == 'stale':
+            self.revalidate(refresh)
+        return data
+
+    def revalidate(self, refresh: Callable[[], Awaitable[Any]]):
+        key = str(self.cache_path_getter(self))
+
+        async def run():
+            try:
+                await refresh()
+            except Exception as e:
+                logger.warning(f'后台刷新缓存 {key} 失败: {e!r}')
+
+        if key not in _revalidating:
+            task = asyncio.create_task(run())
+            _revalidating[key] = task
+            task.add_done_callback(lambda _: _revalidating.pop(key, None))
+
     async def need_recache(self):
         if self.cache_path_getter:
-            cache_path = Path(self.cache_path_getter(self))
-            if self.cache_timeout < 0:
-                return False
-            return not cache_path.exists() or cache_path.stat().st_mtime + self.cache_timeout < time.time()
+            return not disk_cache.is_fresh(Path(self.cache_path_getter(self)), self.cache_timeout)
         return False
 
 
 class ImageHandlerNetwork(ImageHandler, BasicTimerCache):
 
     def __init__(
-            self, url: str, timeout: float = 30.0,
+            self, url: str, timeout: Optional[float] = None,
             cache_path_getter: Optional[Callable[["ImageHandlerNetwork"], Path]] = None,
             cache_timeout: int = 60 * 60 * 24
     ):
         super().__init__(cache_path_getter, cache_timeout)
         self.url: str = url
-        self.timeout: float = timeout
+        self.timeout: Optional[float] = timeout
         self.content_type: str = 'image/png'
 
     def key(self) -> str:
         return f'Network({self.url})'
 
     async def get(self) -> Optional[Image.Image]:
+        data = await self.get_data()
+        return data.open() if data else None
+
+    async def get_data(self) -> Optional[ImageData]:
         if not self.url:
             return None
+        data = await self.read_usable_cache(self.fetch)
+        if data is None:
+            return await self.fetch()
+        self.content_type = guess_content_type(data, self.content_type)
+        return ImageData(data, self.content_type, self.cache_file())
+
+    async def fetch(self) -> Optional[ImageData]:
         try:
-            if await self.need_recache() or not self.is_cached():
-                async with httpx.AsyncClient() as client:
-                    r = await client.get(urllib.parse.urljoin(METEORHOUSE_URL, self.url), timeout=self.timeout)
-                    self.content_type = r.headers['content-type']
-                    if r.status_code // 100 == 2:
-                        img = Image.open(io.BytesIO(r.content))
-                        self.cache(await self.to_io(img))
-                        return img
-                    else:
-                        return None
-            else:
-                path = self.cache_path_getter(self)
-                img: Image.Image = Image.open(path)
-                if path.suffix == '.gif':
-                    self.content_type = 'image/gif'
-                return img
-        except TimeoutError:
+            with span('network', self.__class__.__name__):
+                r = await http_clients.request(
+                    'GET', urllib.parse.urljoin(METEORHOUSE_URL, self.url), timeout=self.timeout
+                )
+        except (httpx.HTTPError, TimeoutError):
             return None
-
-    async def to_io(self, image: Image.Image) -> Optional[io.BytesIO]:
-        if self.content_type == 'image/gif':
-            buf = io.BytesIO()
-            image.save(buf, format='GIF', save_all=True, loop=0, disposal=2)
-            return buf
-        else:
-            return await super().to_io(image)
+        if r.status_code // 100 == 2:
+            self.content_type = guess_content_type(r.content, r.headers.get('content-type', self.content_type))
+            # 原样缓存下载到的数据，不再经过 PIL 解码与重新编码
+            return ImageData(r.content, self.content_type, await self.cache(r.content))
+        return None
 
 
 class ImageHandlerPageScreenshot(ImageHandler, BasicTimerCache):
@@ -169,27 +289,30 @@ class ImageHandlerPageScreenshot(ImageHandler, BasicTimerCache):
         self.timeout: float = timeout
         self.selector: str = selector
         self.kwargs: dict = kwargs
+        self.low_priority: bool = False
 
     def key(self) -> str:
         return f'PageScreenshot({self.url}, {self.selector})'
 
     async def get(self) -> Optional[Image.Image]:
-        try:
-            if await self.need_recache() or not self.is_cached():
-                async with PlaywrightContext(**self.kwargs) as context:
-                    page = await context.new_page()
-                    await page.goto(self.url, wait_until='networkidle')
-                    # await page.wait_for_timeout(1000)
-                    loc = page.locator(self.selector)
-                    img = await loc.screenshot(type='png', omit_background=True)
-                img = Image.open(io.BytesIO(img)).convert('RGBA')
-                self.cache(await self.to_io(img))
-                return img
-            else:
-                img = Image.open(self.cache_path_getter(self))
-                return img
-        except Exception as e:
-            raise e
+        data = await self.get_data()
+        return data.open() if data else None
+
+    async def get_data(self) -> Optional[ImageData]:
+        data = await self.read_usable_cache(self.fetch)
+        if data is None:
+            return await self.fetch()
+        return ImageData(data, 'image/png', self.cache_file())
+
+    async def fetch(self) -> Optional[ImageData]:
+        with span('render', self.__class__.__name__):
+            async with page_pool.page(self.low_priority, **self.kwargs) as page:
+                await page.goto(self.url, wait_until='networkidle')
+                # await page.wait_for_timeout(1000)
+                loc = page.locator(self.selector)
+                img = await loc.screenshot(type='png', omit_background=True)
+        # 截图本身就是 RGBA 的 PNG，直接缓存与发送
+        return ImageData(img, 'image/png', await self.cache(img))
 
 
 class ImageHandlerPostProcessor(ImageHandler):
@@ -199,44 +322,107 @@ class ImageHandlerPostProcessor(ImageHandler):
         self.post_process: Callable[[Image.Image], Image.Image] = post_process
 
     async def get(self) -> Optional[Image.Image]:
-        img = await self.ih.get()
-        # return self.post_process(img, self.ih)
-        return self.post_process(img)
+        data = await self.get_data()
+        return data.open() if data else None
+
+    async def get_data(self) -> Optional[ImageData]:
+        data = await self.ih.get_data()
+        if data is None:
+            return None
+        # 解码、后处理与编码都在 image_pool 中完成
+        with span('post_process', self.post_process.__qualname__):
+            content = await image_pool.run(
+                post_process_png, data.content, self.post_process,
+                process_safe=is_process_safe(self.post_process)
+            )
+        return ImageData(content, 'image/png')
 
     def key(self) -> str:
         return self.ih.key()
 
+    def flight_key(self) -> str:
+        return f'PostProcess({self.ih.flight_key()}, {self.post_process.__qualname__})'
+
+
+class ImageHandlerAnimation(ImageHandler):
+    """
+    动图默认原样发送；超过 config.animation.max_size_kb 时转码，
+    结果按原图内容与转码参数缓存，原图更新后自动使用新的缓存
+    """
+
+    def __init__(self, ih: ImageHandler):
+        self.ih: ImageHandler = ih
+
+    def key(self) -> str:
+        return self.ih.key()
+
+    def flight_key(self) -> str:
+        return f'Animation({self.ih.flight_key()})'
+
+    @staticmethod
+    def variant() -> str:
+        c = config.config.animation
+        return f'{c.max_size_kb}k_s{c.min_scale:g}_f{c.max_frame_step}.{c.format}'
+
+    async def get(self) -> Optional[Image.Image]:
+        data = await self.get_data()
+        return data.open() if data else None
+
+    async def get_data(self) -> Optional[ImageData]:
+        c = config.config.animation
+        data = await self.ih.get_data()
+        max_bytes = c.max_size_kb * 1024
+        if data is None or max_bytes <= 0 or len(data.content) <= max_bytes \
+                or data.content_type not in ('image/gif', 'image/webp'):
+            return data
+        digest = hashlib.sha256(data.content).hexdigest()[:32]
+        cache_path = config.RES_PATH / 'query' / 'cache' / 'animation' / digest / self.variant()
+        if disk_cache.lookup(cache_path):
+            content = await file_io.read_bytes_or_none(cache_path)
+            if content is not None:
+                disk_cache.touch(cache_path)
+                cache_requests.inc(cache=self.__class__.__name__, result='hit')
+                return ImageData(content, guess_content_type(content), cache_path)
+            disk_cache.forget(cache_path)
+        cache_requests.inc(cache=self.__class__.__name__, result='miss')
+        with span('transcode', self.__class__.__name__):
+            content = await image_pool.run(
+                transcode_animation, data.content, max_bytes, c.format, c.min_scale, c.max_frame_step
+            )
+        if len(content) >= len(data.content):
+            # 转码没有变小，仍然发送原图
+            return data
+        await file_io.run(disk_cache.put, cache_path, content)
+        return ImageData(content, guess_content_type(content), cache_path)
+
 
 class MessageCard:
-    def __init__(self, text='', image_handler=None, exception=''):
+    def __init__(self, text='', image_handler=None, exception='', guess=None):
         self.text: str = text
         self.image_handler: Optional[ImageHandler] = image_handler
         self.kwargs: dict = {}
         self.exception: str = exception
+        self.guess: list[str] = guess or []
 
     @staticmethod
-    def get_message_precontent(id_: str):
+    def get_message_precontent(id_: str, default: Optional[str] = None):
         c = config.message_contents.get(id_)
         if isinstance(c, list):
             return random.choice(c)
         elif isinstance(c, str):
             return c
         else:
-            return id_
-
-    async def to_message_onebot11(self, start_time=None) -> "Onebot11Message":
-        from nonebot.adapters.onebot.v11 import Message, MessageSegment
-        msg = Message()
-        img_exists = False
-        if self.image_handler:
-            img = await self.image_handler.get_io()
-            if img:
-                img_exists = True
-                msg += MessageSegment.image(img)
+            return id_ if default is None else default
 
+    def get_content(self, img_exists: bool, start_time=None) -> str:
         content = ''
         if not img_exists and not self.text:
-            content += self.get_message_precontent('worldflipper.query.failed')
+            if self.guess:
+                content += self.get_message_precontent('worldflipper.query.guess').format(
+                    guess_content='、'.join(self.guess)
+                )
+            else:
+                content += self.get_message_precontent('worldflipper.query.failed')
         else:
             content += self.get_message_precontent('worldflipper.query.success')
 
@@ -246,6 +432,19 @@ class MessageCard:
             content += f'\n{self.text}'
         if self.exception:
             content += f'\n{self.exception}'
+        return content
+
+    async def to_message_onebot11(self, start_time=None) -> "Onebot11Message":
+        from nonebot.adapters.onebot.v11 import Message, MessageSegment
+        msg = Message()
+        img_exists = False
+        if self.image_handler:
+            img = await self.image_handler.get_image()
+            if img:
+                img_exists = True
+                msg += MessageSegment.image(await image_transport.onebot11_file(img.content, img.path))
+
+        content = self.get_content(img_exists, start_time)
 
         msg = MessageSegment.text(content) + msg
         msg = msg + self.get_message_precontent('worldflipper.query.suffix')
@@ -256,23 +455,13 @@ class MessageCard:
         msg = Message()
         img_exists = False
         if self.image_handler:
-            img = await self.image_handler.get_io()
+            img = await self.image_handler.get_image()
             if img:
                 img_exists = True
-                msg += MessageSegment.image(img)
+                # Red 协议总是先上传图片内容，直接使用内存中的数据
+                msg += MessageSegment.image(img.content)
 
-        content = ''
-        if not img_exists and not self.text:
-            content += self.get_message_precontent('worldflipper.query.failed')
-        else:
-            content += self.get_message_precontent('worldflipper.query.success')
-
-        if start_time:
-            content += f'(耗时{"%.2f" % (time.time() - start_time)}s)'
-        if self.text:
-            content += f'\n{self.text}'
-        if self.exception:
-            content += f'\n{self.exception}'
+        content = self.get_content(img_exists, start_time)
 
         msg = MessageSegment.text(content) + msg
         msg = msg + self.get_message_precontent('worldflipper.query.suffix')
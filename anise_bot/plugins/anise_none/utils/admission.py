@@ -0,0 +1,176 @@
+import asyncio
+import collections
+import contextlib
+import time
+from typing import AsyncIterator, Hashable, Optional
+
+from ..anise.config import AdmissionConfig, config
+from .metrics import registry
+
+
+admission_rejected = registry.counter('anise_admission_rejected_total', '被准入控制拒绝的查询', ('reason',))
+
+
+class Rejected(Exception):
+    """
+    reason 为 rate_limited 或 overloaded
+    silent 为 True 时不需要回复，避免对刷屏的用户逐条回复
+    """
+
+    def __init__(self, reason: str, silent: bool = False):
+        super().__init__(reason)
+        self.reason: str = reason
+        self.silent: bool = silent
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate: float = rate
+        self.burst: float = burst
+        self.tokens: float = burst
+        self.updated: float = time.monotonic()
+        # 被拒绝后是否已经提示过，拿到令牌后重置
+        self.warned: bool = False
+
+    def allow(self) -> bool:
+        """只检查是否有令牌，不消耗"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens >= 1
+
+    def take(self):
+        self.tokens -= 1
+        self.warned = False
+
+    def idle(self) -> bool:
+        return self.tokens + (time.monotonic() - self.updated) * self.rate >= self.burst
+
+
+class FairQueue:
+    """
+    固定数量的执行槽位，槽位满时按群排队，空出的槽位在有等待的群之间轮流分配，
+    一个群排再多的查询也只能与其他群交替执行
+    """
+
+    def __init__(self, slots: int):
+        self.slots: int = max(1, slots)
+        self.active: int = 0
+        self._queues: collections.OrderedDict[Hashable, collections.deque[asyncio.Future]] = collections.OrderedDict()
+
+    @property
+    def queued(self) -> int:
+        return sum(len(x) for x in self._queues.values())
+
+    @property
+    def queued_keys(self) -> int:
+        return len(self._queues)
+
+    async def acquire(self, key: Hashable):
+        if self.active < self.slots and not self._queues:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(key, collections.deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 槽位已经交给这个调用方，转交给下一个
+                self.release()
+            else:
+                self._discard(key, future)
+            raise
+
+    def _discard(self, key: Hashable, future: asyncio.Future):
+        queue = self._queues.get(key)
+        if queue is not None:
+            with contextlib.suppress(ValueError):
+                queue.remove(future)
+            if not queue:
+                del self._queues[key]
+
+    def release(self):
+        while self._queues:
+            key, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            if not future.done():
+                # active 不变，槽位直接转交
+                future.set_result(None)
+                return
+        self.active -= 1
+
+
+class AdmissionController:
+    """
+    do_query 之前的准入控制：群与用户各自的令牌桶限流，再进入按群轮转的执行队列
+    队列已满或等待超时时立即拒绝，不让请求在后面无限堆积
+    浏览器渲染的并发由 page_pool 限制，网络请求的并发由 http_clients 限制
+    """
+
+    def __init__(self, admission_config: AdmissionConfig):
+        self.config: AdmissionConfig = admission_config
+        self.queue: FairQueue = FairQueue(admission_config.max_concurrent)
+        self._group_buckets: dict[Hashable, TokenBucket] = {}
+        self._user_buckets: dict[Hashable, TokenBucket] = {}
+
+    def _bucket(self, buckets: dict[Hashable, TokenBucket], key: Hashable, rate: float, burst: float) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= self.config.max_buckets:
+                # 令牌已经回满的桶与新建的没有区别，可以丢弃
+                for k in [k for k, b in buckets.items() if b.idle()]:
+                    del buckets[k]
+            bucket = buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+    def _check_rate(self, group_id: Optional[int], user_id: Optional[str]):
+        buckets = []
+        if group_id is not None and self.config.group_rate > 0:
+            buckets.append(self._bucket(self._group_buckets, group_id, self.config.group_rate, self.config.group_burst))
+        if user_id is not None and self.config.user_rate > 0:
+            buckets.append(self._bucket(self._user_buckets, user_id, self.config.user_rate, self.config.user_burst))
+        # 全部允许时才消耗令牌，被用户限流拒绝的查询不占用群的额度
+        for bucket in buckets:
+            if not bucket.allow():
+                silent, bucket.warned = bucket.warned, True
+                admission_rejected.inc(reason='rate_limited')
+                raise Rejected('rate_limited', silent)
+        for bucket in buckets:
+            bucket.take()
+
+    @contextlib.asynccontextmanager
+    async def admit(self, group_id: Optional[int], user_id: Optional[str]) -> AsyncIterator[None]:
+        """拒绝时抛出 Rejected，私聊按用户排队"""
+        if not self.config.enabled:
+            yield
+            return
+        self._check_rate(group_id, user_id)
+        if self.queue.queued >= self.config.max_queue:
+            admission_rejected.inc(reason='overloaded')
+            raise Rejected('overloaded')
+        key = ('group', group_id) if group_id is not None else ('user', user_id)
+        try:
+            await asyncio.wait_for(self.queue.acquire(key), self.config.queue_timeout)
+        except asyncio.TimeoutError:
+            admission_rejected.inc(reason='overloaded')
+            raise Rejected('overloaded')
+        try:
+            yield
+        finally:
+            self.queue.release()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'active': self.queue.active,
+            'queued': self.queue.queued,
+            'queued_groups': self.queue.queued_keys,
+            'slots': self.queue.slots,
+        }
+
+
+admission = AdmissionController(config.admission)
@@ -0,0 +1,49 @@
+import asyncio
+from typing import Any, Awaitable, Callable, TypeVar
+
+T = TypeVar('T')
+
+
+class SingleFlight:
+    """
+    合并相同 key 的并发调用
+    同一时刻相同 key 只会真正执行一次，其余调用方等待同一个结果
+    """
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Future] = {}
+        self.requests: int = 0
+        self.coalesced: int = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        self.requests += 1
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            future.add_done_callback(lambda f: self._done(key, f))
+        else:
+            self.coalesced += 1
+        # 单个调用方被取消时不影响其他等待中的调用方
+        return await asyncio.shield(future)
+
+    def _done(self, key: str, future: asyncio.Future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled():
+            # 所有调用方都已取消时避免 "exception was never retrieved"
+            future.exception()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            'requests': self.requests,
+            'coalesced': self.coalesced,
+            'in_flight': self.in_flight,
+        }
+
+
+image_flight = SingleFlight()
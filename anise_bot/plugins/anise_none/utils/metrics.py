@@ -0,0 +1,167 @@
+import contextlib
+import math
+import threading
+import time
+from typing import Callable, Iterator, Optional, Union
+
+# 与 prometheus_client 的默认值一致，另外补充了几个长尾的桶
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames: tuple[str, ...], values: tuple, extra: str = '') -> str:
+    pairs = [f'{k}="{_escape(v)}"' for k, v in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type_: str = 'untyped'
+
+    def __init__(self, name: str, help_: str, labelnames: tuple[str, ...] = ()):
+        self.name: str = name
+        self.help: str = help_
+        self.labelnames: tuple[str, ...] = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(k, '') for k in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        return iter(())
+
+    def render(self) -> str:
+        return '\n'.join([f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type_}', *self.samples()])
+
+
+class Counter(_Metric):
+    type_ = 'counter'
+
+    def __init__(self, name: str, help_: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help_, labelnames)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted(self.values.items())
+        for key, value in values:
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class Histogram(_Metric):
+    type_ = 'histogram'
+
+    def __init__(self, name: str, help_: str, labelnames: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_, labelnames)
+        self.buckets: tuple[float, ...] = tuple(sorted(buckets)) + (math.inf,)
+        # key -> ([各个桶的计数], sum)
+        self.values: dict[tuple, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self.values.setdefault(key, ([0] * len(self.buckets), [0.0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            total[0] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t, **labels)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = [(key, list(counts), total[0]) for key, (counts, total) in sorted(self.values.items())]
+        for key, counts, total in values:
+            acc = 0
+            for bound, count in zip(self.buckets, counts):
+                acc += count
+                le = 'le="%s"' % _format_value(bound)
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {acc}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, key)} {acc}'
+
+
+class Gauge(_Metric):
+    """值在抓取时由 callback 给出，返回单个数值或 {标签值元组: 数值}"""
+    type_ = 'gauge'
+
+    def __init__(
+            self, name: str, help_: str, callback: Callable[[], Union[float, dict[tuple, float]]],
+            labelnames: tuple[str, ...] = ()
+    ):
+        super().__init__(name, help_, labelnames)
+        self.callback = callback
+
+    def samples(self) -> Iterator[str]:
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in sorted(values.items()):
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'指标 {metric.name} 已被注册')
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help_, labelnames))
+
+    def histogram(self, name: str, help_: str, labelnames: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_, labelnames, buckets))
+
+    def gauge(
+            self, name: str, help_: str, callback: Callable[[], Union[float, dict[tuple, float]]],
+            labelnames: tuple[str, ...] = ()
+    ) -> Gauge:
+        return self._register(Gauge(name, help_, callback, labelnames))
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        return '\n'.join(m.render() for m in self.metrics.values()) + '\n'
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    'anise_stage_seconds', '查询各阶段的耗时', ('stage', 'handler')
+)
+cache_requests = registry.counter(
+    'anise_cache_requests_total', 'BasicTimerCache 的命中情况', ('cache', 'result')
+)
+
+
+def span(stage: str, handler: Optional[str] = ''):
+    """
+    记录一个阶段的耗时，stage 为 route/check/get_message/build_message/network/render/post_process/encode/send 等
+    handler 通常为 QueryHandler 的 type 或 ImageHandler 的类名
+    """
+    return stage_seconds.time(stage=stage, handler=handler or '')
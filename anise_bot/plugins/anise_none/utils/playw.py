@@ -1,9 +1,13 @@
-from typing import Optional
+import asyncio
+import contextlib
+import dataclasses
+import json
+from typing import AsyncIterator, Optional
 
 import playwright
-from playwright.async_api import Browser, BrowserContext
+from playwright.async_api import Browser, BrowserContext, Page
 
-from anise_bot.plugins.anise_none.anise.config import DATA_PATH
+from anise_bot.plugins.anise_none.anise.config import config
 
 _browser: Optional[Browser] = None
 
@@ -18,33 +22,185 @@ async def init(proxy=None, **kwargs) -> Browser:
 
 
 async def get_browser(**kwargs) -> Browser:
+    if _browser and not _browser.is_connected():
+        return await init(**kwargs)
     return _browser or await init(**kwargs)
 
 
-class PlaywrightContext:
-    def __init__(self, **kwargs):
-        self.kwargs = kwargs
-        self.store_path = DATA_PATH / 'state.json'
-        self.context: Optional[BrowserContext] = None
+@dataclasses.dataclass
+class _PooledPage:
+    context: BrowserContext
+    page: Page
+    uses: int = 0
+    key: str = ''
 
-    async def __aenter__(self):
-        b = await get_browser(**self.kwargs)
 
-        self.store_path.parent.mkdir(parents=True, exist_ok=True)
-        self.store_path.write_text('{}', encoding='utf-8')
-        print(self.store_path)
+class PagePool:
+    """
+    常驻的 BrowserContext / Page 池
+    每个槽位持有一个独立的 Context 与 Page，渲染结束后归还复用，不再每次新建 Context 与读写 state.json
+    借出时的 kwargs 作为 new_context 的参数，空闲的 Page 按 kwargs 分开存放，只会借给参数相同的调用方；
+    启动浏览器使用池的 launch_kwargs；归还时清空当前页面的 Storage 与 Context 的 Cookie
+    """
 
+    def __init__(
+            self, size: int = 2, max_uses: int = 100, health_check_timeout: float = 5.0,
+            launch_kwargs: Optional[dict] = None
+    ):
+        self.size: int = max(1, size)
+        self.launch_kwargs: dict = launch_kwargs or {}
+        self.max_uses: int = max_uses
+        self.health_check_timeout: float = health_check_timeout
+        self._idle: dict[str, list[_PooledPage]] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._condition: Optional[asyncio.Condition] = None
+        self.in_use: int = 0
+        self.waiting: int = 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.size)
+        return self._semaphore
+
+    def _get_condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def _notify(self):
+        async with self._get_condition():
+            self._get_condition().notify_all()
+
+    @property
+    def idle(self) -> int:
+        return sum(len(x) for x in self._idle.values())
+
+    @staticmethod
+    def _key_of(kwargs: dict) -> str:
+        return json.dumps(kwargs, sort_keys=True, default=str)
+
+    async def _new_page(self, **kwargs) -> _PooledPage:
+        b = await get_browser(**self.launch_kwargs)
         try:
-            self.context = await b.new_context(storage_state=self.store_path)
+            context = await b.new_context(**kwargs)
         except Exception:
-            b = await init(**self.kwargs)
-            self.context = await b.new_context(storage_state=self.store_path)
-        return self.context
+            b = await init(**self.launch_kwargs)
+            context = await b.new_context(**kwargs)
+        page = await context.new_page()
+        return _PooledPage(context, page)
 
-    async def __aexit__(self, exc_type, exc_val, exc_tb):
-        await self.context.storage_state(path=self.store_path)
-        await self.context.close()
+    async def _is_healthy(self, pooled: _PooledPage) -> bool:
+        if pooled.uses >= self.max_uses or pooled.page.is_closed():
+            return False
+        browser = pooled.context.browser
+        if not browser or not browser.is_connected():
+            return False
+        try:
+            await asyncio.wait_for(pooled.page.evaluate('1'), timeout=self.health_check_timeout)
+        except Exception:
+            return False
+        return True
+
+    async def _reset(self, pooled: _PooledPage):
+        """Page 只访问过当前的源，清空它的 Storage 后回到空白页"""
+        await asyncio.wait_for(
+            pooled.page.evaluate('() => { try { localStorage.clear(); sessionStorage.clear(); } catch (e) {} }'),
+            timeout=self.health_check_timeout
+        )
+        await pooled.page.goto('about:blank')
+        await pooled.context.clear_cookies()
+
+    @staticmethod
+    async def _discard(pooled: _PooledPage):
+        try:
+            await pooled.context.close()
+        except Exception:
+            pass
+
+    async def acquire(self, low_priority: bool = False, **kwargs) -> _PooledPage:
+        semaphore = self._get_semaphore()
+        if low_priority:
+            # 低优先级的借出总是让正在等待的请求先行，并且至少留出一个 Page 给实时查询
+            async with self._get_condition():
+                await self._get_condition().wait_for(
+                    lambda: not self.waiting and self.in_use < max(1, self.size - 1)
+                )
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+            await self._notify()
+        self.in_use += 1
+        try:
+            idle = self._idle.get(self._key_of(kwargs), [])
+            while idle:
+                pooled = idle.pop()
+                if await self._is_healthy(pooled):
+                    break
+                await self._discard(pooled)
+            else:
+                pooled = await self._new_page(**kwargs)
+                pooled.key = self._key_of(kwargs)
+        except BaseException:
+            self.in_use -= 1
+            semaphore.release()
+            raise
+        return pooled
+
+    async def release(self, pooled: _PooledPage, broken: bool = False):
+        pooled.uses += 1
+        try:
+            if broken or pooled.uses >= self.max_uses or pooled.page.is_closed():
+                await self._discard(pooled)
+            else:
+                try:
+                    await self._reset(pooled)
+                    if self.idle >= self.size:
+                        # kwargs 不同的 Page 分开存放，总数仍不超过 size，丢弃数量最多的一组中最久未用的
+                        pages = max(self._idle.values(), key=len)
+                        await self._discard(pages.pop(0))
+                    self._idle.setdefault(pooled.key, []).append(pooled)
+                except Exception:
+                    await self._discard(pooled)
+        finally:
+            self.in_use -= 1
+            self._get_semaphore().release()
+            await self._notify()
+
+    @contextlib.asynccontextmanager
+    async def page(self, low_priority: bool = False, **kwargs) -> AsyncIterator[Page]:
+        """从池中借出一个 Page，出错的 Page 不会被归还复用"""
+        pooled = await self.acquire(low_priority, **kwargs)
+        broken = False
+        try:
+            yield pooled.page
+        except BaseException:
+            broken = True
+            raise
+        finally:
+            await self.release(pooled, broken)
+
+    async def close(self):
+        idle, self._idle = self._idle, {}
+        for pooled in [x for pages in idle.values() for x in pages]:
+            await self._discard(pooled)
+
+
+page_pool = PagePool(
+    config.playwright.pool_size,
+    config.playwright.page_max_uses,
+    config.playwright.health_check_timeout,
+    {'proxy': config.playwright.proxy or None, **config.playwright.launch_options}
+)
 
 
 async def del_browser():
-    del _browser
+    global _browser
+    await page_pool.close()
+    if _browser:
+        try:
+            await _browser.close()
+        except Exception:
+            pass
+    _browser = None
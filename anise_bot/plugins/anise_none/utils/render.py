@@ -0,0 +1,269 @@
+import collections
+import dataclasses
+import functools
+import io
+import os
+import threading
+from typing import Callable, Hashable, Optional, Union
+
+from PIL import Image, ImageDraw, ImageFont
+
+from ..anise.config import config
+from .workers import encode_png
+
+# 以下函数会在 image_pool 的 worker 中执行，参数只使用可以 pickle 的简单类型
+
+ELEMENT_COLORS: dict[int, tuple[int, int, int]] = {
+    -1: (160, 160, 160),
+    0: (230, 90, 70),
+    1: (70, 140, 230),
+    2: (230, 190, 50),
+    3: (90, 190, 100),
+    4: (240, 220, 150),
+    5: (140, 90, 190),
+}
+
+Font = Union[ImageFont.FreeTypeFont, ImageFont.ImageFont]
+
+
+@functools.lru_cache(maxsize=16)
+def load_font(size: int) -> Font:
+    """优先使用 config.query.font_path，Pillow 自带的字体不包含中文"""
+    if config.query.font_path:
+        try:
+            return ImageFont.truetype(config.query.font_path, size)
+        except OSError:
+            pass
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        # Pillow 10.1 之前的 load_default 不支持字号
+        return ImageFont.load_default()
+
+
+class ImageCache:
+    """
+    只缓存成功读取的图片，key 中带有文件的修改时间：
+    之后才下载到的图片与被替换的图片都会在下一次绘制时读取
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize: int = maxsize
+        self._images: collections.OrderedDict[Hashable, Image.Image] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str, args: Hashable, load: Callable[[], Optional[Image.Image]]) -> Optional[Image.Image]:
+        try:
+            key = (path, args, os.stat(path).st_mtime_ns)
+        except OSError:
+            return None
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                return image
+        image = load()
+        if image is not None:
+            with self._lock:
+                self._images[key] = image
+                while len(self._images) > self.maxsize:
+                    self._images.popitem(last=False)
+        return image
+
+
+_icons = ImageCache(256)
+_arts = ImageCache(64)
+
+
+def _open_icon(path: str, size: int) -> Optional[Image.Image]:
+    try:
+        with Image.open(path) as icon:
+            return icon.convert('RGBA').resize((size, size), Image.LANCZOS)
+    except (OSError, ValueError):
+        return None
+
+
+def load_icon(path: str, size: int) -> Optional[Image.Image]:
+    return _icons.get(path, size, lambda: _open_icon(path, size))
+
+
+def draw_icon(image: Image.Image, xy: tuple[int, int], size: int, path: Optional[str], element: int):
+    """本地没有图标时用属性颜色的方块代替"""
+    icon = load_icon(path, size) if path else None
+    if icon:
+        image.paste(icon, xy, icon)
+    else:
+        ImageDraw.Draw(image).rounded_rectangle(
+            (xy[0], xy[1], xy[0] + size - 1, xy[1] + size - 1), radius=size // 6,
+            fill=ELEMENT_COLORS.get(element, ELEMENT_COLORS[-1])
+        )
+
+
+def fit_text(draw: ImageDraw.ImageDraw, text: str, font: Font, width: int) -> str:
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + '…', font=font) > width:
+        text = text[:-1]
+    return text + '…'
+
+
+@dataclasses.dataclass
+class PartyRow:
+    code: str
+    title: str
+    # (图标路径, 属性)，路径为 None 或文件不存在时画属性色块
+    icons: list[tuple[Optional[str], int]]
+
+
+@functools.lru_cache(maxsize=8192)
+def char_width(font: Font, ch: str) -> float:
+    return font.getlength(ch)
+
+
+def wrap_text(text: str, font: Font, width: int) -> list[str]:
+    """按字符折行，中文没有空格可以断开；逐字累加宽度，忽略字距调整"""
+    lines = []
+    for paragraph in text.splitlines() or ['']:
+        line, line_w = '', 0.0
+        for ch in paragraph:
+            w = char_width(font, ch)
+            if line and line_w + w > width:
+                lines.append(line)
+                line, line_w = '', 0.0
+            line += ch
+            line_w += w
+        lines.append(line)
+    return lines
+
+
+def encode_card(image: Image.Image) -> bytes:
+    """卡片没有透明区域，保存为 RGB 并降低压缩等级，编码耗时约为 encode_png 的一半"""
+    buf = io.BytesIO()
+    image.convert('RGB').save(buf, format='PNG', compress_level=3)
+    return buf.getvalue()
+
+
+def _open_art(path: str, size: tuple[int, int]) -> Optional[Image.Image]:
+    try:
+        with Image.open(path) as art:
+            art = art.convert('RGBA')
+    except (OSError, ValueError):
+        return None
+    art.thumbnail(size, Image.LANCZOS)
+    return art
+
+
+def first_image(paths: tuple[str, ...], size: tuple[int, int]) -> Optional[Image.Image]:
+    """按顺序取第一张能打开的图片，缩放到 size 以内并保持比例"""
+    for path in paths:
+        art = _arts.get(path, size, lambda: _open_art(path, size))
+        if art is not None:
+            return art
+    return None
+
+
+@dataclasses.dataclass
+class CardLayout:
+    """wikicard 的版式，不同对象使用不同的模板"""
+    width: int = 720
+    padding: int = 24
+    art_size: tuple[int, int] = (200, 280)
+    title_size: int = 32
+    heading_size: int = 20
+    body_size: int = 18
+    line_spacing: int = 6
+    section_spacing: int = 16
+
+
+CHARACTER_LAYOUT = CardLayout()
+EQUIPMENT_LAYOUT = CardLayout(art_size=(160, 160))
+
+
+@dataclasses.dataclass
+class WikiCard:
+    title: str
+    # 标题下方的短信息，例如稀有度、属性、类型
+    tags: list[str]
+    element: int
+    art_paths: list[str]
+    # (小标题, 正文)
+    sections: list[tuple[str, str]]
+
+
+def render_wikicard(card: WikiCard, layout: CardLayout = CHARACTER_LAYOUT) -> bytes:
+    title_font, heading_font, body_font = (
+        load_font(layout.title_size), load_font(layout.heading_size), load_font(layout.body_size)
+    )
+    color = ELEMENT_COLORS.get(card.element, ELEMENT_COLORS[-1])
+    art = first_image(tuple(card.art_paths), layout.art_size)
+    art_w, art_h = art.size if art else (layout.art_size[0], layout.art_size[0])
+    text_w = layout.width - layout.padding * 2
+
+    # 先排版再按实际高度创建画布
+    header_x = layout.padding * 2 + art_w
+    header_lines = wrap_text(card.title, title_font, layout.width - header_x - layout.padding)
+    header_h = max(
+        art_h,
+        (layout.title_size + layout.line_spacing) * len(header_lines) + (layout.body_size + layout.line_spacing) * len(card.tags)
+    )
+    blocks = [
+        (heading, wrap_text(body, body_font, text_w))
+        for heading, body in card.sections if body
+    ]
+    body_h = sum(
+        (layout.heading_size + layout.line_spacing) * bool(heading)
+        + (layout.body_size + layout.line_spacing) * len(lines) + layout.section_spacing
+        for heading, lines in blocks
+    )
+    height = layout.padding * 3 + header_h + body_h
+
+    image = Image.new('RGBA', (layout.width, height), (255, 255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, layout.width, 8), fill=color)
+    y = layout.padding
+    if art:
+        image.paste(art, (layout.padding, y), art)
+    else:
+        draw_icon(image, (layout.padding, y), art_w, None, card.element)
+    ty = y
+    for line in header_lines:
+        draw.text((header_x, ty), line, (30, 30, 30), title_font)
+        ty += layout.title_size + layout.line_spacing
+    for tag in card.tags:
+        draw.text((header_x, ty), tag, (90, 90, 90), body_font)
+        ty += layout.body_size + layout.line_spacing
+
+    y += header_h + layout.padding
+    for heading, lines in blocks:
+        if heading:
+            draw.rectangle((layout.padding, y + 2, layout.padding + 4, y + layout.heading_size), fill=color)
+            draw.text((layout.padding + 12, y), heading, (40, 40, 40), heading_font)
+            y += layout.heading_size + layout.line_spacing
+        for line in lines:
+            draw.text((layout.padding, y), line, (70, 70, 70), body_font)
+            y += layout.body_size + layout.line_spacing
+        y += layout.section_spacing
+    return encode_card(image)
+
+
+def render_party_page(title: str, rows: list[PartyRow], footer: str = '', width: int = 640) -> bytes:
+    padding, header_h, row_h, icon_size = 16, 48, 64, 44
+    height = padding * 2 + header_h + row_h * len(rows) + (32 if footer else 0)
+    image = Image.new('RGBA', (width, height), (240, 240, 240, 255))
+    draw = ImageDraw.Draw(image)
+    title_font, text_font, code_font = load_font(24), load_font(18), load_font(20)
+    draw.text((padding, padding + 8), fit_text(draw, title, title_font, width - padding * 2), (40, 40, 40), title_font)
+
+    y = padding + header_h
+    for i, row in enumerate(rows):
+        draw.rectangle((padding, y, width - padding, y + row_h - 4), fill=(255, 255, 255) if i % 2 == 0 else (248, 248, 248))
+        icons_w = (icon_size + 4) * len(row.icons)
+        for j, (path, element) in enumerate(row.icons):
+            draw_icon(image, (width - padding - 8 - icons_w + j * (icon_size + 4), y + (row_h - 4 - icon_size) // 2), icon_size, path, element)
+        draw.text((padding + 12, y + 8), row.code, (60, 110, 200), code_font)
+        text_w = width - padding * 2 - 24 - icons_w - 8
+        draw.text((padding + 12, y + 34), fit_text(draw, row.title, text_font, text_w), (70, 70, 70), text_font)
+        y += row_h
+    if footer:
+        draw.text((padding, y + 6), footer, (120, 120, 120), text_font)
+    return encode_png(image)
@@ -0,0 +1,135 @@
+import contextlib
+import hashlib
+import hmac
+import os
+import shutil
+import threading
+import time
+import urllib.parse
+from pathlib import Path
+from typing import Optional, Union
+
+from nonebot.drivers import Request, Response
+
+from ..anise.config import RES_PATH, ImageTransportConfig, config
+from ..anise.files import file_io
+from ..anise.storage import atomic_write_bytes
+from .metrics import registry
+
+images_sent = registry.counter('anise_images_sent_total', '按发送方式统计的图片数', ('mode',))
+
+
+class ImageTransport:
+    """
+    决定 OneBot V11 的图片段以什么形式发送
+    本地有对应文件的图片可以只发送 file:// 路径或签名后的链接，协议端自行读取，
+    避免每次回复都把整张图片 base64 编码进消息
+    缓存文件随时可能被淘汰或替换，发送的总是 spool 目录中按内容命名的副本（优先硬链接），
+    副本在最后一次发送 spool_ttl 秒后删除
+    """
+
+    def __init__(self, transport_config: ImageTransportConfig, root: Path = RES_PATH):
+        self.config: ImageTransportConfig = transport_config
+        self.root: Path = root
+        self.spool_root: Path = root / '.transport'
+        self._secret: bytes = transport_config.secret.encode('utf-8') or os.urandom(32)
+        self._swept_at: float = 0.0
+        self._sweep_lock = threading.Lock()
+
+    def sign(self, key: str) -> str:
+        return hmac.new(self._secret, key.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+    def key_of(self, path: Path) -> Optional[str]:
+        """RES_PATH 之外的文件不提供链接"""
+        relpath = os.path.relpath(os.path.abspath(path), os.path.abspath(self.root))
+        if relpath.startswith('..') or os.path.isabs(relpath):
+            return None
+        return Path(relpath).as_posix()
+
+    def url_of(self, path: Path) -> Optional[str]:
+        if not self.config.base_url:
+            return None
+        key = self.key_of(path)
+        if key is None:
+            return None
+        query = urllib.parse.urlencode({'k': key, 's': self.sign(key)})
+        return f'{self.config.base_url.rstrip("/")}{self.config.path}?{query}'
+
+    def spool(self, content: bytes, path: Path) -> Path:
+        """在文件线程中执行，返回内容与 content 相同的副本"""
+        spooled = self.spool_root / f'{hashlib.sha256(content).hexdigest()[:32]}{path.suffix}'
+        if spooled.exists():
+            os.utime(spooled)
+        else:
+            spooled.parent.mkdir(parents=True, exist_ok=True)
+            tmp = spooled.parent / f'.{spooled.name}.{os.urandom(6).hex()}.tmp'
+            try:
+                try:
+                    os.link(path, tmp)
+                except OSError:
+                    shutil.copyfile(path, tmp)
+                # 链接之前文件已经被替换时改为写入手上的内容
+                if os.stat(tmp).st_size == len(content):
+                    os.replace(tmp, spooled)
+                else:
+                    os.unlink(tmp)
+                    atomic_write_bytes(spooled, content)
+            except OSError:
+                with contextlib.suppress(OSError):
+                    os.unlink(tmp)
+                atomic_write_bytes(spooled, content)
+        self.sweep()
+        return spooled
+
+    def sweep(self):
+        now = time.time()
+        if now - self._swept_at < self.config.spool_ttl / 2 or not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._swept_at = now
+            for spooled in self.spool_root.glob('*'):
+                with contextlib.suppress(OSError):
+                    if now - spooled.stat().st_mtime > self.config.spool_ttl:
+                        spooled.unlink()
+        finally:
+            self._sweep_lock.release()
+
+    async def onebot11_file(self, content: bytes, path: Optional[Path]) -> Union[str, bytes]:
+        """返回 MessageSegment.image 的 file 参数，无法固定副本时退回为内容本身"""
+        mode = self.config.mode
+        if path is not None and mode in ('file', 'http') and (mode == 'file' or self.config.base_url):
+            try:
+                spooled = await file_io.run(self.spool, content, path)
+            except OSError:
+                spooled = None
+            if spooled is not None and mode == 'file':
+                images_sent.inc(mode='file')
+                return spooled.resolve().as_uri()
+            url = self.url_of(spooled) if spooled is not None else None
+            if url:
+                images_sent.inc(mode='http')
+                return url
+        images_sent.inc(mode='bytes')
+        return content
+
+    def resolve(self, key: str, signature: str) -> Optional[Path]:
+        """只提供 spool 目录中的文件"""
+        if not key or not hmac.compare_digest(self.sign(key), signature):
+            return None
+        path = self.root / key
+        return path if self.key_of(path) == key and path.parent == self.spool_root else None
+
+    async def endpoint(self, request: Request) -> Response:
+        from . import guess_content_type
+        path = self.resolve(request.url.query.get('k', ''), request.url.query.get('s', ''))
+        data = await file_io.read_bytes_or_none(path) if path else None
+        if data is None:
+            return Response(404)
+        return Response(
+            200,
+            headers={'Content-Type': guess_content_type(data), 'Cache-Control': 'private, max-age=600'},
+            content=data
+        )
+
+
+image_transport = ImageTransport(config.image_transport)
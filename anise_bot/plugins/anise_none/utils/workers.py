@@ -0,0 +1,161 @@
+import asyncio
+import concurrent.futures
+import io
+import multiprocessing
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional, TypeVar
+
+from PIL import Image, ImageSequence
+from nonebot import logger
+
+from ..anise.config import config
+
+T = TypeVar('T')
+
+
+class ImageWorkerPool:
+    """
+    CPU 密集的 PIL 操作（后处理、编码）统一交给这里执行，事件循环只等待结果
+    kind 为 thread 或 process，排队中与执行中的任务总数不超过 max_queue，满了以后调用方在这里等待
+    process 模式的进程以 spawn 启动（主进程有事件循环与各种线程，fork 出的子进程可能继承被占用的锁），
+    参数与返回值都要能被 pickle，不满足的任务（局部函数、多帧图片等）以 process_safe=False 提交，总是在线程中执行
+    """
+
+    def __init__(self, kind: str = 'thread', workers: int = 2, max_queue: int = 32):
+        if kind not in ('thread', 'process'):
+            raise ValueError(f'未知的 worker 类型: {kind}')
+        self.kind: str = kind
+        self.workers: int = max(1, workers)
+        self.max_queue: int = max(self.workers, max_queue)
+        self.running: int = 0
+        self.waiting: int = 0
+        self._threads: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._processes: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _executor(self, process: bool) -> concurrent.futures.Executor:
+        if process and self.kind == 'process':
+            if self._processes is None:
+                self._processes = concurrent.futures.ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker
+                )
+            return self._processes
+        if self._threads is None:
+            self._threads = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix='anise-image')
+        return self._threads
+
+    async def run(self, fn: Callable[..., T], *args: Any, process_safe: bool = True) -> T:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_queue)
+        loop = asyncio.get_running_loop()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            try:
+                return await loop.run_in_executor(self._executor(process_safe), fn, *args)
+            except BrokenProcessPool:
+                logger.opt(exception=True).warning('图片 worker 进程池不可用，改为使用线程')
+                self.kind = 'thread'
+                self._processes = None
+                return await loop.run_in_executor(self._executor(False), fn, *args)
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict[str, int]:
+        return {'workers': self.workers, 'max_queue': self.max_queue, 'running': self.running, 'waiting': self.waiting}
+
+    def shutdown(self):
+        for executor in (self._threads, self._processes):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self._threads = self._processes = None
+
+
+def _init_worker():
+    # spawn 出的进程会重新导入任务函数所在的模块，插件包在导入时需要已经初始化的 nonebot
+    import nonebot
+    nonebot.init(driver='~none')
+
+
+# 以下函数会在 worker 中执行，需要保持在模块顶层以便 pickle
+
+def encode_png(image: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    image.convert('RGBA').save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def _animation_frames(image: Image.Image) -> tuple[list[Image.Image], list[int]]:
+    frames, durations = [], []
+    for frame in ImageSequence.Iterator(image):
+        frames.append(frame.convert('RGBA'))
+        durations.append(frame.info.get('duration', image.info.get('duration', 100)) or 100)
+    return frames, durations
+
+
+def _encode_animation(
+        frames: list[Image.Image], durations: list[int], fmt: str, loop: Optional[int], scale: float, step: int
+) -> bytes:
+    # 跳过的帧的时长并入保留的帧，总时长不变；像素图用最近邻缩放保持清晰
+    # loop 为 None 表示原图只播放一次：GIF 不写循环扩展，WebP 没有对应写法，播放次数写为 1
+    kept, kept_durations = [], []
+    for i in range(0, len(frames), step):
+        frame = frames[i]
+        if scale < 1:
+            frame = frame.resize((max(1, round(frame.width * scale)), max(1, round(frame.height * scale))), Image.NEAREST)
+        kept.append(frame)
+        kept_durations.append(sum(durations[i:i + step]))
+    buf = io.BytesIO()
+    if fmt == 'webp':
+        kept[0].save(
+            buf, format='WEBP', save_all=True, append_images=kept[1:], duration=kept_durations,
+            loop=1 if loop is None else loop, quality=80, method=4
+        )
+    else:
+        kwargs = {} if loop is None else {'loop': loop}
+        kept[0].save(
+            buf, format='GIF', save_all=True, append_images=kept[1:], duration=kept_durations,
+            disposal=2, optimize=True, **kwargs
+        )
+    return buf.getvalue()
+
+
+def transcode_animation(data: bytes, max_bytes: int, fmt: str, min_scale: float, max_frame_step: int) -> bytes:
+    """
+    把动图压缩到 max_bytes 以内，先换格式，再依次缩小尺寸、减少帧数，
+    都无法满足时返回其中最小的结果
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        loop = image.info.get('loop')
+        frames, durations = _animation_frames(image)
+    scales = [1.0]
+    while scales[-1] * 0.75 >= min_scale:
+        scales.append(scales[-1] * 0.75)
+    best = data
+    for step in range(1, max(1, max_frame_step) + 1):
+        for scale in scales:
+            result = _encode_animation(frames, durations, fmt, loop, scale, step)
+            if len(result) <= max_bytes:
+                return result
+            if len(result) < len(best):
+                best = result
+    return best
+
+
+def post_process_png(data: bytes, post_process: Callable[[Image.Image], Image.Image]) -> bytes:
+    """解码、后处理并编码为 PNG，整个过程都在 worker 中完成"""
+    return encode_png(post_process(Image.open(io.BytesIO(data))))
+
+
+def is_process_safe(fn: Callable) -> bool:
+    """fn 能否作为参数提交到进程池，局部函数与 lambda 无法被 pickle"""
+    qualname = getattr(fn, '__qualname__', '<lambda>')
+    return '<locals>' not in qualname and '<lambda>' not in qualname
+
+
+image_pool = ImageWorkerPool(config.image_pool.kind, config.image_pool.workers, config.image_pool.max_queue)
@@ -0,0 +1,4 @@
+"""
+Anisebot 性能基准
+在仓库根目录下运行，例如 python -m benchmark.dispatch
+"""
@@ -0,0 +1,109 @@
+"""
+QueryDispatchIndex 与原本逐个 check() 的线性分派的对比，两者结果一致由 tests/test_dispatch.py 检查
+
+    python -m benchmark.dispatch [--handlers 300] [--rounds 2000]
+"""
+import argparse
+import asyncio
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+# anise 是独立的工具包，直接导入可以避免加载整个 nonebot 插件
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'anise_bot' / 'plugins' / 'anise_none'))
+
+from anise.query.dispatch import QueryDispatchIndex  # noqa: E402
+
+
+class RegexHandler:
+    def __init__(self, name: str, regex: str):
+        self.name = name
+        self.regex = regex
+
+    async def check(self, text: str) -> bool:
+        return not self.regex or bool(re.search(self.regex, text))
+
+
+class ObjectHandler:
+    """模拟 wfo 等必须调用 check() 的 Handler"""
+
+    def __init__(self, name: str, names: set[str]):
+        self.name = name
+        self.names = names
+
+    async def check(self, text: str) -> bool:
+        return text in self.names
+
+
+def regex_of(handler) -> Optional[str]:
+    return handler.regex if isinstance(handler, RegexHandler) else None
+
+
+def build_handlers(count: int, seed: int = 0) -> list:
+    rnd = random.Random(seed)
+    handlers = []
+    for i in range(count):
+        kind = rnd.random()
+        if kind < 0.5:
+            handlers.append(RegexHandler(f'exact{i}', f'^(表{i}|table{i}|t{i})$'))
+        elif kind < 0.8:
+            handlers.append(RegexHandler(f'regex{i}', f'^(?:图|pic){i}(?:号)?$|关键词{i}'))
+        elif kind < 0.95:
+            handlers.append(RegexHandler(f'search{i}', f'活动{i}.*(时间|奖励)'))
+        else:
+            handlers.append(ObjectHandler(f'object{i}', {f'角色{i}', f'chara{i}'}))
+    return handlers
+
+
+def build_corpus(count: int, size: int, seed: int = 1) -> list[str]:
+    rnd = random.Random(seed)
+    templates = ['表{}', 'table{}', '图{}号', 'pic{}', '这是关键词{}吗', '活动{}的时间', '角色{}', '没有这个{}']
+    return [rnd.choice(templates).format(rnd.randrange(count)) for _ in range(size)]
+
+
+async def linear(handlers: list, text: str):
+    for handler in handlers:
+        if await handler.check(text):
+            return handler
+    return None
+
+
+async def indexed(index: QueryDispatchIndex, text: str):
+    for handler, matched in index.candidates(text):
+        if matched or await handler.check(text):
+            return handler
+    return None
+
+
+async def main(handler_count: int, rounds: int):
+    handlers = build_handlers(handler_count)
+    corpus = build_corpus(handler_count, rounds)
+
+    t = time.perf_counter()
+    index = QueryDispatchIndex(handlers, regex_of)
+    build_time = time.perf_counter() - t
+
+    t = time.perf_counter()
+    for text in corpus:
+        await linear(handlers, text)
+    linear_time = time.perf_counter() - t
+
+    t = time.perf_counter()
+    for text in corpus:
+        await indexed(index, text)
+    indexed_time = time.perf_counter() - t
+
+    print(f'handlers: {handler_count}, queries: {rounds}, index build: {build_time * 1000:.2f}ms')
+    print(f'linear : {linear_time / rounds * 1e6:9.2f}us/query')
+    print(f'indexed: {indexed_time / rounds * 1e6:9.2f}us/query ({linear_time / indexed_time:.1f}x)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--handlers', type=int, default=300)
+    parser.add_argument('--rounds', type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(main(args.handlers, args.rounds))
@@ -0,0 +1,295 @@
+"""
+meteorhouse.wiki 的本地替身，数据全部由 Fixtures 按固定种子生成
+
+    /static/worldflipper/query/config.json   Query 配置
+    /static/**.png, /static/**.gif           生成的图片
+    /api/v1/party/page/                      盘子搜索
+    /bot/update/worldflipper/...             角色、装备数据与别名
+    /card/..., /pure/..., /calendar/         供 Playwright 截图的简单页面
+
+    python -m benchmark.meteorhouse [--port 8000]
+"""
+import argparse
+import hashlib
+import io
+import json
+import random
+import threading
+import urllib.parse
+from functools import cached_property
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image, ImageDraw
+
+ELEMENTS = ['火', '水', '雷', '风', '光', '暗']
+
+
+class Fixtures:
+    def __init__(self, characters: int = 120, equipment: int = 80, filler_handlers: int = 100, seed: int = 0):
+        self.characters: int = characters
+        self.equipment: int = equipment
+        self.filler_handlers: int = filler_handlers
+        self.seed: int = seed
+
+    @staticmethod
+    def character_name(i: int) -> str:
+        return f'角色{i}号'
+
+    @staticmethod
+    def character_alias(i: int) -> str:
+        return f'{ELEMENTS[i % len(ELEMENTS)]}{i}'
+
+    @staticmethod
+    def equipment_name(i: int) -> str:
+        return f'装备{i}'
+
+    @staticmethod
+    def party_code(i: int) -> str:
+        return f'pt{i:04d}'
+
+    @cached_property
+    def character_data(self) -> dict:
+        rnd = random.Random(self.seed)
+        return {
+            str(i): {
+                'resource_id': f'chara{i:04d}',
+                'names': [self.character_name(i), f'chara{i}'],
+                'rarity': rnd.randint(1, 5),
+                'element': i % len(ELEMENTS),
+                'type': rnd.randint(0, 4),
+                'race': 'Human',
+                'gender': rnd.choice(['F', 'M']),
+                'status_data': '',
+                'leader_ability': {'name': f'队长技{i}', 'description': '提升全体攻击力' * 4},
+                'skill': {'name': f'技能{i}', 'weight': rnd.randint(50, 300), 'description': '造成伤害' * 6},
+                'abilities': ['能力描述' * 5 for _ in range(6)],
+                'cv': 'cv',
+                'description': '角色介绍' * 20,
+                'obtain': '',
+                'tags': [],
+            }
+            for i in range(self.characters)
+        }
+
+    @cached_property
+    def equipment_data(self) -> dict:
+        rnd = random.Random(self.seed + 1)
+        return {
+            str(i): {
+                'resource_id': f'item{i:04d}',
+                'names': [self.equipment_name(i)],
+                'rarity': rnd.randint(1, 5),
+                'element': i % len(ELEMENTS) - (i % 7 == 0),
+                'status_data': '',
+                'abilities': ['装备能力' * 4],
+                'description': '装备介绍' * 10,
+                'obtain': '',
+                'tags': [],
+            }
+            for i in range(self.equipment)
+        }
+
+    @cached_property
+    def character_alias_data(self) -> dict:
+        return {str(i): [self.character_alias(i)] for i in range(self.characters)}
+
+    @cached_property
+    def equipment_alias_data(self) -> dict:
+        return {str(i): [f'{ELEMENTS[i % len(ELEMENTS)]}装{i}'] for i in range(self.equipment)}
+
+    @cached_property
+    def query_config(self) -> dict:
+        query_map = [
+            {'type': 'text', 'regex': '^(帮助|help)$', 'content': '查询帮助'},
+            {'type': 'schedule', 'regex': '^(日程|日历)$'},
+        ]
+        query_map += [{'type': 'text', 'regex': f'^文本{i}$', 'content': f'文本内容{i}'} for i in range(self.filler_handlers)]
+        query_map += [{'type': 'image_server', 'regex': f'^图{i}$', 'url': f'/static/query/image{i}.png'} for i in range(20)]
+        query_map += [{'type': 'server_table', 'regex': f'^表{i}$', 'table_id': f'table{i}'} for i in range(10)]
+        query_map += [
+            {'type': 'party_refer'},
+            {'type': 'wfo', 'strict': True},
+            {'type': 'wfo', 'strict': False},
+        ]
+        return {'query_map': query_map}
+
+    def update_files(self) -> dict[str, dict]:
+        """与 UpdateManager 的下载地址一一对应"""
+        return {
+            '/bot/update/worldflipper/data/character': self.character_data,
+            '/bot/update/worldflipper/data/equipment': self.equipment_data,
+            '/bot/update/worldflipper/alias/character': self.character_alias_data,
+            '/bot/update/worldflipper/alias/equipment': self.equipment_alias_data,
+            '/static/worldflipper/query/config.json': self.query_config,
+        }
+
+    def seed_workdir(self, workdir: Path, url: str):
+        """写入 Bot 启动所需的数据与配置，启动时的更新会得到“没有变化”"""
+        files = {
+            'data/worldflipper/object/character.json': self.character_data,
+            'data/worldflipper/object/equipment.json': self.equipment_data,
+            'res/worldflipper/alias/character.json': self.character_alias_data,
+            'res/worldflipper/alias/equipment.json': self.equipment_alias_data,
+            'res/query/config.json': self.query_config,
+        }
+        for path, data in files.items():
+            (workdir / path).parent.mkdir(parents=True, exist_ok=True)
+            (workdir / path).write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+        (workdir / 'config').mkdir(parents=True, exist_ok=True)
+        (workdir / 'config' / 'config.toml').write_text(
+            '[query]\n'
+            f'config_url = "{urllib.parse.urljoin(url, "/static/worldflipper/query/config.json")}"\n'
+            'update_on_startup = true\n'
+            'warmup_after_update = false\n',
+            encoding='utf-8'
+        )
+
+    def seed_art(self, workdir: Path):
+        """写入角色的本地立绘与头像，供 Pillow 绘制的卡片使用"""
+        for i in range(self.characters):
+            resource_id = self.character_data[str(i)]['resource_id']
+            for group in ('full_resized/base', 'square212x/base'):
+                path = workdir / 'res/worldflipper/character' / group / f'{resource_id}.png'
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(self.image(f'/static/worldflipper/unit/{group}/{resource_id}.png')[0])
+
+    @staticmethod
+    def image(path: str) -> tuple[bytes, str]:
+        """按路径生成固定的图片，立绘为较大的透明 PNG，像素图为多帧 GIF"""
+        rnd = random.Random(path)
+        color = tuple(rnd.randrange(256) for _ in range(3))
+        if path.endswith('.gif'):
+            frames = []
+            for f in range(8):
+                frame = Image.new('P', (96, 96), 0)
+                frame.putpalette([255, 255, 255, *color] + [0] * 762)
+                ImageDraw.Draw(frame).ellipse((f * 4, 20, f * 4 + 40, 60), fill=1)
+                frames.append(frame)
+            buf = io.BytesIO()
+            frames[0].save(buf, format='GIF', save_all=True, append_images=frames[1:], loop=0, duration=100)
+            return buf.getvalue(), 'image/gif'
+        size = (640, 960) if '/full' in path else (256, 256)
+        img = Image.new('RGBA', size, (0, 0, 0, 0))
+        draw = ImageDraw.Draw(img)
+        for _ in range(24):
+            x, y = rnd.randrange(size[0]), rnd.randrange(size[1])
+            draw.ellipse((x, y, x + rnd.randrange(20, 200), y + rnd.randrange(20, 200)), fill=(*color, 255))
+        buf = io.BytesIO()
+        img.save(buf, format='PNG')
+        return buf.getvalue(), 'image/png'
+
+    @staticmethod
+    def card_page(title: str, rows: int = 8) -> bytes:
+        items = ''.join(f'<li>{title} 第{i}行<img src="/static/card/{title}/{i}.png" width="48"></li>' for i in range(rows))
+        return (
+            '<!DOCTYPE html><html><head><meta charset="utf-8"></head>'
+            '<body style="margin:0;background:#eee">'
+            f'<div id="main-card" class="table" style="width:480px;padding:16px;background:#fff">'
+            f'<h2>{title}</h2><ul>{items}</ul></div><div id="card-complete"></div></body></html>'
+        ).encode('utf-8')
+
+    def party_page(self, search_text: str, page_index: int) -> dict:
+        if not search_text or page_index > 3:
+            return {'parties': []}
+        rnd = random.Random(f'{search_text}/{page_index}')
+        return {
+            'parties': [
+                {
+                    'id': self.party_code(rnd.randrange(1000)),
+                    'title': f'{search_text}盘{i}',
+                    'characters': [str(rnd.randrange(self.characters)) for _ in range(6)],
+                }
+                for i in range(10)
+            ]
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "MeteorhouseStandIn"
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes = b'', content_type: str = 'application/json', headers: Optional[dict] = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        if self.headers.get('If-None-Match') == etag:
+            self._send(304, headers={'ETag': etag})
+        else:
+            self._send(200, body, headers={'ETag': etag})
+
+    def do_POST(self):
+        self.do_GET()
+
+    def do_GET(self):
+        self.server.requests += 1
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        fixtures = self.server.fixtures
+        update_files = fixtures.update_files()
+        if url.path in update_files:
+            self._send_json(update_files[url.path])
+        elif url.path.startswith('/static/') and url.path.endswith(('.png', '.gif')):
+            data, content_type = self.server.image(url.path)
+            self._send(200, data, content_type)
+        elif url.path.rstrip('/') == '/api/v1/party/page':
+            self._send_json(fixtures.party_page(query.get('search_text', ''), int(query.get('page_index', 1))))
+        elif url.path.startswith(('/card/', '/pure/', '/calendar')):
+            title = query.get('wf_id') or query.get('table_id') or query.get('id') or query.get('q') or 'calendar'
+            self._send(200, fixtures.card_page(title), 'text/html; charset=utf-8')
+        else:
+            self._send(404, b'{}')
+
+
+class MeteorhouseStandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, fixtures: Fixtures, host: str = '127.0.0.1', port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.fixtures: Fixtures = fixtures
+        self.requests: int = 0
+        self._images: dict[str, tuple[bytes, str]] = {}
+        self._images_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def image(self, path: str) -> tuple[bytes, str]:
+        with self._images_lock:
+            if path not in self._images:
+                self._images[path] = self.fixtures.image(path)
+            return self._images[path]
+
+    def start(self) -> "MeteorhouseStandIn":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+    server = MeteorhouseStandIn(Fixtures(), args.host, args.port)
+    print(f'serving on {server.url}, set ANISE_METEORHOUSE_URL={server.url}')
+    server.serve_forever()
@@ -0,0 +1,194 @@
+"""
+离线的 QueryManager 基准：在本地启动 meteorhouse 替身，把语料依次经过
+QueryManager.query 与 MessageCard.to_message_onebot11，分别统计冷缓存与热缓存下的表现
+
+    python -m benchmark.query [--corpus benchmark/corpus.txt] [--repeat 3] [--concurrency 4] [--output result.json]
+
+每次运行都使用新的临时工作目录（res/data/config），第一轮为冷缓存，之后为热缓存
+需要截图的查询依赖 Playwright 的 Chromium，未安装时会记为错误
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from benchmark.meteorhouse import Fixtures, MeteorhouseStandIn  # noqa: E402
+from benchmark.stats import percentiles  # noqa: E402
+
+try:
+    import resource
+except ModuleNotFoundError:
+    # Windows 上没有 resource 模块，不统计峰值内存
+    resource = None
+
+PARTY_PREFIX = 'pqr '
+
+
+def load_corpus(path: Path) -> list[str]:
+    lines = [x.strip() for x in path.read_text('utf-8').splitlines()]
+    return [x for x in lines if x and not x.startswith('#')]
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    # Linux 上 ru_maxrss 的单位为 KB，macOS 上为字节
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+
+class Replayer:
+    def __init__(self, query_manager, party_query_manager):
+        self.qm = query_manager
+        self.party_qm = party_query_manager
+
+    async def replay_one(self, line: str) -> tuple[float, str]:
+        from anise_bot.plugins.anise_none.utils import MessageCard
+
+        qm, text = (self.party_qm, line[len(PARTY_PREFIX):]) if line.startswith(PARTY_PREFIX) else (self.qm, line)
+        t = time.perf_counter()
+        mc = await qm.query(text)
+        outcome = 'hit'
+        if not mc:
+            mc = MessageCard(guess=qm.suggest(text))
+            outcome = 'miss'
+        msg = await mc.to_message_onebot11(start_time=time.time())
+        if mc.image_handler and not any(seg.type == 'image' for seg in msg):
+            outcome = 'no_image'
+        return time.perf_counter() - t, outcome
+
+    async def run_pass(self, name: str, corpus: list[str], concurrency: int) -> dict:
+        latencies: list[float] = []
+        by_outcome: dict[str, list[float]] = {}
+        errors: Counter = Counter()
+        queue: asyncio.Queue[str] = asyncio.Queue()
+        for line in corpus:
+            queue.put_nowait(line)
+
+        async def worker():
+            while not queue.empty():
+                line = queue.get_nowait()
+                t = time.perf_counter()
+                try:
+                    cost, outcome = await self.replay_one(line)
+                except Exception as e:
+                    cost, outcome = time.perf_counter() - t, 'error'
+                    errors[f'{line}: {e.__class__.__name__}: {str(e).splitlines()[0] if str(e) else ""}'] += 1
+                latencies.append(cost)
+                by_outcome.setdefault(outcome, []).append(cost)
+
+        t = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        total = time.perf_counter() - t
+        p50, p95, p99 = percentiles(latencies, (50, 95, 99))
+        return {
+            'pass': name,
+            'queries': len(latencies),
+            'seconds': total,
+            'throughput': len(latencies) / total if total else 0.0,
+            'p50_ms': p50 * 1000,
+            'p95_ms': p95 * 1000,
+            'p99_ms': p99 * 1000,
+            'max_ms': max(latencies, default=0.0) * 1000,
+            'peak_rss_mb': peak_rss_mb(),
+            'outcomes': {
+                k: {'count': len(v), 'p50_ms': percentiles(v, (50,))[0] * 1000} for k, v in sorted(by_outcome.items())
+            },
+            'errors': dict(errors.most_common(5)),
+        }
+
+
+def print_result(result: dict):
+    print(
+        f'[{result["pass"]:>4}] {result["queries"]} queries in {result["seconds"]:.2f}s '
+        f'({result["throughput"]:.1f}/s)  '
+        f'p50 {result["p50_ms"]:.1f}ms  p95 {result["p95_ms"]:.1f}ms  p99 {result["p99_ms"]:.1f}ms  '
+        f'max {result["max_ms"]:.1f}ms' +
+        (f'  peak RSS {result["peak_rss_mb"]:.1f}MB' if result['peak_rss_mb'] is not None else '')
+    )
+    print('       ' + ', '.join(f'{k} x{v["count"]} (p50 {v["p50_ms"]:.1f}ms)' for k, v in result['outcomes'].items()))
+    for error, count in result['errors'].items():
+        print(f'       error x{count}: {error}')
+
+
+def main(args) -> list[dict]:
+    fixtures = Fixtures(args.characters, args.equipment, args.filler_handlers)
+    server = MeteorhouseStandIn(fixtures).start()
+    os.environ['ANISE_METEORHOUSE_URL'] = server.url
+    os.environ['ANISE_CALENDAR_URL'] = f'{server.url}/calendar/'
+
+    corpus = load_corpus(Path(args.corpus))
+    workdir = Path(tempfile.mkdtemp(prefix='anise-bench-'))
+    fixtures.seed_workdir(workdir, server.url)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    results = []
+    try:
+        import nonebot
+        nonebot.init(driver='~none', log_level=args.log_level)
+        t = time.perf_counter()
+        nonebot.load_plugin('anise_bot.plugins.anise_none')
+        from anise_bot.plugins.anise_none.plugins.query.query import get_query
+        from anise_bot.plugins.anise_none.startup import startup
+        from anise_bot.plugins.anise_none.plugins.query.handler import PQR_QM
+        from anise_bot.plugins.anise_none.anise.http import http_clients
+        from anise_bot.plugins.anise_none.utils import playw
+
+        async def run():
+            # none 驱动不会触发 on_startup，这里手动执行初始化
+            await startup.start()
+            qm = await get_query()
+            phases = ', '.join(f'{k} {v:.2f}s' for k, v in startup.timings.items())
+            print(f'startup {time.perf_counter() - t:.2f}s ({phases})')
+            print(
+                f'{len(qm.query_handlers)} handlers, '
+                f'corpus {len(corpus)} lines x {args.repeat}, concurrency {args.concurrency}, stand-in {server.url}'
+            )
+            replayer = Replayer(qm, PQR_QM)
+            for i in range(args.repeat):
+                result = await replayer.run_pass('cold' if i == 0 else 'warm', corpus, args.concurrency)
+                print_result(result)
+                results.append(result)
+            await playw.del_browser()
+            await http_clients.close()
+
+        asyncio.get_event_loop().run_until_complete(run())
+        print(f'stand-in requests: {server.requests}')
+    except Exception:
+        traceback.print_exc()
+    finally:
+        os.chdir(cwd)
+        server.stop()
+        if args.keep:
+            print(f'workdir kept at {workdir}')
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding='utf-8')
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', default=str(Path(__file__).parent / 'corpus.txt'))
+    parser.add_argument('--repeat', type=int, default=3, help='回放语料的轮数，第一轮为冷缓存')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--characters', type=int, default=120)
+    parser.add_argument('--equipment', type=int, default=80)
+    parser.add_argument('--filler-handlers', type=int, default=100)
+    parser.add_argument('--output', default='', help='把结果写入 JSON 文件，便于对比不同的改动')
+    parser.add_argument('--keep', action='store_true', help='保留临时工作目录')
+    parser.add_argument('--log-level', default='WARNING')
+    main(parser.parse_args())
@@ -0,0 +1,10 @@
+import math
+from typing import Iterable, Sequence
+
+
+def percentiles(values: Sequence[float], ps: Iterable[float]) -> list[float]:
+    """最近秩法的百分位数，values 为空时返回 0"""
+    ordered = sorted(values)
+    if not ordered:
+        return [0.0 for _ in ps]
+    return [ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))] for p in ps]
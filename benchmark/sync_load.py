@@ -0,0 +1,108 @@
+"""
+同步服务器的压力测试：模拟 N 个 Bot 同时收到同一批群消息
+
+    python -m benchmark.sync_load [--bots 5] [--messages 2000] [--groups 50] [--uri ws://127.0.0.1:8765]
+
+不指定 --uri 时在进程内启动 sync_server.SyncServer
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import Optional
+
+import websockets
+
+from sync_server import SyncServer
+from .stats import percentiles
+
+
+class LoadBot:
+    """与 MessageSync 相同的协议与 request_id 匹配方式"""
+
+    def __init__(self, bot_id: str):
+        self.bot_id: str = bot_id
+        self.ws = None
+        self.pending: dict[str, asyncio.Future] = {}
+        self._reader: Optional[asyncio.Task] = None
+
+    async def connect(self, uri: str):
+        self.ws = await websockets.connect(uri)
+        self._reader = asyncio.create_task(self._read_loop())
+
+    async def _read_loop(self):
+        async for raw in self.ws:
+            msg = json.loads(raw)
+            future = self.pending.pop(msg['package']['request_id'], None)
+            if future and not future.done():
+                future.set_result(msg['send'])
+
+    async def check(self, group_id: int, user_id: str, message_id: int, card_hash: str) -> tuple[bool, float]:
+        request_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        t = time.perf_counter()
+        await self.ws.send(json.dumps({
+            'user_id': user_id, 'bot_id': self.bot_id, 'message_id': str(message_id),
+            'group_id': group_id, 'card_hash': card_hash, 'request_id': request_id,
+        }))
+        send = await future
+        return send, time.perf_counter() - t
+
+    async def close(self):
+        await self.ws.close()
+        await asyncio.gather(self._reader, return_exceptions=True)
+
+
+async def main(uri: Optional[str], bots: int, messages: int, groups: int, jitter: float):
+    server = None
+    if not uri:
+        server = await SyncServer(window=60.0).serve('127.0.0.1', 0)
+        port = next(iter(server.sockets)).getsockname()[1]
+        uri = f'ws://127.0.0.1:{port}'
+
+    load_bots = [LoadBot(f'bench-{i}') for i in range(bots)]
+    await asyncio.gather(*[b.connect(uri) for b in load_bots])
+    rnd = random.Random(0)
+
+    async def deliver(bot: LoadBot, i: int, user_id: str, card_hash: str):
+        # 不同 Bot 收到同一条消息的时间略有差异
+        await asyncio.sleep(rnd.random() * jitter)
+        return await bot.check(i % groups, user_id, i, card_hash)
+
+    latencies = []
+    violations = 0
+    t = time.perf_counter()
+    for start in range(0, messages, 100):
+        batch = range(start, min(start + 100, messages))
+        senders = {i: (str(rnd.randrange(1000)), uuid.uuid4().hex) for i in batch}
+        results = await asyncio.gather(*[deliver(b, i, *senders[i]) for i in batch for b in load_bots])
+        for j, i in enumerate(batch):
+            decisions = results[j * bots:(j + 1) * bots]
+            latencies.extend(cost for _, cost in decisions)
+            violations += sum(send for send, _ in decisions) != 1
+    total = time.perf_counter() - t
+
+    await asyncio.gather(*[b.close() for b in load_bots])
+    if server:
+        server.close()
+        await server.wait_closed()
+
+    p50, p95, p99 = percentiles(latencies, (50, 95, 99))
+    print(f'bots: {bots}, messages: {messages}, groups: {groups}, uri: {uri}')
+    print(f'decisions: {len(latencies)} in {total:.2f}s ({len(latencies) / total:.0f}/s)')
+    print(f'latency p50 {p50 * 1000:.2f}ms, p95 {p95 * 1000:.2f}ms, p99 {p99 * 1000:.2f}ms')
+    print(f'messages without exactly one sender: {violations}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--uri', default='')
+    parser.add_argument('--bots', type=int, default=5)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--groups', type=int, default=50)
+    parser.add_argument('--jitter', type=float, default=0.005, help='不同 Bot 收到同一消息的最大时间差（秒）')
+    args = parser.parse_args()
+    asyncio.run(main(args.uri, args.bots, args.messages, args.groups, args.jitter))
@@ -0,0 +1,117 @@
+"""
+wikicard 两种渲染方式的对比：Playwright 截图 /card/ 页面与 Pillow 直接绘制
+
+    python -m benchmark.wikicard [--objects 40] [--concurrency 4] [--renderer pillow screenshot]
+
+每个对象都跳过缓存直接渲染，统计单张耗时与吞吐
+截图方式依赖 Playwright 的 Chromium，未安装时会记为错误
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from benchmark.meteorhouse import Fixtures, MeteorhouseStandIn  # noqa: E402
+from benchmark.stats import percentiles  # noqa: E402
+
+
+async def run_renderer(renderer: str, objects: list, concurrency: int) -> dict:
+    from anise_bot.plugins.anise_none.plugins.query.query import QueryHandlerWorldflipperObject
+
+    latencies: list[float] = []
+    sizes: list[int] = []
+    errors: dict[str, int] = {}
+    queue: asyncio.Queue = asyncio.Queue()
+    for obj in objects:
+        queue.put_nowait(obj)
+
+    async def worker():
+        while not queue.empty():
+            obj = queue.get_nowait()
+            ih = QueryHandlerWorldflipperObject.wikicard_handler(obj, renderer)
+            t = time.perf_counter()
+            try:
+                data = await ih.fetch()
+                sizes.append(len(data.content) if data else 0)
+            except Exception as e:
+                key = f'{e.__class__.__name__}: {str(e).splitlines()[0] if str(e) else ""}'
+                errors[key] = errors.get(key, 0) + 1
+                continue
+            latencies.append(time.perf_counter() - t)
+
+    t = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    total = time.perf_counter() - t
+    p50, p95, p99 = percentiles(latencies, (50, 95, 99))
+    return {
+        'renderer': renderer,
+        'rendered': len(latencies),
+        'errors': errors,
+        'seconds': total,
+        'throughput': len(latencies) / total if total else 0.0,
+        'p50_ms': p50 * 1000,
+        'p95_ms': p95 * 1000,
+        'p99_ms': p99 * 1000,
+        'avg_kb': sum(sizes) / len(sizes) / 1024 if sizes else 0.0,
+    }
+
+
+def main(args):
+    fixtures = Fixtures(args.objects, args.objects // 2, 0)
+    server = MeteorhouseStandIn(fixtures).start()
+    os.environ['ANISE_METEORHOUSE_URL'] = server.url
+    os.environ['ANISE_CALENDAR_URL'] = f'{server.url}/calendar/'
+    workdir = Path(tempfile.mkdtemp(prefix='anise-wikicard-'))
+    fixtures.seed_workdir(workdir, server.url)
+    fixtures.seed_art(workdir)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import nonebot
+        nonebot.init(driver='~none', log_level=args.log_level)
+        nonebot.load_plugin('anise_bot.plugins.anise_none')
+        from anise_bot.plugins.anise_none.anise.http import http_clients
+        from anise_bot.plugins.anise_none.anise.manager import manager
+        from anise_bot.plugins.anise_none.models.worldflipper import Character, Equipment
+        from anise_bot.plugins.anise_none.startup import startup
+        from anise_bot.plugins.anise_none.utils import playw
+
+        async def run():
+            await startup.start()
+            objects = [*manager.dict_of(Character).values(), *manager.dict_of(Equipment).values()]
+            print(f'{len(objects)} objects, concurrency {args.concurrency}')
+            for renderer in args.renderer:
+                r = await run_renderer(renderer, objects, args.concurrency)
+                print(
+                    f'[{r["renderer"]:>10}] {r["rendered"]} cards in {r["seconds"]:.2f}s ({r["throughput"]:.1f}/s)  '
+                    f'p50 {r["p50_ms"]:.1f}ms  p95 {r["p95_ms"]:.1f}ms  p99 {r["p99_ms"]:.1f}ms  avg {r["avg_kb"]:.0f}KB'
+                )
+                for error, count in r['errors'].items():
+                    print(f'             error x{count}: {error}')
+            await playw.del_browser()
+            await http_clients.close()
+
+        asyncio.get_event_loop().run_until_complete(run())
+    except Exception:
+        traceback.print_exc()
+    finally:
+        os.chdir(cwd)
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--objects', type=int, default=40, help='角色数量，装备为其一半')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--renderer', nargs='+', default=['pillow', 'screenshot'])
+    parser.add_argument('--log-level', default='WARNING')
+    main(parser.parse_args())
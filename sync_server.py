@@ -0,0 +1,98 @@
+"""
+多 Bot 回复去重的参考同步服务器
+
+实现 MessageSync 使用的协议：
+    请求 {"user_id", "bot_id", "message_id", "group_id", "card_hash", "request_id"}
+    回复 {"package": <原请求>, "send": bool}
+
+同一群内同一用户触发的同一张卡片，在 window 秒内只有第一个提出请求的 Bot 会得到 send=true，
+同一个 Bot 重复请求会得到同样的结果，私聊消息总是放行
+
+    python sync_server.py [--host 127.0.0.1] [--port 8765] [--window 10]
+
+然后在 config/config.toml 中设置 sync_uri = "ws://127.0.0.1:8765"
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import Optional
+
+import websockets
+
+logger = logging.getLogger('sync_server')
+
+
+class SyncServer:
+    def __init__(self, window: float = 10.0):
+        self.window: float = window
+        self.claims: dict[tuple, tuple[str, float]] = {}
+        self.decisions: int = 0
+        self.connections: int = 0
+        self._cleaner: Optional[asyncio.Task] = None
+
+    def decide(self, package: dict) -> bool:
+        self.decisions += 1
+        group_id = package.get('group_id')
+        if group_id is None:
+            return True
+        bot_id = str(package.get('bot_id'))
+        now = time.monotonic()
+        key = (group_id, str(package.get('user_id')), package.get('card_hash'))
+        claim = self.claims.get(key)
+        if claim is None or claim[1] < now:
+            self.claims[key] = (bot_id, now + self.window)
+            return True
+        return claim[0] == bot_id
+
+    def expire(self):
+        now = time.monotonic()
+        for key in [k for k, (_, expire_at) in self.claims.items() if expire_at < now]:
+            del self.claims[key]
+
+    async def _clean_loop(self):
+        while True:
+            await asyncio.sleep(self.window)
+            self.expire()
+
+    async def handle(self, ws):
+        self.connections += 1
+        logger.info(f'bot connected from {ws.remote_address}')
+        try:
+            async for raw in ws:
+                try:
+                    package = json.loads(raw)
+                    send = self.decide(package)
+                except (ValueError, AttributeError):
+                    logger.warning(f'bad package: {raw!r}')
+                    continue
+                await ws.send(json.dumps({'package': package, 'send': send}))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.connections -= 1
+            logger.info(f'bot disconnected from {ws.remote_address}')
+
+    async def serve(self, host: str, port: int):
+        """启动服务器，返回 websockets 的 Server 对象"""
+        if self._cleaner is None:
+            self._cleaner = asyncio.create_task(self._clean_loop())
+        return await websockets.serve(self.handle, host, port)
+
+
+async def main(host: str, port: int, window: float):
+    server = SyncServer(window)
+    await server.serve(host, port)
+    logger.info(f'sync server listening on ws://{host}:{port}, window {window}s')
+    await asyncio.Future()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--window', type=float, default=10.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    asyncio.run(main(args.host, args.port, args.window))
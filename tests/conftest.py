@@ -0,0 +1,4 @@
+import nonebot
+
+# 插件包在导入时就会用到 nonebot 的驱动与配置
+nonebot.init(driver='~none')
@@ -0,0 +1,159 @@
+import asyncio
+
+import pytest
+
+from anise_bot.plugins.anise_none.anise.config import AdmissionConfig
+from anise_bot.plugins.anise_none.utils.admission import AdmissionController, FairQueue, Rejected, TokenBucket
+
+
+def _elapse(bucket: TokenBucket, seconds: float):
+    bucket.updated -= seconds
+
+
+def test_token_bucket_refill():
+    bucket = TokenBucket(rate=0.5, burst=2)
+    for _ in range(2):
+        assert bucket.allow()
+        bucket.take()
+    assert not bucket.allow()
+    _elapse(bucket, 1)
+    assert not bucket.allow()
+    _elapse(bucket, 1)
+    assert bucket.allow()
+    # 恢复不会超过上限
+    _elapse(bucket, 100)
+    assert bucket.allow() and bucket.tokens == 2
+    assert bucket.idle()
+
+
+def test_token_bucket_allow_does_not_consume():
+    bucket = TokenBucket(rate=0, burst=1)
+    assert all(bucket.allow() for _ in range(5))
+    bucket.take()
+    assert not bucket.allow()
+
+
+def test_fair_queue_round_robin():
+    async def main():
+        queue = FairQueue(1)
+        order = []
+
+        async def run(key: str, n: int):
+            await queue.acquire(key)
+            order.append((key, n))
+            await asyncio.sleep(0)
+            queue.release()
+
+        await queue.acquire('holder')
+        tasks = [asyncio.create_task(run('a', i)) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(run('b', i)) for i in range(2)]
+        tasks.append(asyncio.create_task(run('c', 0)))
+        await asyncio.sleep(0)
+        assert queue.queued == 6 and queue.queued_keys == 3
+        queue.release()
+        await asyncio.gather(*tasks)
+        # 群 a 先排了三个，也只能与 b、c 交替执行
+        assert order == [('a', 0), ('b', 0), ('c', 0), ('a', 1), ('b', 1), ('a', 2)]
+        assert queue.active == 0 and queue.queued == 0
+
+    asyncio.run(main())
+
+
+def test_fair_queue_cancel():
+    async def main():
+        queue = FairQueue(1)
+        await queue.acquire('holder')
+        waiting = asyncio.create_task(queue.acquire('a'))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert queue.queued == 0 and queue.queued_keys == 0
+
+        # 槽位已经转交、调用方还没被唤醒时取消，槽位交给下一个
+        first = asyncio.create_task(queue.acquire('a'))
+        second = asyncio.create_task(queue.acquire('b'))
+        await asyncio.sleep(0)
+        queue.release()
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        await asyncio.wait_for(second, 1)
+        assert queue.active == 1
+        queue.release()
+        assert queue.active == 0
+
+    asyncio.run(main())
+
+
+def _controller(**kwargs) -> AdmissionController:
+    return AdmissionController(AdmissionConfig.parse_obj({'enabled': True, **kwargs}))
+
+
+def test_rate_limit():
+    async def main():
+        controller = _controller(group_rate=0.001, group_burst=3, user_rate=0.001, user_burst=2)
+        for _ in range(2):
+            async with controller.admit(1, 'u1'):
+                pass
+        with pytest.raises(Rejected) as e:
+            async with controller.admit(1, 'u1'):
+                pass
+        assert e.value.reason == 'rate_limited' and not e.value.silent
+        # 连续超出频率时只提示一次
+        with pytest.raises(Rejected) as e:
+            async with controller.admit(1, 'u1'):
+                pass
+        assert e.value.silent
+        # 被用户限流拒绝的查询不占用群的额度
+        async with controller.admit(1, 'u2'):
+            pass
+        with pytest.raises(Rejected):
+            async with controller.admit(1, 'u3'):
+                pass
+        # 私聊只按用户限流
+        async with controller.admit(None, 'u3'):
+            pass
+
+    asyncio.run(main())
+
+
+def test_overloaded():
+    async def main():
+        controller = _controller(max_concurrent=1, max_queue=1, queue_timeout=0.05, group_rate=0, user_rate=0)
+        release = asyncio.Event()
+
+        async def hold(group_id: int):
+            async with controller.admit(group_id, 'u'):
+                await release.wait()
+
+        holder = asyncio.create_task(hold(1))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(hold(2))
+        await asyncio.sleep(0)
+        # 队列已满时立即拒绝
+        with pytest.raises(Rejected) as e:
+            async with controller.admit(3, 'u'):
+                pass
+        assert e.value.reason == 'overloaded'
+        # 排队超过 queue_timeout 后拒绝，并让出队列位置
+        with pytest.raises(Rejected):
+            await queued
+        assert controller.queue.queued == 0
+        release.set()
+        await holder
+        assert controller.stats()['active'] == 0
+
+    asyncio.run(main())
+
+
+def test_disabled():
+    async def main():
+        controller = AdmissionController(AdmissionConfig.parse_obj({'group_rate': 0.001, 'group_burst': 1}))
+        for _ in range(5):
+            async with controller.admit(1, 'u'):
+                pass
+        assert controller.stats()['active'] == 0
+
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+import asyncio
+import random
+import re
+from typing import Optional
+
+from anise_bot.plugins.anise_none.anise.query.dispatch import QueryDispatchIndex
+
+
+class RegexHandler:
+    def __init__(self, name: str, regex: str):
+        self.name = name
+        self.regex = regex
+
+    async def check(self, text: str) -> bool:
+        return not self.regex or bool(re.search(self.regex, text))
+
+
+class ObjectHandler:
+    """必须调用 check() 的 Handler"""
+
+    def __init__(self, name: str, names: set[str]):
+        self.name = name
+        self.names = names
+
+    async def check(self, text: str) -> bool:
+        return text in self.names
+
+
+def regex_of(handler) -> Optional[str]:
+    return handler.regex if isinstance(handler, RegexHandler) else None
+
+
+def build_handlers(count: int, seed: int = 0) -> list:
+    rnd = random.Random(seed)
+    handlers = []
+    for i in range(count):
+        kind = rnd.random()
+        if kind < 0.4:
+            handlers.append(RegexHandler(f'exact{i}', f'^(表{i}|table{i}|t{i})$'))
+        elif kind < 0.65:
+            handlers.append(RegexHandler(f'regex{i}', f'^(?:图|pic){i}(?:号)?$|关键词{i}'))
+        elif kind < 0.8:
+            handlers.append(RegexHandler(f'search{i}', f'活动{i}.*(时间|奖励)'))
+        elif kind < 0.85:
+            # 反向引用与组名不能合并，单独匹配
+            handlers.append(RegexHandler(f'backref{i}', f'(重复{i})\\1'))
+        elif kind < 0.9:
+            handlers.append(RegexHandler(f'named{i}', f'(?P<n>编号{i})$'))
+        else:
+            handlers.append(ObjectHandler(f'object{i}', {f'角色{i}', f'chara{i}', f'表{i}'}))
+    return handlers
+
+
+def build_corpus(count: int, size: int, seed: int = 1) -> list[str]:
+    rnd = random.Random(seed)
+    templates = [
+        '表{}', 'table{}', 't{}', '图{}号', 'pic{}', '这是关键词{}吗', '活动{}的时间', '重复{0}重复{0}',
+        '编号{}', '角色{}', 'chara{}', '没有这个{}',
+    ]
+    return [rnd.choice(templates).format(rnd.randrange(count)) for _ in range(size)]
+
+
+async def linear(handlers: list, text: str) -> list:
+    return [handler for handler in handlers if await handler.check(text)]
+
+
+async def indexed(index: QueryDispatchIndex, text: str) -> list:
+    return [handler for handler, matched in index.candidates(text) if matched or await handler.check(text)]
+
+
+def _assert_equivalent(handlers: list, corpus: list[str]):
+    async def main():
+        index = QueryDispatchIndex(handlers, regex_of)
+        for text in corpus:
+            # 不只是第一个命中项，前面的 Handler 没有生成消息时依次尝试的顺序也要一致
+            assert await indexed(index, text) == await linear(handlers, text), text
+
+    asyncio.run(main())
+
+
+def test_matches_linear_dispatch():
+    handlers = build_handlers(300)
+    _assert_equivalent(handlers, build_corpus(300, 3000))
+
+
+def test_catch_all_and_declaration_order():
+    handlers = [
+        RegexHandler('exact', '^(qr|查询)$'),
+        ObjectHandler('object', {'qr', '角色'}),
+        RegexHandler('search', 'qr'),
+        RegexHandler('all', ''),
+        RegexHandler('after', '^角色$'),
+    ]
+    _assert_equivalent(handlers, ['qr', '查询', '角色', 'xqrx', '', '无关'])
+    index = QueryDispatchIndex(handlers, regex_of)
+    assert index.first_static('无关') == 3
+    assert index.first_static('查询') == 0
@@ -0,0 +1,58 @@
+import random
+
+from fuzzywuzzy import process
+
+from anise_bot.plugins.anise_none.anise.query.fuzzy import FuzzyIndex
+
+CHARS = ''.join(chr(c) for c in range(0x4e00, 0x4e00 + 400))
+
+
+def build_keys(count: int, seed: int, latin: bool = True) -> list[str]:
+    rnd = random.Random(seed)
+    keys = {''.join(rnd.choice(CHARS) for _ in range(rnd.randint(2, 6))) for _ in range(count)}
+    if latin:
+        keys.update(f'chara{i}' for i in range(count // 8))
+    return sorted(keys)
+
+
+def typo_of(key: str, rnd: random.Random) -> str:
+    """删去末尾一个字、替换一个字或多打一个字"""
+    op = rnd.random()
+    if op < 0.3 and len(key) > 2:
+        return key[:-1]
+    if op < 0.6:
+        i = rnd.randrange(len(key))
+        return key[:i] + rnd.choice(CHARS) + key[i + 1:]
+    return key + rnd.choice(CHARS)
+
+
+def test_candidate_recall():
+    # chara1x 这类只差一个字符的别名之间本来就无法区分，召回只检查中文别名
+    keys = build_keys(3000, seed=0, latin=False)
+    index = FuzzyIndex(keys)
+    rnd = random.Random(1)
+    for _ in range(500):
+        key = rnd.choice(keys)
+        if len(key) < 3:
+            continue
+        query = typo_of(key, rnd)
+        assert key in index.candidates(query), (key, query)
+
+
+def test_matches_full_scan():
+    keys = build_keys(600, seed=2)
+    index = FuzzyIndex(keys)
+    rnd = random.Random(3)
+    for _ in range(40):
+        query = typo_of(rnd.choice(keys), rnd)
+        # 候选之外的别名不会比召回的最佳候选得分更高
+        assert index.extract_one(query)[1] == process.extractOne(query, keys)[1], query
+
+
+def test_exact_and_unrelated():
+    keys = build_keys(300, seed=4)
+    index = FuzzyIndex(keys)
+    for key in keys[:50]:
+        assert index.extract_one(key) == (key, 100)
+    assert index.extract_one('～～') == ('', 0)
+    assert index.extract('～～') == []
@@ -0,0 +1,56 @@
+import json
+
+from anise_bot.plugins.anise_none.anise.manager import ManagerBase
+from anise_bot.plugins.anise_none.anise.snapshot import load_snapshot, source_stats, write_snapshot
+from anise_bot.plugins.anise_none.models.worldflipper import Character, Equipment, load_from_json
+
+CHARACTERS = {
+    '1': {
+        'resource_id': 'chara0001', 'names': ['角色1', 'chara1'], 'rarity': 5, 'element': 0, 'type': 1,
+        'race': 'Human', 'gender': 'F', 'status_data': '',
+        'leader_ability': {'name': '队长技', 'description': '提升全体攻击力'},
+        'skill': {'name': '技能', 'weight': 120, 'description': '造成伤害'},
+        'abilities': ['能力1', '能力2'], 'cv': 'cv', 'description': '角色介绍', 'obtain': '', 'tags': ['限定'],
+        'server': 'jp',
+    },
+    '2': {
+        'resource_id': 'chara0002', 'names': ['角色2'], 'rarity': 3, 'element': 5, 'type': 4,
+        'race': 'Beast', 'gender': 'M', 'status_data': '',
+        'leader_ability': {'name': '队长技', 'description': ''},
+        'skill': {'name': '技能', 'weight': 80, 'description': ''},
+        'abilities': [], 'cv': '', 'description': '', 'obtain': '常驻', 'tags': [],
+    },
+}
+EQUIPMENT = {
+    '1': {
+        'resource_id': 'item0001', 'names': ['装备1'], 'rarity': 4, 'element': -1, 'status_data': '',
+        'abilities': ['装备能力'], 'description': '装备介绍', 'obtain': '', 'tags': [],
+    },
+}
+
+
+def test_snapshot_matches_json(tmp_path):
+    sources = {Character: tmp_path / 'character.json', Equipment: tmp_path / 'equipment.json'}
+    sources[Character].write_text(json.dumps(CHARACTERS, ensure_ascii=False), 'utf-8')
+    sources[Equipment].write_text(json.dumps(EQUIPMENT, ensure_ascii=False), 'utf-8')
+    stats = source_stats(sources)
+
+    from_json = ManagerBase()
+    for type_, path in sources.items():
+        load_from_json(path, type_, from_json)
+    write_snapshot(tmp_path / 'snapshot.bin', {t: from_json.dict_of(t) for t in sources}, stats)
+    from_snapshot = load_snapshot(tmp_path / 'snapshot.bin', list(sources), stats)
+    assert from_snapshot is not None
+    # 有默认值的冷字段在其他冷字段之前访问，同样要读取快照
+    assert from_snapshot[Character]['1'].server == 'jp'
+
+    for type_ in sources:
+        expected = from_json.dict_of(type_)
+        assert set(from_snapshot[type_]) == set(expected)
+        for id_, obj in from_snapshot[type_].items():
+            # 逐个字段访问，冷字段在第一次访问时才从快照读取
+            for name in type_.__fields__:
+                assert getattr(obj, name) == getattr(expected[id_], name), f'{type_.__name__}({id_}).{name}'
+            assert obj == expected[id_]
+
+    assert from_snapshot[Character]['2'].server is None
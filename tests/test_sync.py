@@ -0,0 +1,152 @@
+import asyncio
+import json
+import socket
+import time
+from types import SimpleNamespace
+
+import websockets
+from nonebot.adapters.onebot.v11 import GroupMessageEvent, PrivateMessageEvent
+
+from anise_bot.plugins.anise_none.plugins.query.sync import MessageSync
+from anise_bot.plugins.anise_none.utils import MessageCard
+from sync_server import SyncServer
+
+
+def _event(message_id: int, user_id: int = 10, group_id: int = 100):
+    data = {
+        'time': 0, 'self_id': 1, 'post_type': 'message', 'sub_type': 'normal', 'user_id': user_id,
+        'message_id': message_id, 'message': [{'type': 'text', 'data': {'text': 'qr 角色1'}}],
+        'raw_message': 'qr 角色1', 'font': 0, 'sender': {'user_id': user_id}, 'to_me': False,
+    }
+    if group_id is None:
+        return PrivateMessageEvent.parse_obj({**data, 'message_type': 'private', 'sub_type': 'friend'})
+    return GroupMessageEvent.parse_obj({**data, 'message_type': 'group', 'group_id': group_id})
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def _serve(handler) -> tuple:
+    server = await websockets.serve(handler, '127.0.0.1', 0)
+    return server, f'ws://127.0.0.1:{server.sockets[0].getsockname()[1]}'
+
+
+def test_claim_window():
+    async def main():
+        sync_server = SyncServer(window=0.3)
+        server = await sync_server.serve('127.0.0.1', 0)
+        uri = f'ws://127.0.0.1:{server.sockets[0].getsockname()[1]}'
+        bot_a, bot_b = SimpleNamespace(self_id='a'), SimpleNamespace(self_id='b')
+        client_a, client_b = MessageSync(uri), MessageSync(uri)
+        card = MessageCard(text='角色1')
+        try:
+            assert await client_a.check(bot_a, _event(1), card)
+            assert not await client_b.check(bot_b, _event(1), card)
+            # 同一个 Bot 重复请求得到同样的结果，其他用户与其他卡片不受影响
+            assert await client_a.check(bot_a, _event(2), card)
+            assert await client_b.check(bot_b, _event(3, user_id=11), card)
+            assert await client_b.check(bot_b, _event(4), MessageCard(text='角色2'))
+            # 私聊总是放行
+            assert await client_a.check(bot_a, _event(5, group_id=None), card)
+            assert await client_b.check(bot_b, _event(5, group_id=None), card)
+            # 超过 window 后由下一个请求的 Bot 认领
+            await asyncio.sleep(0.4)
+            assert await client_b.check(bot_b, _event(6), card)
+            assert not await client_a.check(bot_a, _event(6), card)
+        finally:
+            await client_a.close()
+            await client_b.close()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(main())
+
+
+def test_reconnect_backoff():
+    async def main():
+        port = _free_port()
+        client = MessageSync(f'ws://127.0.0.1:{port}', backoff_max=4.0)
+        assert not await client.connect()
+        assert client._backoff == 1.0
+        # 退避期间不再尝试连接
+        retry_time = client._retry_time
+        assert not await client.connect()
+        assert client._retry_time == retry_time
+        for expected in (2.0, 4.0, 4.0):
+            client._retry_time = 0.0
+            assert not await client.connect()
+            assert client._backoff == expected
+            assert client._retry_time > time.time()
+
+        server = await SyncServer().serve('127.0.0.1', port)
+        try:
+            client._retry_time = 0.0
+            assert await client.connect()
+            assert client.connected and client._backoff == 0.0
+        finally:
+            await client.close()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(main())
+
+
+def test_fail_open():
+    async def main():
+        bot, card = SimpleNamespace(self_id='a'), MessageCard(text='角色1')
+
+        # 连接不上
+        client = MessageSync(f'ws://127.0.0.1:{_free_port()}')
+        assert await client.check(bot, _event(1), card)
+
+        # 服务端不回复
+        async def silent(ws):
+            async for _ in ws:
+                pass
+
+        server, uri = await _serve(silent)
+        client = MessageSync(uri, timeout=0.2)
+        try:
+            assert await client.check(bot, _event(1), card)
+            assert not client.pending
+        finally:
+            await client.close()
+            server.close()
+            await server.wait_closed()
+
+        # 请求途中断开连接，等待中的检查全部放行
+        async def drop(ws):
+            await ws.recv()
+            await ws.close()
+
+        server, uri = await _serve(drop)
+        client = MessageSync(uri, timeout=5.0)
+        try:
+            started = time.monotonic()
+            assert await client.check(bot, _event(1), card)
+            assert time.monotonic() - started < 5.0
+            assert not client.connected
+        finally:
+            await client.close()
+            server.close()
+            await server.wait_closed()
+
+        # 无法解析的回复被忽略，不影响之后的请求
+        async def garbage(ws):
+            async for raw in ws:
+                await ws.send('not json')
+                await ws.send(json.dumps({'package': json.loads(raw), 'send': False}))
+
+        server, uri = await _serve(garbage)
+        client = MessageSync(uri)
+        try:
+            assert not await client.check(bot, _event(1), card)
+        finally:
+            await client.close()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(main())